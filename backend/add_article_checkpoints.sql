@@ -0,0 +1,38 @@
+-- 記事生成ステージのチェックポイントを保存するテーブル
+-- SupabaseダッシュボードのSQL Editorで実行してください
+-- 後段のステージで失敗した記事を POST /api/articles/{article_id}/resume で再開すると、
+-- 成功済みのステージ（SERP取得・タイトル・本文など）の出力をここから復元して続きから実行する
+
+CREATE TABLE IF NOT EXISTS article_checkpoints (
+    article_id UUID NOT NULL REFERENCES articles(id) ON DELETE CASCADE,
+    input_hash VARCHAR(64) NOT NULL,  -- 記事の入力データのSHA-256（入力が変わったら別のチェックポイント）
+    stage VARCHAR(64) NOT NULL,       -- ステージ名（__input__ は入力データそのもの）
+    output JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (article_id, input_hash, stage)
+);
+
+-- インデックス作成
+CREATE INDEX IF NOT EXISTS idx_article_checkpoints_updated_at ON article_checkpoints(updated_at DESC);
+
+-- updated_atを自動更新するトリガー
+CREATE TRIGGER update_article_checkpoints_updated_at BEFORE UPDATE ON article_checkpoints
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Row Level Security (RLS) の設定
+ALTER TABLE article_checkpoints ENABLE ROW LEVEL SECURITY;
+
+-- 自分の記事のチェックポイントのみ読み書き可能
+CREATE POLICY "article_checkpoints_all_own" ON article_checkpoints
+    FOR ALL
+    USING (EXISTS (
+        SELECT 1 FROM articles
+        WHERE articles.id = article_checkpoints.article_id
+        AND articles.user_id::text = auth.uid()::text
+    ))
+    WITH CHECK (EXISTS (
+        SELECT 1 FROM articles
+        WHERE articles.id = article_checkpoints.article_id
+        AND articles.user_id::text = auth.uid()::text
+    ));
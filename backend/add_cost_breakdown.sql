@@ -0,0 +1,17 @@
+-- 記事ごとの外部APIコスト・レイテンシの内訳を記録するカラムを追加
+-- SupabaseダッシュボードのSQL Editorで実行してください
+
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS cost_breakdown JSONB;
+
+-- 内訳の構造（フェーズごと）:
+-- {
+--   "keyword_analysis": { ... },     -- analyze_keywords_task
+--   "article_generation": {          -- generate_article_task
+--     "dataforseo": {"/v3/serp/google/organic/advanced/live": {"calls": 1, "cost_usd": 0.002, "seconds": 3.1, "bytes": 123456}},
+--     "llm": {"gpt-4o:title": {"calls": 1, "prompt_tokens": 900, "completion_tokens": 40, "seconds": 2.4}},
+--     "stages": {"serp_analysis": 3.2, "content": 41.0, ...},  -- ステージごとの所要時間（秒）
+--     "dataforseo_cost_usd": 0.002,
+--     "llm_tokens": 940,
+--     "upstream_seconds": 5.5
+--   }
+-- }
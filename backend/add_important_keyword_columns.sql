@@ -0,0 +1,13 @@
+-- 記事作成時に入力した重要キーワードを保存するカラムを追加
+-- SupabaseダッシュボードのSQL Editorで実行してください
+-- キーワード分析・記事生成・失敗した記事の再開（POST /api/articles/{article_id}/resume）でこの値を使う
+
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS important_keyword1 VARCHAR(255);
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS important_keyword2 VARCHAR(255);
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS important_keyword3 VARCHAR(255);
+
+-- カラムが追加されたことを確認
+SELECT column_name, data_type 
+FROM information_schema.columns 
+WHERE table_name = 'articles' 
+AND column_name IN ('important_keyword1', 'important_keyword2', 'important_keyword3');
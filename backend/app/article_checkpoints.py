@@ -0,0 +1,141 @@
+"""
+記事生成ステージのチェックポイント
+ステージが終わるたびに出力を状態・依存ステージの出力のハッシュとともに article_checkpoints テーブルへ
+（記事ID, 入力ハッシュ, ステージ名）をキーに保存し、同じ入力で再実行・再開したときは保存済みのステージを実行せずに出力を復元する
+（後段のステージで失敗した記事の再試行で、SERP取得やLLM呼び出しをやり直さない）
+新しい入力で生成を始めたときは、それ以前の入力のチェックポイントを削除する
+"""
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+from app.supabase_db import (
+    delete_article_checkpoints,
+    get_article_checkpoints,
+    save_article_checkpoint,
+)
+
+
+# 入力データを保存する疑似ステージ名（再開時に同じ入力で実行するため）
+INPUT_STAGE = "__input__"
+
+
+def make_input_hash(article_data: Dict[str, Any]) -> str:
+    """記事の入力データからハッシュを生成（入力が変わったら別のチェックポイントになる）"""
+    canonical = json.dumps(article_data, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def load_checkpoint_input(article_id: str) -> Optional[Dict[str, Any]]:
+    """
+    記事の直近の生成で使った入力データを取得
+
+    Args:
+        article_id: 記事ID
+
+    Returns:
+        入力データ（チェックポイントがなければNone）
+    """
+    # 新しい入力で生成を始めるたびに入力データを保存し直すので、更新日時が最も新しいものが直近の入力
+    rows = [row for row in get_article_checkpoints(article_id) if row.get("stage") == INPUT_STAGE]
+    if not rows:
+        return None
+    latest = max(rows, key=lambda row: row.get("updated_at") or "")
+    return latest.get("output")
+
+
+def _is_entry(output: Any) -> bool:
+    return isinstance(output, dict) and {"output", "status", "inputs_hash"} <= output.keys()
+
+
+class ArticleCheckpoints:
+    """1回の記事生成のチェックポイント（StageGraphに渡す）"""
+
+    def __init__(self, article_id: str, article_data: Dict[str, Any]):
+        """
+        Args:
+            article_id: 記事ID
+            article_data: 記事の入力データ
+        """
+        self.article_id = article_id
+        self.article_data = article_data
+        self.input_hash = make_input_hash(article_data)
+        # ステージ名 -> {"output", "status", "inputs_hash"}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # テーブルが未作成の場合などは以降の保存を諦め、記事生成自体は続行する
+        self._enabled = True
+
+    def load(self) -> int:
+        """
+        保存済みのチェックポイントを読み込み、入力データを保存
+        以前の別の入力のチェックポイントは削除する（再開時に古い入力を使わないように）
+
+        Returns:
+            読み込んだステージ数
+        """
+        try:
+            delete_article_checkpoints(self.article_id, keep_input_hash=self.input_hash)
+            rows = get_article_checkpoints(self.article_id, self.input_hash)
+            # 形式の異なる（状態・入力ハッシュのない）行は復元せずに再実行する
+            self._entries = {
+                row["stage"]: row["output"]
+                for row in rows
+                if row.get("stage") != INPUT_STAGE and _is_entry(row.get("output"))
+            }
+            # 更新日時を新しくして、この入力を直近の入力にする
+            save_article_checkpoint(self.article_id, self.input_hash, INPUT_STAGE, self.article_data)
+        except Exception as e:
+            self._disable(e)
+            return 0
+        if self._entries:
+            print(f"[checkpoint] {self.article_id}: 保存済みのステージ {', '.join(sorted(self._entries))} を再利用します")
+        return len(self._entries)
+
+    def get(self, stage: str) -> Optional[Dict[str, Any]]:
+        """
+        ステージの保存済み出力を取得
+
+        Returns:
+            {"output": 出力, "status": 状態, "inputs_hash": 依存ステージの出力のハッシュ}（未保存ならNone）
+        """
+        return self._entries.get(stage)
+
+    def save(self, stage: str, output: Any, status: str = "ok", inputs_hash: Optional[str] = None) -> None:
+        """
+        ステージの出力を保存（JSONにできない出力は保存しない）
+
+        Args:
+            stage: ステージ名
+            output: 出力（既定値で続行した任意ステージは既定値）
+            status: "ok" / "timeout" / "error"
+            inputs_hash: 依存ステージの出力のハッシュ
+        """
+        if not self._enabled:
+            return
+        try:
+            # 保存した値と復元した値が一致するよう、JSONを経由した値を保持する
+            entry = json.loads(json.dumps(
+                {"output": output, "status": status, "inputs_hash": inputs_hash},
+                ensure_ascii=False
+            ))
+        except (TypeError, ValueError):
+            print(f"[checkpoint] {stage} の出力はJSONに変換できないため保存しません")
+            return
+        try:
+            save_article_checkpoint(self.article_id, self.input_hash, stage, entry)
+            self._entries[stage] = entry
+        except Exception as e:
+            self._disable(e)
+
+    def clear(self) -> None:
+        """記事のチェックポイントをすべて削除（生成完了時）"""
+        if not self._enabled:
+            return
+        try:
+            delete_article_checkpoints(self.article_id)
+        except Exception as e:
+            print(f"[checkpoint] 削除に失敗しました（続行）: {str(e)}")
+
+    def _disable(self, error: Exception) -> None:
+        self._enabled = False
+        print(f"[checkpoint] チェックポイントを使用できません（続行）: {str(error)}")
@@ -0,0 +1,163 @@
+"""
+長文記事のアウトライン・セクション分割生成の補助
+アウトライン（見出しと要点、目安文字数）の解析、セクションへの文字数配分、生成したセクションの結合を行う
+LLMの呼び出し自体はworkflow.ArticleGeneratorが行う
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+
+# セクションの文字数の下限・上限（1回の呼び出しで安定して書ける範囲）
+MIN_SECTION_CHARS = 300
+MAX_SECTION_CHARS = 3000
+
+# 日本語の本文1文字あたりの出力トークン数の見積もり（余裕を持たせる）
+OUTPUT_TOKENS_PER_CHAR = 1.5
+
+_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$")
+_SECTION_MARKER = re.compile(r"^=+\s*[^=]*\s*=+$")
+
+
+def _extract_json(text: str) -> str:
+    text = (text or "").strip()
+    if text.startswith("```"):
+        text = re.sub(r"^```[a-zA-Z]*\s*", "", text)
+        text = re.sub(r"\s*```$", "", text)
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("アウトラインにJSONが含まれていません")
+    return text[start:end + 1]
+
+
+def parse_outline(text: str) -> List[Dict[str, Any]]:
+    """
+    LLMが出力したアウトラインを解析
+
+    Args:
+        text: {"sections": [{"heading", "points", "target_chars"}]} 形式のJSONを含むテキスト
+
+    Returns:
+        セクションのリスト {"heading", "points", "target_chars"}
+
+    Raises:
+        ValueError: JSONでない、またはセクションがない場合
+    """
+    data = json.loads(_extract_json(text))
+    sections = data.get("sections") if isinstance(data, dict) else None
+    if not isinstance(sections, list):
+        raise ValueError("アウトラインにsectionsがありません")
+    outline = []
+    for section in sections:
+        if not isinstance(section, dict) or not str(section.get("heading") or "").strip():
+            continue
+        points = section.get("points") or []
+        if isinstance(points, str):
+            points = [points]
+        try:
+            target_chars = int(section.get("target_chars") or 0)
+        except (TypeError, ValueError):
+            target_chars = 0
+        outline.append({
+            "heading": str(section["heading"]).strip().lstrip("#").strip(),
+            "points": [str(point).strip() for point in points if str(point).strip()],
+            "target_chars": target_chars,
+        })
+    if len(outline) < 2:
+        raise ValueError("アウトラインのセクションが少なすぎます")
+    return outline
+
+
+def allocate_section_lengths(outline: List[Dict[str, Any]], total_chars: int) -> List[Dict[str, Any]]:
+    """
+    記事全体の目標文字数を各セクションに配分
+    アウトラインの目安文字数の比率を保ったまま合計をtotal_charsに合わせ、1セクションの上限・下限に収める
+
+    Args:
+        outline: parse_outlineの戻り値
+        total_chars: 記事全体の目標文字数
+
+    Returns:
+        target_charsを調整したアウトライン
+    """
+    weights = [section["target_chars"] if section["target_chars"] > 0 else 0 for section in outline]
+    if not any(weights):
+        weights = [1] * len(outline)
+    else:
+        # 目安のないセクションは平均値とみなす
+        average = sum(weights) / len([weight for weight in weights if weight])
+        weights = [weight or average for weight in weights]
+    total_weight = sum(weights)
+    return [
+        dict(
+            section,
+            target_chars=int(min(MAX_SECTION_CHARS, max(MIN_SECTION_CHARS, total_chars * weight / total_weight)))
+        )
+        for section, weight in zip(outline, weights)
+    ]
+
+
+def section_output_tokens(target_chars: int, limit: int = 8192) -> int:
+    """セクションの目標文字数から出力トークンの上限を決める"""
+    return int(min(limit, max(1024, target_chars * OUTPUT_TOKENS_PER_CHAR)))
+
+
+def clean_section_text(text: str, heading: str) -> str:
+    """
+    生成したセクション本文を整える
+    出力形式の区切りや、セクション見出しと同じ先頭の見出し行（結合時に付け直す）を取り除く
+    """
+    lines = (text or "").strip().split("\n")
+    while lines and (not lines[0].strip() or _SECTION_MARKER.match(lines[0].strip())):
+        lines.pop(0)
+    if lines:
+        match = _HEADING.match(lines[0].strip())
+        first = match.group(1) if match else lines[0].strip()
+        if re.sub(r"\s", "", first) == re.sub(r"\s", "", heading):
+            lines.pop(0)
+    return "\n".join(lines).strip()
+
+
+def stitch_sections(title: str, outline: List[Dict[str, Any]], texts: List[Optional[str]]) -> str:
+    """
+    セクションを記事として結合（単一呼び出しの出力形式 === 記事 === と同じ形にする）
+
+    Args:
+        title: 記事タイトル
+        outline: アウトライン
+        texts: 各セクションの本文（未生成はNone）
+
+    Returns:
+        記事本文（Markdown）
+    """
+    parts = ["=== 記事 ===", title, ""]
+    for section, text in zip(outline, texts):
+        if text is None:
+            continue
+        parts.append(f"### {section['heading']}")
+        body = clean_section_text(text, section["heading"])
+        if body:
+            parts.append(body)
+        parts.append("")
+    return "\n".join(parts).strip() + "\n"
+
+
+def outline_hints(serp_data: Optional[Dict[str, Any]], serp_analysis: Optional[Dict[str, Any]], limit: int = 10) -> Dict[str, List[str]]:
+    """
+    アウトライン作成の参考にする競合情報（上位記事のタイトル、よくある構成パターン、FAQ）
+
+    Returns:
+        {"titles", "patterns", "faq_items"}
+    """
+    titles = [
+        item.get("title", "")
+        for item in (serp_data or {}).get("items", []) or []
+        if item.get("type") == "organic" and item.get("title")
+    ][:limit]
+    headings = (serp_analysis or {}).get("headings_analysis") or {}
+    patterns = sorted({pattern for values in headings.values() for pattern in values or []})
+    return {
+        "titles": titles,
+        "patterns": patterns,
+        "faq_items": list((serp_analysis or {}).get("faq_items") or [])[:limit],
+    }
@@ -2,7 +2,7 @@
 アプリケーション設定
 """
 import os
-from typing import List
+from typing import Dict, List
 from pydantic_settings import BaseSettings
 
 
@@ -37,10 +37,115 @@ class Settings(BaseSettings):
     shopify_access_token: str = ""
     shopify_blog_id: str = ""
     
+    # /metrics のBearerトークン（空の場合は認証なし）
+    metrics_token: str = ""
+    
+    # ユーザー設定スナップショットのキャッシュ期間（秒）
+    settings_cache_ttl_seconds: int = 300
+    
+    # 記事生成ステージのタイムアウト（秒）。本文生成などLLMの長い出力を待つステージは別に設定
+    article_stage_timeout_seconds: float = 180.0
+    article_llm_stage_timeout_seconds: float = 600.0
+    # LLMの出力をストリーミングで受け取り、生成途中のタイトル・本文を記事に書き込む間隔（秒）
+    llm_streaming_enabled: bool = True
+    article_draft_flush_interval_seconds: float = 2.0
+    # APIキーごとのLLMクライアントを、この秒数使われなければプールから外す
+    llm_client_idle_seconds: float = 900.0
+    # LLMレスポンスキャッシュ（モデル・プロンプト・生成設定が同じ呼び出しの結果を再利用）
+    llm_cache_enabled: bool = True
+    llm_cache_path: str = ".cache/llm_cache.sqlite3"
+    llm_cache_ttl_seconds: int = 7 * 24 * 60 * 60
+    llm_cache_memory_items: int = 128
+    llm_cache_disk_items: int = 2000
+    # temperature > 0 の呼び出しも常に保存済みの出力を再利用する
+    # （既定のFalseでは、記事の再開・再試行のときだけ再利用し、通常の生成・再生成では毎回生成し直して出力に変化を持たせる）
+    llm_cache_sampled: bool = False
+    # 画像の配置をGPT-4oで行う（Falseの場合は見出し構造とalt_textからローカルで配置）
+    image_placement_use_llm: bool = False
+    # Shopify形式への変換をGeminiで行う（Falseの場合はMarkdownからローカルでbody_htmlを生成）
+    shopify_conversion_use_llm: bool = False
+    # 競合ページ取得（SERPデータがない場合の記事分析）
+    page_fetch_concurrency: int = 5  # 全体の同時取得数
+    page_fetch_per_host: int = 2  # 同一ホストへの同時取得数
+    page_fetch_max_bytes: int = 1_000_000  # 1ページあたりの最大受信バイト数
+    page_fetch_timeout: float = 10.0  # 1ページあたりのタイムアウト（秒）
+    page_fetch_max_chars: int = 4000  # 分析に渡す1ページあたりの最大文字数
+    # 本文の生成方法: "single"（1回で生成）/ "sectioned"（アウトライン→セクション並行生成）/ "auto"（目標文字数で切り替え）
+    article_generation_mode: str = "auto"
+    article_sectioned_min_chars: int = 4000  # autoでセクション並行生成にする目標文字数
+    article_section_concurrency: int = 4  # セクションの同時生成数
+    article_section_retries: int = 1  # 失敗したセクションを書き直す回数（それでも失敗したら一括生成）
+    # キーワード分析・以前の生成で保存したSERPを記事生成で再利用する最大経過時間（時間）
+    article_serp_reuse_max_age_hours: float = 24.0
+    # プロンプトのトークン上限（モデル別。可変部分をこの範囲に収める）
+    prompt_token_limits: Dict[str, int] = {"gpt-4o": 8000, "gemini-2.0-flash": 16000}
+    prompt_token_limit_default: int = 8000
+    # LLMルーター（呼び出し箇所ごとの期限、遅い応答のヘッジ、エラー時のもう一方のプロバイダーへの切り替え）
+    llm_deadlines: Dict[str, float] = {
+        "title": 60.0,
+        "analyze_articles": 120.0,
+        "outline": 90.0,
+        "content": 300.0,
+        "content_section": 180.0,
+    }
+    llm_deadline_default_seconds: float = 120.0
+    llm_hedge_enabled: bool = True
+    llm_hedge_percentile: float = 95.0  # このパーセンタイルのレイテンシを超えたらヘッジ送信
+    llm_hedge_min_samples: int = 20  # レイテンシのサンプルがこの件数に満たない間はヘッジしない
+    llm_hedge_min_delay_seconds: float = 2.0  # ヘッジ送信までの最短の待ち時間（秒）
+    llm_failover_enabled: bool = True  # エラー・ヘッジ時にもう一方のプロバイダーを使う
+    llm_retry_same_provider: bool = True  # もう一方が未設定の場合、エラー時に同じプロバイダーで1回やり直す
+    llm_router_max_workers: int = 16  # LLM呼び出しのスレッド数（ヘッジで負けた呼び出しも期限で打ち切られるまで占有する）
+    # 知識ベース検索（プロセス内のBM25インデックス）
+    knowledge_top_k: int = 5  # 記事生成に渡すパッセージ数
+    knowledge_index_refresh_seconds: float = 60.0  # updated_atによる差分更新の間隔（秒）
+    knowledge_index_full_sync_seconds: float = 3600.0  # 削除の反映（ID照合）の間隔（秒）
+    
     # DataForSEO
     dataforseo_login: str = ""
     dataforseo_password: str = ""
-    
+    # DataForSEO APIのベースURL（オフラインのスタンドインサーバーに向ける場合に変更）
+    dataforseo_base_url: str = "https://api.dataforseo.com"
+    # プロセス内のスタンドイン（記録済みレスポンスを返すモックトランスポート）を使う
+    # 負荷試験・ベンチマーク用。有効な間は実APIに一切リクエストしない
+    dataforseo_standin: bool = False
+    # スタンドインが読み込むレスポンス記録のディレクトリ（空の場合はリポジトリのapi/）
+    dataforseo_standin_fixtures_dir: str = ""
+    # スタンドインの応答遅延（ミリ秒）とその揺らぎ（±ミリ秒）
+    dataforseo_standin_latency_ms: float = 0.0
+    dataforseo_standin_jitter_ms: float = 0.0
+    # スタンドインのエラー注入率（0〜1）: 40200（残高不足）、HTTP 429、タイムアウト
+    dataforseo_standin_payment_error_rate: float = 0.0
+    dataforseo_standin_throttle_rate: float = 0.0
+    dataforseo_standin_timeout_rate: float = 0.0
+    # タイムアウト注入時に応答を止める秒数
+    dataforseo_standin_timeout_seconds: float = 5.0
+    # DataForSEO HTTPコネクションプール
+    dataforseo_http2: bool = True
+    dataforseo_max_connections: int = 20
+    dataforseo_max_keepalive_connections: int = 10
+    dataforseo_keepalive_expiry: float = 30.0
+    # liveエンドポイントへのバッチ送信で1リクエストに詰めるタスク数（最大100）
+    dataforseo_live_batch_size: int = 100
+    # 100キーワードを超えるリストをチャンク分割して取得するときの同時リクエスト数
+    dataforseo_chunk_concurrency: int = 4
+    # 標準キュー（task_post）モード: tasks_readyのポーリング間隔とタスク完了待ちの上限（秒）
+    dataforseo_queue_poll_interval: float = 5.0
+    dataforseo_queue_timeout: float = 1800.0
+    # キーワード分析でのGoogle Ads APIの呼び出し方法（"live" または標準キューの "queued"。リクエストで上書き可）
+    dataforseo_keyword_analysis_mode: str = "live"
+    # DataForSEO レート制御（ログインごと）と再試行
+    dataforseo_rate_limit_per_second: float = 30.0
+    dataforseo_rate_limit_burst: float = 30.0
+    dataforseo_max_retries: int = 4
+    dataforseo_retry_backoff_base: float = 0.5
+    dataforseo_retry_backoff_max: float = 8.0
+    # DataForSEO レスポンスキャッシュ
+    dataforseo_cache_enabled: bool = True
+    dataforseo_cache_path: str = ".cache/dataforseo_cache.sqlite3"
+    dataforseo_cache_memory_items: int = 256
+    dataforseo_cache_disk_items: int = 5000
+
     # CORS (文字列として受け取り、後でsplit)
     # 環境変数CORS_ORIGINSまたはCORS_ORIGINS_STRから読み込む
     cors_origins_str: str = "http://localhost:3000,http://localhost:5173,https://blog-automation-nu.vercel.app"
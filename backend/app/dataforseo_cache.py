@@ -0,0 +1,125 @@
+"""
+DataForSEOレスポンスキャッシュ
+エンドポイントと正規化したペイロードをキーに、エンドポイントごとのTTLでレスポンスを保持する
+同じキーワードの再分析（別ユーザーを含む）で有料のliveエンドポイントを再度呼ばないようにする
+"""
+import hashlib
+import json
+import unicodedata
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+from app.config import settings
+from app.dataforseo_transport import is_standin_target
+from app.metrics import record_cache_hit
+from app.response_cache import TwoTierCache
+
+
+# パスの前方一致でTTL（秒）を決定。上から順に評価する
+DATAFORSEO_CACHE_TTLS = [
+    ("/v3/serp/", 6 * 60 * 60),
+    ("/v3/keywords_data/", 24 * 60 * 60),
+    ("/v3/dataforseo_labs/", 24 * 60 * 60),
+    ("/v3/content_generation/", 7 * 24 * 60 * 60),
+]
+DEFAULT_CACHE_TTL = 60 * 60
+
+# 正規化対象のキー（大文字小文字・全角半角・余分な空白の違いを同一視する）
+_KEYWORD_FIELDS = {"keyword", "keywords", "target", "target1", "target2", "targets"}
+
+_cache: Optional[TwoTierCache] = None
+
+
+def get_dataforseo_cache() -> Optional[TwoTierCache]:
+    """DataForSEO用のキャッシュを取得（無効化されている場合はNone）"""
+    global _cache
+    if not settings.dataforseo_cache_enabled:
+        return None
+    if _cache is None:
+        # スタンドインのレスポンスが実APIのキャッシュに混ざらないよう、ファイルを分ける
+        db_path = settings.dataforseo_cache_path
+        if is_standin_target():
+            db_path = f"{db_path}.standin"
+        _cache = TwoTierCache(
+            name="dataforseo_responses",
+            db_path=db_path,
+            max_memory_items=settings.dataforseo_cache_memory_items,
+            max_disk_items=settings.dataforseo_cache_disk_items,
+        )
+    return _cache
+
+
+def _normalize_text(value: str) -> str:
+    normalized = unicodedata.normalize("NFKC", value)
+    return " ".join(normalized.split()).lower()
+
+
+def _normalize(value: Any, field: Optional[str] = None) -> Any:
+    if isinstance(value, dict):
+        return {key: _normalize(item, key) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item, field) for item in value]
+    if isinstance(value, str) and field in _KEYWORD_FIELDS:
+        return _normalize_text(value)
+    return value
+
+
+def endpoint_path(url: str) -> str:
+    """URLからパス部分のみを取り出す（ベースURLの違いをキーに含めない）"""
+    return urlparse(url).path.rstrip("/")
+
+
+def make_cache_key(url: str, payload: List[Dict[str, Any]]) -> str:
+    """エンドポイントと正規化したペイロードからキャッシュキーを生成"""
+    canonical = json.dumps(
+        {"endpoint": endpoint_path(url), "payload": _normalize(payload)},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def make_inflight_key(login: str, url: str, payload: List[Dict[str, Any]]) -> str:
+    """
+    実行中のリクエストの合流に使うキー（キャッシュキーにログインを加える）
+    認証情報が異なるユーザー同士では合流させない（他人のクレジットでの取得や、
+    他人の40200・401エラーを返さないため）
+    """
+    return f"{login}:{make_cache_key(url, payload)}"
+
+
+def ttl_for(url: str) -> int:
+    """エンドポイントに応じたTTLを返す"""
+    path = endpoint_path(url)
+    for prefix, ttl in DATAFORSEO_CACHE_TTLS:
+        if path.startswith(prefix):
+            return ttl
+    return DEFAULT_CACHE_TTL
+
+
+def is_cacheable(response_json: Any) -> bool:
+    """全タスクが成功（20000）したレスポンスのみキャッシュする"""
+    if not isinstance(response_json, dict) or response_json.get("status_code") != 20000:
+        return False
+    tasks = response_json.get("tasks") or []
+    return bool(tasks) and all(task.get("status_code") == 20000 for task in tasks)
+
+
+def get_cached_response(url: str, payload: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """キャッシュ済みのレスポンスJSONを取得"""
+    cache = get_dataforseo_cache()
+    if cache is None:
+        return None
+    cached = cache.get(make_cache_key(url, payload))
+    if cached is not None:
+        record_cache_hit("dataforseo", endpoint_path(url))
+    return cached
+
+
+def store_response(url: str, payload: List[Dict[str, Any]], response_json: Any) -> None:
+    """成功したレスポンスJSONをキャッシュに保存"""
+    cache = get_dataforseo_cache()
+    if cache is None or not is_cacheable(response_json):
+        return
+    cache.set(make_cache_key(url, payload), response_json, ttl_for(url))
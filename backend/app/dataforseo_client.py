@@ -3,11 +3,41 @@ DataForSEO API クライアント
 SEO対策のための各種APIを統合
 """
 import os
-import base64
+import asyncio
 import httpx
 import json
-from typing import Dict, List, Optional, Any
+import time
+import unicodedata
+from itertools import product
+from typing import Dict, List, Optional, Any, Union
+from app.config import settings
 from app.supabase_db import get_setting_by_key
+from app.dataforseo_transport import (
+    build_auth_headers,
+    dataforseo_url,
+    get_dataforseo_http_client,
+    projected_json,
+    send_projected,
+)
+from app.dataforseo_cache import get_cached_response, store_response, make_inflight_key, endpoint_path
+from app.dataforseo_throttle import send_with_retry
+from app.dataforseo_tasks import get_task_queue
+from app.singleflight import SingleFlight
+from app.metrics import record_llm_call
+from app.llm_cache import cached_llm_text
+from app.serp_parser import Projection, SERP_RESPONSE_PROJECTION
+
+
+# 同一エンドポイント・同一ペイロードの同時リクエストを1回の呼び出しにまとめる
+_inflight = SingleFlight()
+
+
+class DataForSEOTaskError(Exception):
+    """DataForSEOのタスク単位のエラー（status_codeにDataForSEOのステータスコードを保持）"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
 
 
 def get_dataforseo_config(user_id: str) -> Optional[Dict[str, str]]:
@@ -24,11 +54,270 @@ def get_dataforseo_config(user_id: str) -> Optional[Dict[str, str]]:
     }
 
 
-def _get_auth_header(login: str, password: str) -> str:
-    """Basic認証ヘッダーを生成"""
-    credentials = f"{login}:{password}"
-    encoded = base64.b64encode(credentials.encode()).decode()
-    return f"Basic {encoded}"
+def resolve_dataforseo_config(
+    user_id: Optional[str],
+    missing_message: str = "DataForSEO設定が完了していません。設定ページでDataForSEO情報を登録してください。"
+) -> Dict[str, str]:
+    """
+    ユーザー設定、なければ環境変数からDataForSEO認証情報を取得
+
+    Raises:
+        ValueError: どちらにも認証情報がない場合（missing_message）
+    """
+    config = get_dataforseo_config(user_id) if user_id else None
+    
+    if not config:
+        # 環境変数から取得を試みる
+        login = os.getenv("DATAFORSEO_LOGIN")
+        password = os.getenv("DATAFORSEO_PASSWORD")
+        if not login or not password:
+            raise ValueError(missing_message)
+        config = {"login": login, "password": password}
+    
+    return config
+
+
+async def _fetch_live_response(
+    url: str,
+    payload: List[Dict[str, Any]],
+    headers: Dict[str, str],
+    login: str,
+    timeout: float,
+    projection: Optional[Projection] = None
+) -> Dict[str, Any]:
+    """キャッシュを確認したうえで上流にPOSTし、レスポンスJSONを返す（projection指定時は射影して読み込む）"""
+    # 合流待ちの間に別の呼び出しが結果を保存している場合がある
+    result = get_cached_response(url, payload)
+    if result is not None:
+        return result
+    
+    client = get_dataforseo_http_client(login)
+    # liveエンドポイントは冪等なので、一時的なエラーは期限内で再試行する
+    # 射影する場合は本文を溜めずに受信しながらパースする
+    response = await send_with_retry(
+        lambda remaining: (
+            send_projected(client, "POST", url, projection, json=payload, headers=headers, timeout=remaining)
+            if projection else client.post(url, json=payload, headers=headers, timeout=remaining)
+        ),
+        login=login,
+        timeout=timeout,
+        api_name=endpoint_path(url),
+        endpoint=endpoint_path(url)
+    )
+    response.raise_for_status()
+    
+    result = projected_json(response, projection) if projection else response.json()
+    store_response(url, payload, result)
+    return result
+
+
+async def _fetch_queued_response(
+    url: str,
+    payload: List[Dict[str, Any]],
+    config: Dict[str, str],
+    queue_family: str
+) -> Dict[str, Any]:
+    """標準キュー（task_post）経由でタスクを実行し、liveと同じ形のレスポンスJSONを返す"""
+    result = get_cached_response(url, payload)
+    if result is not None:
+        return result
+    
+    task = await get_task_queue().submit(
+        queue_family, payload[0], config, settings.dataforseo_queue_timeout
+    )
+    return {"status_code": 20000, "tasks": [task]}
+
+
+async def _post_live(
+    url: str,
+    payload: List[Dict[str, Any]],
+    config: Dict[str, str],
+    timeout: float,
+    api_name: str,
+    payment_required_message: str,
+    mode: str = "live",
+    queue_family: Optional[str] = None,
+    projection: Optional[Projection] = None
+) -> Dict[str, Any]:
+    """
+    DataForSEOのliveエンドポイントにPOSTし、成功したタスクを返す
+    
+    Args:
+        url: エンドポイントURL
+        payload: リクエストボディ（タスクのリスト）
+        config: 認証情報
+        timeout: タイムアウト秒数
+        api_name: エラーメッセージに使うAPI名（例: "DataForSEO SERP API"）
+        payment_required_message: status_code 40200 のときのエラーメッセージ
+        mode: "live"（liveエンドポイント）または "queued"（task_postの標準キュー）
+        queue_family: queued時に使うdataforseo_tasks.TASK_ENDPOINTSのキー
+        projection: レスポンスから残すフィールドの指定（serp_parser参照、省略時は全体）
+    
+    Returns:
+        tasks[0]（status_code 20000）
+    """
+    if mode not in ("live", "queued"):
+        raise ValueError(f"不正なモードです: {mode}")
+    if mode == "queued" and not queue_family:
+        raise ValueError(f"{api_name} は標準キューに対応していません")
+    
+    headers = build_auth_headers(config)
+    
+    if mode == "queued":
+        fetch = lambda: _fetch_queued_response(url, payload, config, queue_family)
+    else:
+        fetch = lambda: _fetch_live_response(url, payload, headers, config["login"], timeout, projection)
+    
+    try:
+        # 同じリクエストの結果がキャッシュにあれば再利用
+        result = get_cached_response(url, payload)
+        if result is None:
+            # 同じログインで同時に同じリクエストが来ている場合は上流への呼び出しを共有（live/queuedの区別なし）
+            result = await _inflight.do(make_inflight_key(config["login"], url, payload), fetch)
+        
+        if result.get("tasks") and len(result["tasks"]) > 0:
+            task = result["tasks"][0]
+
+            # エラーステータスコードをチェック
+            if task.get("status_code") == 20000:  # 成功
+                return task
+            raise _task_error(task, api_name, payment_required_message)
+
+        # タスクが存在しない場合
+        raise Exception(f"{api_name}: レスポンスにタスクが含まれていません")
+    except (httpx.HTTPStatusError, httpx.RequestError) as e:
+        raise _transport_error(e, api_name)
+    except TimeoutError:
+        raise Exception(f"{api_name}: 標準キューのタスク完了待ちがタイムアウトしました")
+    except Exception as e:
+        # 既にExceptionの場合はそのまま再スロー
+        raise
+
+
+def _task_error(task: Dict[str, Any], api_name: str, payment_required_message: str) -> DataForSEOTaskError:
+    """失敗したタスクをDataForSEOTaskErrorに変換"""
+    status_code = task.get("status_code")
+    status_message = task.get("status_message", "Unknown error")
+    error_message = f"{api_name} エラー (status_code: {status_code}): {status_message}"
+
+    # Payment Requiredエラーの場合
+    if status_code == 40200:
+        error_message = payment_required_message
+
+    return DataForSEOTaskError(error_message, status_code=status_code)
+
+
+def _transport_error(e: Exception, api_name: str) -> Exception:
+    """httpxの例外をエラーメッセージ付きのExceptionに変換"""
+    if isinstance(e, httpx.HTTPStatusError):
+        return Exception(f"{api_name} HTTPエラー: {e.response.status_code} - {e.response.text[:500]}")
+    return Exception(f"{api_name} リクエストエラー: {str(e)}")
+
+
+def _single_task_response(task: Dict[str, Any]) -> Dict[str, Any]:
+    """バッチレスポンス内の1タスクを、単独リクエストと同じ形のレスポンスに組み立てる（キャッシュ共有用）"""
+    return {
+        "status_code": 20000,
+        "status_message": "Ok.",
+        "cost": task.get("cost", 0),
+        "tasks_count": 1,
+        "tasks_error": 0,
+        "tasks": [task]
+    }
+
+
+async def _post_live_many(
+    url: str,
+    tasks: List[Dict[str, Any]],
+    config: Dict[str, str],
+    timeout: float,
+    api_name: str,
+    payment_required_message: str,
+    max_tasks_per_request: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+    projection: Optional[Projection] = None
+) -> List[Union[Dict[str, Any], Exception]]:
+    """
+    複数タスクをできるだけ少ないPOSTにまとめて送信し、tasks[]を呼び出し順に振り分ける
+
+    各タスクは単独リクエストと同じキーでキャッシュを参照・保存するため、
+    get_serp_data等の単発呼び出しとキャッシュを共有する
+
+    Args:
+        url: エンドポイントURL
+        tasks: タスクのリスト（1要素が1タスク）
+        config: 認証情報
+        timeout: タイムアウト秒数（1リクエストあたり）
+        api_name: エラーメッセージに使うAPI名
+        payment_required_message: status_code 40200 のときのエラーメッセージ
+        max_tasks_per_request: 1リクエストに詰めるタスク数の上限（省略時は設定値）
+        max_concurrency: 同時に送信するリクエスト数の上限（省略時は無制限）
+        projection: レスポンスから残すフィールドの指定（省略時は全体）
+
+    Returns:
+        tasksと同じ順序の結果リスト。成功したタスクはタスク辞書、失敗したタスクは例外
+    """
+    batch_size = max(1, min(max_tasks_per_request or settings.dataforseo_live_batch_size, 100))
+    results: List[Union[Dict[str, Any], Exception, None]] = [None] * len(tasks)
+
+    # キャッシュ済みのタスクを先に埋める
+    pending = []
+    for index, task_payload in enumerate(tasks):
+        cached = get_cached_response(url, [task_payload])
+        if cached is not None:
+            results[index] = cached["tasks"][0]
+        else:
+            pending.append(index)
+
+    headers = build_auth_headers(config)
+
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def post_chunk(body: List[Dict[str, Any]]) -> httpx.Response:
+        client = get_dataforseo_http_client(config["login"])
+        send = lambda: send_with_retry(
+            lambda remaining: (
+                send_projected(client, "POST", url, projection, json=body, headers=headers, timeout=remaining)
+                if projection else client.post(url, json=body, headers=headers, timeout=remaining)
+            ),
+            login=config["login"],
+            timeout=timeout,
+            api_name=api_name,
+            endpoint=endpoint_path(url)
+        )
+        if semaphore is None:
+            return await send()
+        async with semaphore:
+            return await send()
+
+    async def send_chunk(indexes: List[int]) -> None:
+        body = [tasks[i] for i in indexes]
+        try:
+            response = await post_chunk(body)
+            response.raise_for_status()
+            response_json = projected_json(response, projection) if projection else response.json()
+            response_tasks = response_json.get("tasks") or []
+        except (httpx.HTTPStatusError, httpx.RequestError) as e:
+            error = _transport_error(e, api_name)
+            for i in indexes:
+                results[i] = error
+            return
+
+        # DataForSEOはリクエストボディと同じ順序でtasks[]を返す
+        for position, i in enumerate(indexes):
+            if position >= len(response_tasks):
+                results[i] = Exception(f"{api_name}: レスポンスにタスクが含まれていません")
+                continue
+            task = response_tasks[position]
+            if task.get("status_code") == 20000:
+                store_response(url, [tasks[i]], _single_task_response(task))
+                results[i] = task
+            else:
+                results[i] = _task_error(task, api_name, payment_required_message)
+
+    chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    await asyncio.gather(*(send_chunk(chunk) for chunk in chunks))
+    return results
 
 
 async def get_serp_data(
@@ -37,7 +326,8 @@ async def get_serp_data(
     language_code: str = "ja",
     device: str = "mobile",
     depth: int = 50,
-    user_id: Optional[str] = None
+    user_id: Optional[str] = None,
+    mode: str = "live"
 ) -> Optional[Dict[str, Any]]:
     """
     SERP API（検索エンジン結果ページAPI）でGoogle検索結果を取得
@@ -49,26 +339,14 @@ async def get_serp_data(
         device: デバイスタイプ（mobile/desktop）
         depth: 取得する結果数（最大50）
         user_id: ユーザーID（設定から取得する場合）
+        mode: "live" または "queued"（task_postの標準キュー。安価だが完了まで数分かかる場合がある）
     
     Returns:
         SERP分析結果の辞書
     """
-    config = get_dataforseo_config(user_id) if user_id else None
-    
-    if not config:
-        # 環境変数から取得を試みる
-        login = os.getenv("DATAFORSEO_LOGIN")
-        password = os.getenv("DATAFORSEO_PASSWORD")
-        if not login or not password:
-            raise ValueError("DataForSEO設定が完了していません。設定ページでDataForSEO情報を登録してください。")
-        config = {"login": login, "password": password}
-    
-    url = "https://api.dataforseo.com/v3/serp/google/organic/advanced/live"
+    config = resolve_dataforseo_config(user_id, "DataForSEO設定が完了していません。設定ページでDataForSEO情報を登録してください。")
     
-    headers = {
-        "Authorization": _get_auth_header(config["login"], config["password"]),
-        "Content-Type": "application/json"
-    }
+    url = dataforseo_url("/v3/serp/google/organic/advanced/live")
     
     payload = [{
         "keyword": keyword,
@@ -81,40 +359,86 @@ async def get_serp_data(
         "include_subdomains": True
     }]
     
-    try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            
-            result = response.json()
-            if result.get("tasks") and len(result["tasks"]) > 0:
-                task = result["tasks"][0]
-                status_code = task.get("status_code")
-                
-                # エラーステータスコードをチェック
-                if status_code == 20000:  # 成功
-                    return task.get("result", [{}])[0] if task.get("result") else None
-                else:
-                    status_message = task.get("status_message", "Unknown error")
-                    error_message = f"DataForSEO SERP API エラー (status_code: {status_code}): {status_message}"
-                    
-                    # Payment Requiredエラーの場合
-                    if status_code == 40200:
-                        error_message = f"DataForSEO SERP APIへのアクセス権限がありません（Payment Required）。DataForSEOアカウントに残高があるか確認してください。"
-                    
-                    raise Exception(error_message)
-            
-            # タスクが存在しない場合
-            raise Exception("DataForSEO SERP API: レスポンスにタスクが含まれていません")
-    except httpx.HTTPStatusError as e:
-        error_message = f"DataForSEO SERP API HTTPエラー: {e.response.status_code} - {e.response.text[:500]}"
-        raise Exception(error_message)
-    except httpx.RequestError as e:
-        error_message = f"DataForSEO SERP API リクエストエラー: {str(e)}"
-        raise Exception(error_message)
-    except Exception as e:
-        # 既にExceptionの場合はそのまま再スロー
-        raise
+    task = await _post_live(
+        url, payload, config, timeout=120.0,
+        api_name="DataForSEO SERP API",
+        payment_required_message="DataForSEO SERP APIへのアクセス権限がありません（Payment Required）。DataForSEOアカウントに残高があるか確認してください。",
+        mode=mode,
+        queue_family="serp_organic",
+        projection=SERP_RESPONSE_PROJECTION
+    )
+    return task.get("result", [{}])[0] if task.get("result") else None
+
+
+async def get_serp_data_many(
+    keywords: List[str],
+    location_code: int = 2840,  # 日本
+    language_code: str = "ja",
+    devices: Optional[List[str]] = None,
+    depth: int = 50,
+    user_id: Optional[str] = None,
+    location_codes: Optional[List[int]] = None
+) -> List[Dict[str, Any]]:
+    """
+    複数キーワード（×地域×デバイス）のSERPをまとめて取得
+
+    組み合わせごとに1タスクを作り、1回のPOSTに最大100タスクまで詰めて送信する
+
+    Args:
+        keywords: 検索キーワードのリスト
+        location_code: 地域コード（location_codes未指定時に使用）
+        language_code: 言語コード
+        devices: デバイスタイプのリスト（省略時は["mobile"]）
+        depth: 取得する結果数
+        user_id: ユーザーID（設定から取得する場合）
+        location_codes: 地域コードのリスト
+
+    Returns:
+        組み合わせごとの辞書のリスト
+        {"keyword", "location_code", "device", "result", "error", "status_code"}
+        失敗したタスクはresultがNoneで、errorにメッセージが入る
+    """
+    config = resolve_dataforseo_config(user_id, "DataForSEO設定が完了していません。設定ページでDataForSEO情報を登録してください。")
+
+    url = dataforseo_url("/v3/serp/google/organic/advanced/live")
+
+    combinations = list(product(keywords, location_codes or [location_code], devices or ["mobile"]))
+    tasks = [{
+        "keyword": keyword,
+        "location_code": task_location_code,
+        "language_code": language_code,
+        "device": device,
+        "depth": depth,
+        "calculate_rectangles": True,
+        "include_serp_info": True,
+        "include_subdomains": True
+    } for keyword, task_location_code, device in combinations]
+
+    task_results = await _post_live_many(
+        url, tasks, config, timeout=120.0,
+        api_name="DataForSEO SERP API",
+        payment_required_message="DataForSEO SERP APIへのアクセス権限がありません（Payment Required）。DataForSEOアカウントに残高があるか確認してください。",
+        projection=SERP_RESPONSE_PROJECTION
+    )
+
+    entries = []
+    for (keyword, task_location_code, device), task_result in zip(combinations, task_results):
+        entry = {
+            "keyword": keyword,
+            "location_code": task_location_code,
+            "device": device,
+            "result": None,
+            "error": None,
+            "status_code": None
+        }
+        if isinstance(task_result, Exception):
+            entry["error"] = str(task_result)
+            entry["status_code"] = getattr(task_result, "status_code", None)
+        else:
+            entry["result"] = task_result.get("result", [{}])[0] if task_result.get("result") else None
+            entry["status_code"] = task_result.get("status_code")
+        entries.append(entry)
+    return entries
 
 
 async def get_keywords_data(
@@ -135,21 +459,9 @@ async def get_keywords_data(
     Returns:
         キーワードデータのリスト
     """
-    config = get_dataforseo_config(user_id) if user_id else None
-    
-    if not config:
-        login = os.getenv("DATAFORSEO_LOGIN")
-        password = os.getenv("DATAFORSEO_PASSWORD")
-        if not login or not password:
-            raise ValueError("DataForSEO設定が完了していません。")
-        config = {"login": login, "password": password}
-    
-    url = "https://api.dataforseo.com/v3/dataforseo_labs/google/keywords_for_keywords/live"
+    config = resolve_dataforseo_config(user_id, "DataForSEO設定が完了していません。")
     
-    headers = {
-        "Authorization": _get_auth_header(config["login"], config["password"]),
-        "Content-Type": "application/json"
-    }
+    url = dataforseo_url("/v3/dataforseo_labs/google/keywords_for_keywords/live")
     
     # 最大100キーワードまでバッチ処理
     keywords_batch = keywords[:100]
@@ -162,47 +474,77 @@ async def get_keywords_data(
         "limit": 20  # 各キーワードの関連キーワードを20個取得
     }]
     
-    try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            
-            result = response.json()
-            if result.get("tasks") and len(result["tasks"]) > 0:
-                task = result["tasks"][0]
-                status_code = task.get("status_code")
-                
-                # エラーステータスコードをチェック
-                if status_code == 20000:
-                    return task.get("result", [])
-                else:
-                    status_message = task.get("status_message", "Unknown error")
-                    error_message = f"DataForSEO Keywords API エラー (status_code: {status_code}): {status_message}"
-                    
-                    # Payment Requiredエラーの場合
-                    if status_code == 40200:
-                        error_message = f"DataForSEO Keywords APIへのアクセス権限がありません（Payment Required）。DataForSEOアカウントに残高があるか確認してください。"
-                    
-                    raise Exception(error_message)
-            
-            # タスクが存在しない場合
-            raise Exception("DataForSEO Keywords API: レスポンスにタスクが含まれていません")
-    except httpx.HTTPStatusError as e:
-        error_message = f"DataForSEO Keywords API HTTPエラー: {e.response.status_code} - {e.response.text[:500]}"
-        raise Exception(error_message)
-    except httpx.RequestError as e:
-        error_message = f"DataForSEO Keywords API リクエストエラー: {str(e)}"
-        raise Exception(error_message)
-    except Exception as e:
-        # 既にExceptionの場合はそのまま再スロー
-        raise
+    task = await _post_live(
+        url, payload, config, timeout=120.0,
+        api_name="DataForSEO Keywords API",
+        payment_required_message="DataForSEO Keywords APIへのアクセス権限がありません（Payment Required）。DataForSEOアカウントに残高があるか確認してください。"
+    )
+    return task.get("result", [])
+
+
+async def get_keywords_data_many(
+    keyword_groups: List[List[str]],
+    location_code: int = 2840,  # 日本
+    language_code: str = "ja",
+    user_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    複数のキーワードグループ（各最大100個）のデータをまとめて取得
+
+    グループごとに1タスクを作り、1回のPOSTに最大100タスクまで詰めて送信する
+
+    Args:
+        keyword_groups: キーワードリストのリスト
+        location_code: 地域コード（2840=日本）
+        language_code: 言語コード（ja=日本語）
+        user_id: ユーザーID（設定から取得する場合）
+
+    Returns:
+        グループごとの辞書のリスト {"keywords", "result", "error", "status_code"}
+    """
+    config = resolve_dataforseo_config(user_id, "DataForSEO設定が完了していません。")
+
+    url = dataforseo_url("/v3/dataforseo_labs/google/keywords_for_keywords/live")
+
+    tasks = [{
+        "keywords": group[:100],
+        "location_code": location_code,
+        "language_code": language_code,
+        "include_serp_info": True,
+        "limit": 20
+    } for group in keyword_groups]
+
+    task_results = await _post_live_many(
+        url, tasks, config, timeout=120.0,
+        api_name="DataForSEO Keywords API",
+        payment_required_message="DataForSEO Keywords APIへのアクセス権限がありません（Payment Required）。DataForSEOアカウントに残高があるか確認してください。"
+    )
+
+    entries = []
+    for group, task_result in zip(keyword_groups, task_results):
+        if isinstance(task_result, Exception):
+            entries.append({
+                "keywords": group[:100],
+                "result": None,
+                "error": str(task_result),
+                "status_code": getattr(task_result, "status_code", None)
+            })
+        else:
+            entries.append({
+                "keywords": group[:100],
+                "result": task_result.get("result", []),
+                "error": None,
+                "status_code": task_result.get("status_code")
+            })
+    return entries
 
 
 async def get_keywords_data_google_ads(
     keywords: List[str],
     location_code: int = 2840,  # 日本
     language_code: str = "ja",
-    user_id: Optional[str] = None
+    user_id: Optional[str] = None,
+    mode: str = "live"
 ) -> Optional[List[Dict[str, Any]]]:
     """
     Google Ads APIベースのKeywords Data APIで検索ボリュームを取得
@@ -213,25 +555,14 @@ async def get_keywords_data_google_ads(
         location_code: 地域コード（2840=日本）
         language_code: 言語コード（ja=日本語）
         user_id: ユーザーID（設定から取得する場合）
+        mode: "live" または "queued"（task_postの標準キュー）
     
     Returns:
         キーワードデータのリスト
     """
-    config = get_dataforseo_config(user_id) if user_id else None
+    config = resolve_dataforseo_config(user_id, "DataForSEO設定が完了していません。")
     
-    if not config:
-        login = os.getenv("DATAFORSEO_LOGIN")
-        password = os.getenv("DATAFORSEO_PASSWORD")
-        if not login or not password:
-            raise ValueError("DataForSEO設定が完了していません。")
-        config = {"login": login, "password": password}
-    
-    url = "https://api.dataforseo.com/v3/keywords_data/google_ads/search_volume/live"
-    
-    headers = {
-        "Authorization": _get_auth_header(config["login"], config["password"]),
-        "Content-Type": "application/json"
-    }
+    url = dataforseo_url("/v3/keywords_data/google_ads/search_volume/live")
     
     # 最大100キーワードまでバッチ処理
     keywords_batch = keywords[:100]
@@ -243,40 +574,126 @@ async def get_keywords_data_google_ads(
         "sort_by": "relevance"
     }]
     
-    try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            
-            result = response.json()
-            if result.get("tasks") and len(result["tasks"]) > 0:
-                task = result["tasks"][0]
-                status_code = task.get("status_code")
-                
-                # エラーステータスコードをチェック
-                if status_code == 20000:
-                    return task.get("result", [])
-                else:
-                    status_message = task.get("status_message", "Unknown error")
-                    error_message = f"DataForSEO Google Ads API エラー (status_code: {status_code}): {status_message}"
-                    
-                    # Payment Requiredエラーの場合
-                    if status_code == 40200:
-                        error_message = f"Google Ads APIへのアクセス権限がありません（Payment Required）。DataForSEOアカウントに残高があるか、Google Ads APIへのアクセス権限があるか確認してください。"
-                    
-                    raise Exception(error_message)
-            
-            # タスクが存在しない場合
-            raise Exception("DataForSEO Google Ads API: レスポンスにタスクが含まれていません")
-    except httpx.HTTPStatusError as e:
-        error_message = f"DataForSEO Google Ads API HTTPエラー: {e.response.status_code} - {e.response.text[:500]}"
-        raise Exception(error_message)
-    except httpx.RequestError as e:
-        error_message = f"DataForSEO Google Ads API リクエストエラー: {str(e)}"
-        raise Exception(error_message)
-    except Exception as e:
-        # 既にExceptionの場合はそのまま再スロー
-        raise
+    task = await _post_live(
+        url, payload, config, timeout=120.0,
+        api_name="DataForSEO Google Ads API",
+        payment_required_message="Google Ads APIへのアクセス権限がありません（Payment Required）。DataForSEOアカウントに残高があるか、Google Ads APIへのアクセス権限があるか確認してください。",
+        mode=mode,
+        queue_family="google_ads_search_volume"
+    )
+    return task.get("result", [])
+
+
+# チャンク取得に対応するキーワードデータのエンドポイント
+# （ベースURLは設定で切り替えられるため、パスだけを持ち送信時にURLにする）
+_KEYWORD_DATA_SOURCES = {
+    "labs": {
+        "path": "/v3/dataforseo_labs/google/keywords_for_keywords/live",
+        "api_name": "DataForSEO Keywords API",
+        "payment_required_message": "DataForSEO Keywords APIへのアクセス権限がありません（Payment Required）。DataForSEOアカウントに残高があるか確認してください。",
+        "options": {"include_serp_info": True, "limit": 20}
+    },
+    "google_ads": {
+        "path": "/v3/keywords_data/google_ads/search_volume/live",
+        "api_name": "DataForSEO Google Ads API",
+        "payment_required_message": "Google Ads APIへのアクセス権限がありません（Payment Required）。DataForSEOアカウントに残高があるか、Google Ads APIへのアクセス権限があるか確認してください。",
+        "options": {"sort_by": "relevance"}
+    },
+}
+
+
+def _keyword_identity(keyword: str) -> str:
+    """重複判定用にキーワードを正規化（全角半角・大文字小文字・空白の違いを同一視）"""
+    return " ".join(unicodedata.normalize("NFKC", keyword).split()).lower()
+
+
+async def get_keywords_data_chunked(
+    keywords: List[str],
+    location_code: int = 2840,  # 日本
+    language_code: str = "ja",
+    user_id: Optional[str] = None,
+    source: str = "labs",
+    chunk_size: int = 100,
+    max_concurrency: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    100個を超えるキーワードリストを100個ずつのチャンクに分けて取得し、結果を統合する
+
+    Args:
+        keywords: キーワードリスト（件数の上限なし）
+        location_code: 地域コード（2840=日本）
+        language_code: 言語コード（ja=日本語）
+        user_id: ユーザーID（設定から取得する場合）
+        source: "labs"（dataforseo_labs）または "google_ads"（Google Ads検索ボリューム）
+        chunk_size: 1タスクあたりのキーワード数（最大100）
+        max_concurrency: 同時に送信するリクエスト数の上限（省略時は設定値）
+
+    Returns:
+        {"items": 重複を除いたキーワードデータのリスト,
+         "errors": 失敗したチャンクのリスト {"chunk_index", "keywords", "error", "status_code"},
+         "requested": 重複除去後のキーワード数, "chunks": チャンク数}
+    """
+    if source not in _KEYWORD_DATA_SOURCES:
+        raise ValueError(f"不正なsourceです: {source}")
+    spec = _KEYWORD_DATA_SOURCES[source]
+    config = resolve_dataforseo_config(user_id, "DataForSEO設定が完了していません。")
+
+    # 入力キーワードの重複を除去（順序は維持）
+    unique_keywords = []
+    seen = set()
+    for keyword in keywords:
+        if not keyword:
+            continue
+        identity = _keyword_identity(keyword)
+        if identity not in seen:
+            seen.add(identity)
+            unique_keywords.append(keyword)
+
+    chunk_size = max(1, min(chunk_size, 100))
+    chunks = [unique_keywords[i:i + chunk_size] for i in range(0, len(unique_keywords), chunk_size)]
+    tasks = [{
+        "keywords": chunk,
+        "location_code": location_code,
+        "language_code": language_code,
+        **spec["options"]
+    } for chunk in chunks]
+
+    task_results = await _post_live_many(
+        dataforseo_url(spec["path"]), tasks, config, timeout=120.0,
+        api_name=spec["api_name"],
+        payment_required_message=spec["payment_required_message"],
+        max_concurrency=max_concurrency or settings.dataforseo_chunk_concurrency
+    )
+
+    items = []
+    errors = []
+    seen_items = set()
+    for chunk_index, (chunk, task_result) in enumerate(zip(chunks, task_results)):
+        if isinstance(task_result, Exception):
+            errors.append({
+                "chunk_index": chunk_index,
+                "keywords": chunk,
+                "error": str(task_result),
+                "status_code": getattr(task_result, "status_code", None)
+            })
+            continue
+        for item in task_result.get("result") or []:
+            keyword = (item.get("keyword_info") or {}).get("keyword") or item.get("keyword") or ""
+            identity = _keyword_identity(keyword)
+            if keyword and identity in seen_items:
+                continue
+            seen_items.add(identity)
+            items.append(item)
+
+    if errors:
+        print(f"[get_keywords_data_chunked] {len(chunks)}チャンク中{len(errors)}チャンクの取得に失敗しました")
+
+    return {
+        "items": items,
+        "errors": errors,
+        "requested": len(unique_keywords),
+        "chunks": len(chunks)
+    }
 
 
 async def generate_meta_tags(
@@ -295,21 +712,9 @@ async def generate_meta_tags(
     Returns:
         メタタイトルとメタディスクリプションの辞書
     """
-    config = get_dataforseo_config(user_id) if user_id else None
-    
-    if not config:
-        login = os.getenv("DATAFORSEO_LOGIN")
-        password = os.getenv("DATAFORSEO_PASSWORD")
-        if not login or not password:
-            raise ValueError("DataForSEO設定が完了していません。")
-        config = {"login": login, "password": password}
-    
-    url = "https://api.dataforseo.com/v3/content_generation/generate_meta_tags/live"
+    config = resolve_dataforseo_config(user_id, "DataForSEO設定が完了していません。")
     
-    headers = {
-        "Authorization": _get_auth_header(config["login"], config["password"]),
-        "Content-Type": "application/json"
-    }
+    url = dataforseo_url("/v3/content_generation/generate_meta_tags/live")
     
     payload = [{
         "text": content[:5000],  # 最大5000文字
@@ -318,44 +723,16 @@ async def generate_meta_tags(
         "meta_description_max_length": 160
     }]
     
-    try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            
-            result = response.json()
-            if result.get("tasks") and len(result["tasks"]) > 0:
-                task = result["tasks"][0]
-                status_code = task.get("status_code")
-                
-                # エラーステータスコードをチェック
-                if status_code == 20000:
-                    task_result = task.get("result", [{}])[0] if task.get("result") else {}
-                    return {
-                        "meta_title": task_result.get("meta_title", ""),
-                        "meta_description": task_result.get("meta_description", "")
-                    }
-                else:
-                    status_message = task.get("status_message", "Unknown error")
-                    error_message = f"DataForSEO Content Generation API エラー (status_code: {status_code}): {status_message}"
-                    
-                    # Payment Requiredエラーの場合
-                    if status_code == 40200:
-                        error_message = f"DataForSEO Content Generation APIへのアクセス権限がありません（Payment Required）。DataForSEOアカウントに残高があるか確認してください。"
-                    
-                    raise Exception(error_message)
-            
-            # タスクが存在しない場合
-            raise Exception("DataForSEO Content Generation API: レスポンスにタスクが含まれていません")
-    except httpx.HTTPStatusError as e:
-        error_message = f"DataForSEO Content Generation API HTTPエラー: {e.response.status_code} - {e.response.text[:500]}"
-        raise Exception(error_message)
-    except httpx.RequestError as e:
-        error_message = f"DataForSEO Content Generation API リクエストエラー: {str(e)}"
-        raise Exception(error_message)
-    except Exception as e:
-        # 既にExceptionの場合はそのまま再スロー
-        raise
+    task = await _post_live(
+        url, payload, config, timeout=60.0,
+        api_name="DataForSEO Content Generation API",
+        payment_required_message="DataForSEO Content Generation APIへのアクセス権限がありません（Payment Required）。DataForSEOアカウントに残高があるか確認してください。"
+    )
+    task_result = task.get("result", [{}])[0] if task.get("result") else {}
+    return {
+        "meta_title": task_result.get("meta_title", ""),
+        "meta_description": task_result.get("meta_description", "")
+    }
 
 
 async def generate_subtopics(
@@ -372,63 +749,23 @@ async def generate_subtopics(
     Returns:
         サブトピックのリスト（最大10個）
     """
-    config = get_dataforseo_config(user_id) if user_id else None
-    
-    if not config:
-        login = os.getenv("DATAFORSEO_LOGIN")
-        password = os.getenv("DATAFORSEO_PASSWORD")
-        if not login or not password:
-            raise ValueError("DataForSEO設定が完了していません。")
-        config = {"login": login, "password": password}
+    config = resolve_dataforseo_config(user_id, "DataForSEO設定が完了していません。")
     
-    url = "https://api.dataforseo.com/v3/content_generation/generate_subtopics/live"
-    
-    headers = {
-        "Authorization": _get_auth_header(config["login"], config["password"]),
-        "Content-Type": "application/json"
-    }
+    url = dataforseo_url("/v3/content_generation/generate_subtopics/live")
     
     payload = [{
         "keyword": keyword,
         "limit": 10
     }]
     
-    try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            
-            result = response.json()
-            if result.get("tasks") and len(result["tasks"]) > 0:
-                task = result["tasks"][0]
-                status_code = task.get("status_code")
-                
-                # エラーステータスコードをチェック
-                if status_code == 20000:
-                    task_result = task.get("result", [{}])[0] if task.get("result") else {}
-                    subtopics = task_result.get("subtopics", [])
-                    return [st.get("subtopic", "") for st in subtopics if st.get("subtopic")]
-                else:
-                    status_message = task.get("status_message", "Unknown error")
-                    error_message = f"DataForSEO Content Generation API エラー (status_code: {status_code}): {status_message}"
-                    
-                    # Payment Requiredエラーの場合
-                    if status_code == 40200:
-                        error_message = f"DataForSEO Content Generation APIへのアクセス権限がありません（Payment Required）。DataForSEOアカウントに残高があるか確認してください。"
-                    
-                    raise Exception(error_message)
-            
-            # タスクが存在しない場合
-            raise Exception("DataForSEO Content Generation API: レスポンスにタスクが含まれていません")
-    except httpx.HTTPStatusError as e:
-        error_message = f"DataForSEO Content Generation API HTTPエラー: {e.response.status_code} - {e.response.text[:500]}"
-        raise Exception(error_message)
-    except httpx.RequestError as e:
-        error_message = f"DataForSEO Content Generation API リクエストエラー: {str(e)}"
-        raise Exception(error_message)
-    except Exception as e:
-        # 既にExceptionの場合はそのまま再スロー
-        raise
+    task = await _post_live(
+        url, payload, config, timeout=60.0,
+        api_name="DataForSEO Content Generation API",
+        payment_required_message="DataForSEO Content Generation APIへのアクセス権限がありません（Payment Required）。DataForSEOアカウントに残高があるか確認してください。"
+    )
+    task_result = task.get("result", [{}])[0] if task.get("result") else {}
+    subtopics = task_result.get("subtopics", [])
+    return [st.get("subtopic", "") for st in subtopics if st.get("subtopic")]
 
 
 def generate_related_keywords_with_openai(
@@ -476,17 +813,23 @@ def generate_related_keywords_with_openai(
 """
     
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "あなたはSEO専門家です。関連キーワードを生成してください。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000
-        )
+        messages = [
+            {"role": "system", "content": "あなたはSEO専門家です。関連キーワードを生成してください。"},
+            {"role": "user", "content": prompt}
+        ]
+        config = {"temperature": 0.7, "max_tokens": 2000}
+        
+        def call() -> str:
+            started = time.perf_counter()
+            response = openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                **config
+            )
+            record_llm_call("openai", "gpt-4o", "related_keywords", started, response)
+            return response.choices[0].message.content.strip()
         
-        text = response.choices[0].message.content.strip()
+        text = cached_llm_text("openai", "gpt-4o", "related_keywords", messages, config, call)
         
         # 番号付きリストからキーワードを抽出
         keywords = []
@@ -599,6 +942,27 @@ def get_best_keywords(
     return scored_keywords[:top_n]
 
 
+def keyword_data_from_scored(scored_keyword: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    スコアリング済みキーワード（analyzed_keywordsの要素）をDataForSEOのキーワードデータ形式に戻す
+    キーワード分析で取得済みのデータを記事生成で再利用するために使用
+
+    Args:
+        scored_keyword: score_keywordsの戻り値の要素
+
+    Returns:
+        {"keyword_info": {keyword, search_volume, competition_index, cpc}}
+    """
+    return {
+        "keyword_info": {
+            "keyword": scored_keyword.get("keyword", ""),
+            "search_volume": scored_keyword.get("search_volume", 0),
+            "competition_index": scored_keyword.get("competition_index", 100),
+            "cpc": scored_keyword.get("cpc", 0),
+        }
+    }
+
+
 def analyze_serp_structure(serp_data: Dict[str, Any]) -> Dict[str, Any]:
     """
     SERPデータから見出し構造、共通パターン、FAQを分析
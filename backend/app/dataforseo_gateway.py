@@ -0,0 +1,179 @@
+"""
+分析ルーター用のDataForSEO非同期ゲートウェイ
+キーワードデータ・SERP分析・Domain Analytics・DataForSEO Labs・統合分析の各ルーターから共通で使う
+認証情報の解決、コネクションプール、レート制御・再試行、キャッシュ、同一リクエストの合流をまとめ、
+イベントループをブロックせずにDataForSEOを呼び出す
+"""
+import asyncio
+import json
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import httpx
+from fastapi import HTTPException, status
+
+from app.dataforseo_cache import endpoint_path, get_cached_response, make_inflight_key, store_response
+from app.dataforseo_client import resolve_dataforseo_config
+from app.dataforseo_throttle import send_with_retry
+from app.dataforseo_transport import build_auth_headers, get_dataforseo_http_client
+from app.singleflight import SingleFlight
+
+
+# 同一エンドポイント・同一ペイロードの同時リクエストを1回の呼び出しにまとめる
+_inflight = SingleFlight()
+
+Payload = Union[str, List[Dict[str, Any]]]
+
+
+def resolve_router_config(
+    user_id: Optional[str],
+    missing_detail: str = "DataForSEO設定が完了していません。設定ページでDataForSEO情報を登録してください。"
+) -> Dict[str, str]:
+    """
+    ユーザー設定、なければ環境変数からDataForSEO認証情報を取得（resolve_dataforseo_configのルーター用）
+
+    Raises:
+        HTTPException: どちらにも認証情報がない場合（400）
+    """
+    try:
+        return resolve_dataforseo_config(user_id, missing_detail)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
+def _as_payload_list(payload: Payload) -> List[Dict[str, Any]]:
+    return json.loads(payload) if isinstance(payload, str) else payload
+
+
+def _build_response(
+    url: str,
+    status_code: int,
+    content: bytes,
+    headers: Dict[str, str]
+) -> httpx.Response:
+    return httpx.Response(
+        status_code,
+        content=content,
+        headers=headers,
+        request=httpx.Request("POST", url)
+    )
+
+
+async def _send(
+    url: str,
+    payload_list: List[Dict[str, Any]],
+    config: Dict[str, str],
+    timeout: float
+) -> Tuple[int, bytes, Dict[str, str]]:
+    """上流にPOSTし、合流した呼び出し側にも渡せるよう(ステータス, 本文, ヘッダー)で返す"""
+    cached = get_cached_response(url, payload_list)
+    if cached is not None:
+        return 200, json.dumps(cached, ensure_ascii=False).encode("utf-8"), {
+            "Content-Type": "application/json",
+            "X-Cache": "HIT"
+        }
+
+    client = get_dataforseo_http_client(config["login"])
+    headers = build_auth_headers(config)
+    response = await send_with_retry(
+        lambda remaining: client.post(url, json=payload_list, headers=headers, timeout=remaining),
+        login=config["login"],
+        timeout=timeout,
+        api_name=endpoint_path(url),
+        endpoint=endpoint_path(url)
+    )
+    if response.status_code == 200:
+        try:
+            store_response(url, payload_list, response.json())
+        except ValueError:
+            pass
+    return response.status_code, response.content, {
+        "Content-Type": response.headers.get("Content-Type", "application/json")
+    }
+
+
+async def post_dataforseo(
+    url: str,
+    payload: Payload,
+    config: Dict[str, str],
+    timeout: float = 120.0
+) -> httpx.Response:
+    """
+    DataForSEOにPOSTしてレスポンスを返す（requests.postの非同期版）
+
+    Args:
+        url: エンドポイントURL
+        payload: リクエストボディ（JSON文字列またはタスクのリスト）
+        config: 認証情報
+        timeout: 再試行を含めたタイムアウト秒数
+
+    Returns:
+        httpx.Response（キャッシュヒット時はX-Cache: HITヘッダー付き）
+    """
+    payload_list = _as_payload_list(payload)
+    status_code, content, headers = await _inflight.do(
+        make_inflight_key(config["login"], url, payload_list),
+        lambda: _send(url, payload_list, config, timeout)
+    )
+    return _build_response(url, status_code, content, headers)
+
+
+async def post_dataforseo_many(
+    requests_list: List[Tuple[str, Payload]],
+    config: Dict[str, str],
+    timeout: float = 120.0
+) -> List[Union[httpx.Response, Exception]]:
+    """
+    互いに独立した複数のリクエストを並行して送信
+
+    Returns:
+        requests_listと同じ順序のレスポンス（失敗したものは例外）
+    """
+    return await asyncio.gather(
+        *(post_dataforseo(url, payload, config, timeout) for url, payload in requests_list),
+        return_exceptions=True
+    )
+
+
+def router_result(
+    url: str,
+    payload: str,
+    headers: Dict[str, str],
+    response: httpx.Response
+) -> Dict[str, Any]:
+    """ルーターが返す結果の形式（url, payload, headers, response_text, http_status_code, response_json）"""
+    result = {
+        "url": url,
+        "payload": payload,
+        "headers": dict(headers),
+        "response_text": response.text,
+        "http_status_code": response.status_code,
+    }
+    try:
+        result["response_json"] = response.json()
+    except ValueError:
+        pass
+    return result
+
+
+def router_error_result(url: str, payload: str, error: Exception) -> Dict[str, Any]:
+    """呼び出しに失敗した場合の結果の形式"""
+    return {
+        "url": url,
+        "payload": payload,
+        "error": describe_error(error),
+        "http_status_code": None,
+        "response_text": None,
+        "response_json": None
+    }
+
+
+def describe_error(error: Exception) -> str:
+    """httpxの例外をエラーメッセージに変換"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"HTTPエラー: {error.response.status_code} - {error.response.text[:500]}"
+    if isinstance(error, httpx.RequestError):
+        return f"リクエストエラー: {str(error)}"
+    return str(error)
@@ -0,0 +1,382 @@
+"""
+DataForSEO オフラインスタンドイン
+api/ 以下に記録済みの実レスポンス（url, payload, response_text）をエンドポイントのパスごとに読み込み、
+DataForSEOの代わりに返す。応答遅延・揺らぎ・エラー（40200、HTTP 429、タイムアウト）を注入でき、
+実APIのクレジットを使わずにパイプラインの負荷試験・ベンチマークを行うために使う
+
+使い方:
+    プロセス内: DATAFORSEO_STANDIN=true を設定すると、共有HTTPクライアントがモックトランスポートを使う
+    別プロセス: uvicorn app.dataforseo_standin:app --port 8100 で起動し、
+               DATAFORSEO_BASE_URL=http://localhost:8100 を設定する
+認証情報の確認は行わないが、呼び出し側の設定チェックを通すためにダミーのログインは必要
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import uuid
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, Request, Response
+
+from app.config import settings
+from app.dataforseo_cache import endpoint_path
+
+
+# リポジトリ直下のapi/（各APIのサンプル実行結果が保存されている）
+DEFAULT_FIXTURES_DIR = Path(__file__).resolve().parents[2] / "api"
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# 記録が無いエンドポイントで返す検索ボリューム系の項目を合成するエンドポイント
+_KEYWORD_METRIC_PATHS = (
+    "/keywords_for_keywords/live",
+    "/search_volume/live",
+    "/bulk_keyword_difficulty/live",
+)
+
+
+class StandInTimeout(Exception):
+    """タイムアウトを注入したリクエスト"""
+
+
+def _canonical_path(path: str) -> str:
+    """/advanced/live と /live/advanced のような語順の違いを同一視する"""
+    return re.sub(r"/(advanced|regular|html)/live$", r"/live/\1", path.rstrip("/"))
+
+
+def _as_task_list(payload: Any) -> List[Dict[str, Any]]:
+    if isinstance(payload, (str, bytes)):
+        try:
+            payload = json.loads(payload) if payload else []
+        except ValueError:
+            return []
+    if isinstance(payload, dict):
+        return [payload]
+    return [task for task in payload or [] if isinstance(task, dict)]
+
+
+def load_fixtures(root: Path) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    記録済みレスポンスをエンドポイントのパスごとに読み込む
+
+    Args:
+        root: 記録ファイル（*.json）を探すディレクトリ
+
+    Returns:
+        パス -> [{"payload": タスクのリスト, "body": レスポンスボディ}] の辞書
+    """
+    fixtures: Dict[str, List[Dict[str, Any]]] = {}
+    for file in sorted(root.rglob("*.json")):
+        try:
+            data = json.loads(file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        records = data if isinstance(data, list) else [data]
+        for record in records:
+            if not isinstance(record, dict) or not record.get("url") or not record.get("response_text"):
+                continue
+            if record.get("http_status_code") not in (None, 200):
+                continue
+            fixtures.setdefault(_canonical_path(endpoint_path(record["url"])), []).append({
+                "payload": _as_task_list(record.get("payload")),
+                "body": record["response_text"].encode("utf-8"),
+            })
+    return fixtures
+
+
+def _task_identity(task: Dict[str, Any]) -> str:
+    """記録とリクエストを突き合わせるためのキー（keyword / keywords / target）"""
+    for field in ("keyword", "keywords", "target", "targets"):
+        if task.get(field):
+            return json.dumps(task[field], ensure_ascii=False, sort_keys=True)
+    return ""
+
+
+def _stable_number(text: str, low: int, high: int) -> int:
+    """同じ入力には常に同じ値を返す疑似乱数"""
+    return low + zlib.crc32(text.encode("utf-8")) % (high - low + 1)
+
+
+def _keyword_metrics(keyword: str) -> Dict[str, Any]:
+    volume = _stable_number(keyword, 0, 20000)
+    competition_index = _stable_number(keyword + ":competition", 0, 100)
+    info = {
+        "keyword": keyword,
+        "search_volume": volume,
+        "competition": round(competition_index / 100, 2),
+        "competition_index": competition_index,
+        "cpc": round(_stable_number(keyword + ":cpc", 0, 500) / 100, 2),
+    }
+    return dict(info, keyword_info=info, keyword_difficulty=_stable_number(keyword + ":difficulty", 0, 100))
+
+
+def _synthesize_result(path: str, task: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """記録が無いエンドポイントのresultを、呼び出し側が読むフィールドだけ合成する"""
+    if path.endswith(_KEYWORD_METRIC_PATHS):
+        keywords = task.get("keywords") or ([task["keyword"]] if task.get("keyword") else [])
+        return [_keyword_metrics(str(keyword)) for keyword in keywords]
+    if path.endswith("/generate_meta_tags/live"):
+        return [{
+            "meta_title": str(task.get("title", ""))[:task.get("meta_title_max_length", 60)],
+            "meta_description": str(task.get("text", ""))[:task.get("meta_description_max_length", 160)],
+        }]
+    if path.endswith("/generate_subtopics/live"):
+        keyword = str(task.get("keyword", ""))
+        return [{"subtopics": [{"subtopic": f"{keyword} {index + 1}"} for index in range(task.get("limit", 10))]}]
+    return []
+
+
+def _envelope(tasks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "version": "0.1.standin",
+        "status_code": 20000,
+        "status_message": "Ok.",
+        "time": "0 sec.",
+        "cost": round(sum(task.get("cost") or 0 for task in tasks), 6),
+        "tasks_count": len(tasks),
+        "tasks_error": sum(1 for task in tasks if task.get("status_code") != 20000),
+        "tasks": tasks,
+    }
+
+
+def _task_shell(path: str, task: Dict[str, Any], status_code: int = 20000, status_message: str = "Ok.") -> Dict[str, Any]:
+    return {
+        "id": str(uuid.uuid4()),
+        "status_code": status_code,
+        "status_message": status_message,
+        "time": "0 sec.",
+        "cost": 0,
+        "result_count": 0,
+        "path": path.strip("/").split("/"),
+        "data": task,
+        "result": None,
+    }
+
+
+class DataForSEOStandIn:
+    """記録済みレスポンスを返すDataForSEOの代替"""
+
+    def __init__(
+        self,
+        fixtures_dir: Optional[Path] = None,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        payment_error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        timeout_seconds: float = 5.0,
+        seed: Optional[int] = None
+    ):
+        self.fixtures_dir = Path(fixtures_dir or DEFAULT_FIXTURES_DIR)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.payment_error_rate = payment_error_rate
+        self.throttle_rate = throttle_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self._random = random.Random(seed)
+        self._fixtures: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        # task_postで登録されたタスク: タスクID -> (エンドポイントの接頭辞, タスク)
+        self._queued: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "DataForSEOStandIn":
+        """環境変数（Settings）の値で作成"""
+        return cls(
+            fixtures_dir=Path(settings.dataforseo_standin_fixtures_dir) if settings.dataforseo_standin_fixtures_dir else None,
+            latency_ms=settings.dataforseo_standin_latency_ms,
+            jitter_ms=settings.dataforseo_standin_jitter_ms,
+            payment_error_rate=settings.dataforseo_standin_payment_error_rate,
+            throttle_rate=settings.dataforseo_standin_throttle_rate,
+            timeout_rate=settings.dataforseo_standin_timeout_rate,
+            timeout_seconds=settings.dataforseo_standin_timeout_seconds,
+        )
+
+    @property
+    def fixtures(self) -> Dict[str, List[Dict[str, Any]]]:
+        with self._lock:
+            if self._fixtures is None:
+                self._fixtures = load_fixtures(self.fixtures_dir)
+                print(f"[dataforseo_standin] {len(self._fixtures)}エンドポイントの記録を読み込みました: {self.fixtures_dir}")
+            return self._fixtures
+
+    async def _delay(self) -> None:
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        seconds = max(0.0, self.latency_ms + jitter) / 1000
+        if seconds:
+            await asyncio.sleep(seconds)
+
+    def _roll(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def _pick_fixture(self, path: str, tasks: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """リクエストと同じキーワードの記録、なければペイロードから決まる記録を選ぶ"""
+        candidates = self.fixtures.get(path)
+        if not candidates:
+            return None
+        identity = _task_identity(tasks[0]) if tasks else ""
+        for candidate in candidates:
+            if candidate["payload"] and _task_identity(candidate["payload"][0]) == identity:
+                return candidate
+        key = json.dumps(tasks, ensure_ascii=False, sort_keys=True)
+        return candidates[zlib.crc32(key.encode("utf-8")) % len(candidates)]
+
+    def _live_tasks(self, path: str, tasks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """liveエンドポイントのタスク（記録があれば記録のタスクを、なければ合成したタスク）"""
+        fixture = self._pick_fixture(path, tasks)
+        template = None
+        if fixture is not None:
+            recorded = json.loads(fixture["body"]).get("tasks") or []
+            template = recorded[0] if recorded else None
+        results = []
+        for task in tasks or [{}]:
+            if template is not None:
+                results.append(dict(template, id=str(uuid.uuid4()), data=task))
+                continue
+            synthesized = _task_shell(path, task)
+            synthesized["result"] = _synthesize_result(path, task)
+            synthesized["result_count"] = len(synthesized["result"])
+            results.append(synthesized)
+        return results
+
+    def _live_body(self, path: str, tasks: List[Dict[str, Any]]) -> bytes:
+        fixture = self._pick_fixture(path, tasks)
+        if fixture is not None and len(fixture["payload"]) == len(tasks) == 1:
+            # 1タスクのリクエストは記録をそのまま返す（パースしない分、実APIの転送量に近い）
+            return fixture["body"]
+        return json.dumps(_envelope(self._live_tasks(path, tasks)), ensure_ascii=False).encode("utf-8")
+
+    def _live_path_for(self, prefix: str) -> str:
+        """標準キューのエンドポイント接頭辞に対応するliveのパス"""
+        advanced = f"{prefix}/live/advanced"
+        return advanced if advanced in self.fixtures else f"{prefix}/live"
+
+    def _task_post(self, path: str, tasks: List[Dict[str, Any]]) -> bytes:
+        prefix = path[:-len("/task_post")]
+        created = []
+        for task in tasks:
+            shell = _task_shell(path, task, status_code=20100, status_message="Task Created.")
+            with self._lock:
+                self._queued[shell["id"]] = (prefix, task)
+            created.append(shell)
+        return json.dumps(_envelope(created), ensure_ascii=False).encode("utf-8")
+
+    def _tasks_ready(self, path: str) -> bytes:
+        prefix = path[:-len("/tasks_ready")]
+        with self._lock:
+            ready = [{"id": task_id} for task_id, (task_prefix, _) in self._queued.items() if task_prefix == prefix]
+        task = _task_shell(path, {})
+        task["result"] = ready
+        task["result_count"] = len(ready)
+        return json.dumps(_envelope([task]), ensure_ascii=False).encode("utf-8")
+
+    def _task_get(self, path: str) -> Tuple[int, bytes]:
+        prefix, _, remainder = path.partition("/task_get")
+        task_id = remainder.rsplit("/", 1)[-1]
+        with self._lock:
+            queued = self._queued.pop(task_id, None)
+        if queued is None:
+            task = _task_shell(path, {}, status_code=40400, status_message="Not Found.")
+            return 200, json.dumps(_envelope([task]), ensure_ascii=False).encode("utf-8")
+        task = self._live_tasks(self._live_path_for(prefix), [queued[1]])[0]
+        task["id"] = task_id
+        return 200, json.dumps(_envelope([task]), ensure_ascii=False).encode("utf-8")
+
+    def _payment_required(self, path: str, tasks: List[Dict[str, Any]]) -> bytes:
+        failed = [_task_shell(path, task, status_code=40200, status_message="Payment Required.") for task in tasks or [{}]]
+        return json.dumps(_envelope(failed), ensure_ascii=False).encode("utf-8")
+
+    async def respond(self, method: str, path: str, body: bytes) -> Tuple[int, bytes, Dict[str, str]]:
+        """
+        1リクエスト分の応答を生成
+
+        Args:
+            method: HTTPメソッド
+            path: リクエストのパス
+            body: リクエストボディ
+
+        Returns:
+            (HTTPステータス, レスポンスボディ, レスポンスヘッダー)
+
+        Raises:
+            StandInTimeout: タイムアウトを注入した場合
+        """
+        await self._delay()
+        path = _canonical_path(path)
+        tasks = _as_task_list(body) if method.upper() == "POST" else []
+
+        roll = self._roll()
+        if roll < self.timeout_rate:
+            raise StandInTimeout(path)
+        roll -= self.timeout_rate
+        if roll < self.throttle_rate:
+            throttled = {"status_code": 40202, "status_message": "Rate limit exceeded.", "tasks": None}
+            return 429, json.dumps(throttled).encode("utf-8"), dict(_JSON_HEADERS, **{"Retry-After": "1"})
+        roll -= self.throttle_rate
+        if roll < self.payment_error_rate and not path.endswith("/tasks_ready") and "/task_get" not in path:
+            return 200, self._payment_required(path, tasks), _JSON_HEADERS
+
+        if path.endswith("/task_post"):
+            return 200, self._task_post(path, tasks), _JSON_HEADERS
+        if path.endswith("/tasks_ready"):
+            return 200, self._tasks_ready(path), _JSON_HEADERS
+        if "/task_get/" in path:
+            status_code, content = self._task_get(path)
+            return status_code, content, _JSON_HEADERS
+        return 200, self._live_body(path, tasks), _JSON_HEADERS
+
+    async def _handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        try:
+            status_code, content, headers = await self.respond(request.method, request.url.path, body)
+        except StandInTimeout:
+            read_timeout = (request.extensions.get("timeout") or {}).get("read")
+            wait = self.timeout_seconds if read_timeout is None else min(self.timeout_seconds, read_timeout)
+            await asyncio.sleep(wait)
+            raise httpx.ReadTimeout("DataForSEOスタンドイン: タイムアウトを注入しました", request=request)
+        return httpx.Response(status_code, content=content, headers=headers, request=request)
+
+    def transport(self) -> httpx.MockTransport:
+        """httpx.AsyncClientに渡すモックトランスポート"""
+        return httpx.MockTransport(self._handle_request)
+
+
+_standin: Optional[DataForSEOStandIn] = None
+_standin_lock = threading.Lock()
+
+
+def get_standin() -> DataForSEOStandIn:
+    """プロセス共通のスタンドインを取得（記録の読み込みは最初のリクエスト時）"""
+    global _standin
+    with _standin_lock:
+        if _standin is None:
+            _standin = DataForSEOStandIn.from_settings()
+        return _standin
+
+
+def create_standin_app(standin: Optional[DataForSEOStandIn] = None) -> FastAPI:
+    """スタンドインをHTTPサーバーとして公開するFastAPIアプリを作成"""
+    standin_app = FastAPI(title="DataForSEO Stand-in")
+
+    @standin_app.api_route("/{path:path}", methods=["GET", "POST"])
+    async def handle(path: str, request: Request):
+        target = standin or get_standin()
+        try:
+            status_code, content, headers = await target.respond(request.method, "/" + path, await request.body())
+        except StandInTimeout:
+            await asyncio.sleep(target.timeout_seconds)
+            return Response(status_code=504, content=b"", media_type="application/json")
+        return Response(status_code=status_code, content=content, headers=headers)
+
+    return standin_app
+
+
+app = create_standin_app()
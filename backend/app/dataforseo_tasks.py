@@ -0,0 +1,321 @@
+"""
+DataForSEO 標準キュー（task_post / tasks_ready / task_get）パイプライン
+インタラクティブな結果が不要な一括処理向けに、liveエンドポイントの代わりに
+task_postでタスクを登録し、バックグラウンドのポーラーがtasks_readyを監視して
+完了したタスクの結果をキャッシュに保存し、待機中の呼び出し側に通知する
+"""
+import asyncio
+import concurrent.futures
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.config import settings
+from app.dataforseo_cache import store_response
+from app.dataforseo_throttle import get_rate_limiter, send_with_retry
+from app.dataforseo_transport import (
+    build_auth_headers,
+    dataforseo_url,
+    get_dataforseo_http_client,
+    projected_json,
+    send_projected,
+)
+from app.metrics import record_dataforseo_call
+from app.serp_parser import SERP_RESPONSE_PROJECTION
+
+
+# キュー対応エンドポイント（liveはキャッシュキーをlive呼び出しと共有するために使用）
+TASK_ENDPOINTS = {
+    "serp_organic": {
+        "task_post": "/v3/serp/google/organic/task_post",
+        "tasks_ready": "/v3/serp/google/organic/tasks_ready",
+        "task_get": "/v3/serp/google/organic/task_get/advanced/{task_id}",
+        "live": "/v3/serp/google/organic/advanced/live",
+        "projection": SERP_RESPONSE_PROJECTION,
+    },
+    "google_ads_search_volume": {
+        "task_post": "/v3/keywords_data/google_ads/search_volume/task_post",
+        "tasks_ready": "/v3/keywords_data/google_ads/search_volume/tasks_ready",
+        "task_get": "/v3/keywords_data/google_ads/search_volume/task_get/{task_id}",
+        "live": "/v3/keywords_data/google_ads/search_volume/live",
+    },
+}
+
+# task_postの成功ステータス（Task Created）
+TASK_CREATED = 20100
+
+
+class _PendingTask:
+    """登録済みで結果待ちのタスク"""
+
+    def __init__(self, family: str, config: Dict[str, str], payload: Dict[str, Any], deadline: float):
+        self.family = family
+        self.config = config
+        self.payload = payload
+        self.deadline = deadline
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+
+
+class DataForSEOTaskQueue:
+    """task_postで登録したタスクをtasks_readyでまとめて監視するキュー"""
+
+    def __init__(self, poll_interval: float = 5.0):
+        self.poll_interval = poll_interval
+        self._pending: Dict[str, _PendingTask] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def pending_count(self) -> int:
+        """結果待ちのタスク数"""
+        with self._lock:
+            return len(self._pending)
+
+    async def submit_many(
+        self,
+        family: str,
+        payloads: List[Dict[str, Any]],
+        config: Dict[str, str],
+        timeout: float
+    ) -> List[concurrent.futures.Future]:
+        """
+        タスクをtask_postで登録（1リクエスト最大100タスク）
+
+        Args:
+            family: TASK_ENDPOINTSのキー
+            payloads: タスクのリスト
+            config: 認証情報
+            timeout: 結果を待つ最大秒数
+
+        Returns:
+            payloadsと同じ順序のFutureのリスト。結果はタスク辞書（status_codeを確認すること）
+        """
+        endpoints = TASK_ENDPOINTS[family]
+        client = get_dataforseo_http_client(config["login"])
+        deadline = time.monotonic() + timeout
+        futures: List[concurrent.futures.Future] = []
+        # この呼び出しで登録したタスク（途中のチャンクで失敗した場合に監視対象から外す）
+        registered: List[str] = []
+
+        try:
+            for start in range(0, len(payloads), 100):
+                chunk = payloads[start:start + 100]
+                # task_postは再送するとタスクが二重に登録されるため、レート制御のみ行う
+                if not await get_rate_limiter(config["login"]).acquire(deadline):
+                    raise httpx.TimeoutException("DataForSEO task_post: レート制限の待機中にタイムアウトしました")
+                started = time.monotonic()
+                response = await client.post(
+                    dataforseo_url(endpoints['task_post']),
+                    json=chunk,
+                    headers=build_auth_headers(config),
+                    timeout=60.0
+                )
+                response.raise_for_status()
+                response_json = response.json()
+                # 標準キューの料金はtask_post時に発生する
+                record_dataforseo_call(
+                    endpoints["task_post"],
+                    time.monotonic() - started,
+                    response_bytes=len(response.content),
+                    cost=response_json.get("cost"),
+                    status=response.status_code
+                )
+                tasks = response_json.get("tasks") or []
+
+                for position, payload in enumerate(chunk):
+                    pending = _PendingTask(family, config, payload, deadline)
+                    futures.append(pending.future)
+                    task = tasks[position] if position < len(tasks) else {
+                        "status_code": None,
+                        "status_message": "レスポンスにタスクが含まれていません"
+                    }
+                    if task.get("status_code") != TASK_CREATED or not task.get("id"):
+                        # 登録自体が失敗したタスクはそのまま返す
+                        pending.future.set_result(task)
+                        continue
+                    with self._lock:
+                        self._pending[task["id"]] = pending
+                    registered.append(task["id"])
+        except BaseException:
+            # 呼び出し側には例外だけが返り、登録済みのFutureは誰も待たないため監視をやめる
+            with self._lock:
+                abandoned = [self._pending.pop(task_id, None) for task_id in registered]
+            for pending in abandoned:
+                if pending is not None:
+                    pending.future.cancel()
+            if registered:
+                print(f"[dataforseo_tasks] task_post の途中で失敗したため、登録済みの{len(registered)}タスクの監視を中止します")
+            raise
+
+        self._ensure_poller()
+        return futures
+
+    async def submit(
+        self,
+        family: str,
+        payload: Dict[str, Any],
+        config: Dict[str, str],
+        timeout: float
+    ) -> Dict[str, Any]:
+        """1タスクを登録し、完了まで待ってタスク辞書を返す"""
+        futures = await self.submit_many(family, [payload], config, timeout)
+        return await asyncio.shield(asyncio.wrap_future(futures[0]))
+
+    def _ensure_poller(self) -> None:
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run_poller, name="dataforseo-task-poller", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """ポーラーを停止（結果待ちのタスクはキャンセル）"""
+        self._stop_event.set()
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for task in pending:
+            task.future.cancel()
+
+    def _run_poller(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            while not self._stop_event.is_set():
+                if self.pending_count() == 0:
+                    break
+                try:
+                    loop.run_until_complete(self._poll_once())
+                except Exception as e:
+                    print(f"[dataforseo_tasks] ポーリングエラー: {str(e)}")
+                self._stop_event.wait(self.poll_interval)
+        finally:
+            loop.close()
+            with self._lock:
+                self._thread = None
+            # 停止処理中に新しいタスクが登録された場合は再起動
+            if self.pending_count() > 0 and not self._stop_event.is_set():
+                self._ensure_poller()
+
+    async def _poll_once(self) -> None:
+        self._expire_overdue()
+        with self._lock:
+            groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+            for task_id, pending in self._pending.items():
+                group = groups.setdefault(
+                    (pending.config["login"], pending.family),
+                    {"config": pending.config, "ids": set()}
+                )
+                group["ids"].add(task_id)
+
+        for (_, family), group in groups.items():
+            ready_ids = await self._fetch_ready_ids(family, group["config"])
+            for task_id in ready_ids & group["ids"]:
+                await self._collect(task_id)
+
+    def _expire_overdue(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [task_id for task_id, pending in self._pending.items() if pending.deadline <= now]
+            expired_tasks = [self._pending.pop(task_id) for task_id in expired]
+        for pending in expired_tasks:
+            if not pending.future.done():
+                pending.future.set_exception(
+                    TimeoutError("DataForSEOタスクの完了待ちがタイムアウトしました")
+                )
+
+    async def _fetch_ready_ids(self, family: str, config: Dict[str, str]) -> set:
+        client = get_dataforseo_http_client(config["login"])
+        response = await send_with_retry(
+            lambda remaining: client.get(
+                dataforseo_url(TASK_ENDPOINTS[family]['tasks_ready']),
+                headers=build_auth_headers(config),
+                timeout=remaining
+            ),
+            login=config["login"],
+            timeout=60.0,
+            api_name="DataForSEO tasks_ready",
+            endpoint=TASK_ENDPOINTS[family]["tasks_ready"]
+        )
+        response.raise_for_status()
+        ready_ids = set()
+        for task in response.json().get("tasks") or []:
+            for item in task.get("result") or []:
+                if item.get("id"):
+                    ready_ids.add(item["id"])
+        return ready_ids
+
+    async def _collect(self, task_id: str) -> None:
+        with self._lock:
+            pending = self._pending.get(task_id)
+        if pending is None:
+            return
+
+        endpoints = TASK_ENDPOINTS[pending.family]
+        client = get_dataforseo_http_client(pending.config["login"])
+        projection = endpoints.get("projection")
+        task_get_url = dataforseo_url(endpoints['task_get'].format(task_id=task_id))
+        try:
+            response = await send_with_retry(
+                lambda remaining: (
+                    send_projected(
+                        client, "GET", task_get_url, projection,
+                        headers=build_auth_headers(pending.config), timeout=remaining
+                    )
+                    if projection else client.get(task_get_url, headers=build_auth_headers(pending.config), timeout=remaining)
+                ),
+                login=pending.config["login"],
+                timeout=120.0,
+                api_name="DataForSEO task_get",
+                endpoint=endpoints["task_get"]
+            )
+            response.raise_for_status()
+            result = projected_json(response, projection) if projection else response.json()
+        except Exception as e:
+            # 取得に失敗した場合は次回のポーリングで再試行
+            print(f"[dataforseo_tasks] task_get エラー: {task_id} - {str(e)}")
+            return
+
+        tasks = result.get("tasks") or []
+        task = tasks[0] if tasks else {
+            "status_code": None,
+            "status_message": "レスポンスにタスクが含まれていません"
+        }
+        if task.get("status_code") == 20000:
+            # live呼び出しと同じキーでキャッシュに保存
+            store_response(
+                dataforseo_url(endpoints['live']),
+                [pending.payload],
+                {"status_code": 20000, "status_message": "Ok.", "tasks_count": 1, "tasks_error": 0, "tasks": [task]}
+            )
+
+        with self._lock:
+            self._pending.pop(task_id, None)
+        if not pending.future.done():
+            pending.future.set_result(task)
+
+
+_queue: Optional[DataForSEOTaskQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_task_queue() -> DataForSEOTaskQueue:
+    """プロセス共通のタスクキューを取得"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = DataForSEOTaskQueue(poll_interval=settings.dataforseo_queue_poll_interval)
+        return _queue
+
+
+def stop_task_queue() -> None:
+    """タスクキューのポーラーを停止（FastAPIのlifespan終了時に呼ぶ）"""
+    with _queue_lock:
+        queue = _queue
+    if queue is not None:
+        queue.stop()
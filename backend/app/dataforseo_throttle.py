@@ -0,0 +1,222 @@
+"""
+DataForSEO レート制御とリトライ
+ログイン（認証情報）ごとのトークンバケットで送信ペースを揃え、
+429やDataForSEOのレート制限コードを受けたら送信レートを下げる（成功が続けば徐々に戻す）
+一時的なエラーはジッター付き指数バックオフで再試行し、呼び出し側のタイムアウトを超えないようにする
+"""
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from app.config import settings
+from app.dataforseo_transport import response_head, response_size
+from app.metrics import record_dataforseo_call
+
+
+# 再試行するHTTPステータス
+RETRYABLE_HTTP_STATUS = {429, 500, 502, 503, 504}
+# 再試行するDataForSEOのステータスコード（40202: レート制限超過、50000: 内部エラー）
+RETRYABLE_API_STATUS = {40202, 50000}
+THROTTLED_API_STATUS = {40202}
+
+# レスポンス先頭のトップレベルstatus_code（全体をパースせずに判定するため）
+_TOP_LEVEL_STATUS = re.compile(rb'"status_code"\s*:\s*(\d+)')
+_TOP_LEVEL_COST = re.compile(rb'"cost"\s*:\s*([0-9.eE+-]+)')
+
+
+class AdaptiveTokenBucket:
+    """制限を受けると半減し、成功ごとに少しずつ戻るトークンバケット"""
+
+    def __init__(self, rate: float, capacity: float, min_rate: float = 0.5):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, deadline: Optional[float] = None) -> bool:
+        """
+        トークンを1つ取得するまで待つ
+
+        Args:
+            deadline: time.monotonic()基準の期限
+
+        Returns:
+            取得できた場合True、期限までに取得できない場合False
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    def on_throttled(self, retry_after: Optional[float] = None) -> None:
+        """レート制限を受けたときに送信レートを下げる"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def on_success(self) -> None:
+        """成功したときに送信レートを少し戻す"""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def snapshot(self) -> Dict[str, float]:
+        """現在のレートと残りトークン"""
+        with self._lock:
+            return {"rate": self.rate, "max_rate": self.max_rate, "tokens": self.tokens}
+
+
+_buckets: Dict[str, AdaptiveTokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(login: str) -> AdaptiveTokenBucket:
+    """ログインごとのトークンバケットを取得（スレッド・イベントループをまたいで共有）"""
+    with _buckets_lock:
+        bucket = _buckets.get(login)
+        if bucket is None:
+            bucket = AdaptiveTokenBucket(
+                rate=settings.dataforseo_rate_limit_per_second,
+                capacity=settings.dataforseo_rate_limit_burst,
+            )
+            _buckets[login] = bucket
+        return bucket
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _api_status(response: httpx.Response) -> Optional[int]:
+    match = _TOP_LEVEL_STATUS.search(response_head(response))
+    return int(match.group(1)) if match else None
+
+
+def _record(response: Optional[httpx.Response], endpoint: str, started: float) -> None:
+    """最終的な結果をメトリクスに記録（再試行・待機時間を含む。成功・失敗とも同じendpointラベル）"""
+    seconds = time.monotonic() - started
+    if response is None:
+        record_dataforseo_call(endpoint, seconds, status="error")
+        return
+    cost_match = _TOP_LEVEL_COST.search(response_head(response))
+    try:
+        cost = float(cost_match.group(1)) if cost_match else None
+    except ValueError:
+        cost = None
+    record_dataforseo_call(
+        endpoint,
+        seconds,
+        response_bytes=response_size(response),
+        cost=cost,
+        status=response.status_code
+    )
+
+
+def _backoff(attempt: int) -> float:
+    """フルジッター付き指数バックオフ"""
+    ceiling = min(settings.dataforseo_retry_backoff_max, settings.dataforseo_retry_backoff_base * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+async def send_with_retry(
+    send: Callable[[float], Awaitable[httpx.Response]],
+    login: str,
+    timeout: float,
+    api_name: str,
+    endpoint: str
+) -> httpx.Response:
+    """
+    レート制御と再試行付きでリクエストを送信
+
+    Args:
+        send: 残り秒数を受け取りレスポンスを返すコルーチン関数（残り秒数を過ぎたらキャンセルする）
+        login: トークンバケットのキーにするログイン
+        timeout: 再試行を含めた全体の期限（秒）
+        api_name: ログに使うAPI名
+        endpoint: メトリクスのendpointラベルにするパス（task_getなどはタスクIDを含まないテンプレート）
+
+    Returns:
+        最後に受け取ったレスポンス（再試行しきれなかったエラーレスポンスを含む）
+    """
+    bucket = get_rate_limiter(login)
+    started = time.monotonic()
+    deadline = started + timeout
+    attempt = 0
+
+    while True:
+        if not await bucket.acquire(deadline):
+            _record(None, endpoint, started)
+            raise httpx.TimeoutException(f"{api_name}: レート制限の待機中にタイムアウトしました")
+        remaining = deadline - time.monotonic()
+
+        error: Optional[httpx.RequestError] = None
+        response: Optional[httpx.Response] = None
+        try:
+            # httpxのtimeoutは接続・読み取りなど操作ごとの上限なので、少しずつ届くレスポンスも全体の期限で打ち切る
+            response = await asyncio.wait_for(send(remaining), remaining)
+        except asyncio.TimeoutError:
+            error = httpx.TimeoutException(f"{api_name}: {timeout}秒の期限内にレスポンスを受信できませんでした")
+        except httpx.RequestError as e:
+            error = e
+
+        retry_after = None
+        api_status = None
+        if response is not None:
+            api_status = _api_status(response) if response.status_code == 200 else None
+            if response.status_code == 429 or api_status in THROTTLED_API_STATUS:
+                retry_after = _retry_after(response)
+                bucket.on_throttled(retry_after)
+            elif response.status_code not in RETRYABLE_HTTP_STATUS and api_status not in RETRYABLE_API_STATUS:
+                bucket.on_success()
+                _record(response, endpoint, started)
+                return response
+
+        delay = max(_backoff(attempt), retry_after or 0)
+        if attempt >= settings.dataforseo_max_retries or time.monotonic() + delay >= deadline:
+            _record(response, endpoint, started)
+            if error is not None:
+                raise error
+            return response
+
+        if error is not None:
+            reason = str(error)
+        elif api_status in RETRYABLE_API_STATUS:
+            reason = f"status_code {api_status}"
+        else:
+            reason = f"HTTP {response.status_code}"
+        print(f"[dataforseo_throttle] {api_name} 再試行 {attempt + 1}/{settings.dataforseo_max_retries}（{delay:.2f}秒後）: {reason}")
+        attempt += 1
+        await asyncio.sleep(delay)
@@ -0,0 +1,206 @@
+"""
+DataForSEO向けの共有HTTPトランスポート
+認証情報ごとにkeep-alive / HTTP/2対応のAsyncClientを保持し、
+呼び出しのたびにTCP・TLSハンドシェイクが発生しないようにする
+射影して読み込むレスポンスは本文を溜めずに受信しながらパースする（send_projected）
+"""
+import asyncio
+import base64
+import threading
+from typing import Any, Dict, Tuple
+
+import httpx
+
+from app.config import settings
+from app.serp_parser import Projection, StreamingProjector, parse_projected
+
+
+DEFAULT_DATAFORSEO_BASE_URL = "https://api.dataforseo.com"
+
+# (イベントループID, ログインID) -> (イベントループ, クライアント)
+# httpxのコネクションは作成したイベントループに紐づくため、ループごとに分けて保持する
+_clients: Dict[Tuple[int, str], Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+_lock = threading.Lock()
+
+
+def _http2_enabled() -> bool:
+    """HTTP/2を使用するか（h2パッケージが無い場合はHTTP/1.1にフォールバック）"""
+    if not settings.dataforseo_http2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def dataforseo_url(path: str) -> str:
+    """
+    設定のベースURLとエンドポイントのパスからURLを組み立てる
+
+    Args:
+        path: エンドポイントのパス（例: /v3/serp/google/organic/advanced/live）
+
+    Returns:
+        リクエスト先のURL
+    """
+    return settings.dataforseo_base_url.rstrip("/") + "/" + path.lstrip("/")
+
+
+def build_auth_headers(config: Dict[str, str]) -> Dict[str, str]:
+    """
+    Basic認証ヘッダーを含むDataForSEOへのリクエストヘッダーを生成
+
+    Args:
+        config: 認証情報（login, password）
+
+    Returns:
+        リクエストヘッダー
+    """
+    credentials = f"{config['login']}:{config['password']}"
+    encoded = base64.b64encode(credentials.encode()).decode()
+    return {
+        "Authorization": f"Basic {encoded}",
+        "Content-Type": "application/json"
+    }
+
+
+def is_standin_target() -> bool:
+    """実APIではなくスタンドイン（モックトランスポートまたは別のベースURL）に向いているか"""
+    return (
+        settings.dataforseo_standin
+        or settings.dataforseo_base_url.rstrip("/") != DEFAULT_DATAFORSEO_BASE_URL
+    )
+
+
+# レスポンスのextensionsに保持する値（send_projectedで受信した場合）
+PROJECTED_EXTENSION = "dataforseo_projected"
+HEAD_EXTENSION = "dataforseo_head"
+BYTES_EXTENSION = "dataforseo_bytes"
+
+# ステータス・costの判定用に残すレスポンス先頭のバイト数
+HEAD_BYTES = 512
+
+
+async def send_projected(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    projection: Projection,
+    **kwargs: Any
+) -> httpx.Response:
+    """
+    リクエストを送信し、200のレスポンス本文を受信しながら射影する
+    本文全体はメモリに保持せず、射影した値・先頭HEAD_BYTESバイト・受信バイト数をextensionsに残す
+    （200以外のレスポンスは通常どおり本文を読み込む）
+
+    Args:
+        client: AsyncClient
+        method: HTTPメソッド
+        url: URL
+        projection: 残すフィールドの指定（serp_parser参照）
+        **kwargs: client.build_requestに渡す引数（json, headers, timeoutなど）
+
+    Returns:
+        httpx.Response（本文はprojected_json・response_head・response_sizeで参照する）
+    """
+    request = client.build_request(method, url, **kwargs)
+    response = await client.send(request, stream=True)
+    try:
+        if response.status_code != 200:
+            await response.aread()
+            return response
+        projector = StreamingProjector(projection)
+        head = b""
+        size = 0
+        async for chunk in response.aiter_bytes():
+            if len(head) < HEAD_BYTES:
+                head += chunk[:HEAD_BYTES - len(head)]
+            size += len(chunk)
+            projector.feed(chunk)
+        response.extensions[PROJECTED_EXTENSION] = projector.close()
+        response.extensions[HEAD_EXTENSION] = head
+        response.extensions[BYTES_EXTENSION] = size
+        return response
+    finally:
+        await response.aclose()
+
+
+def projected_json(response: httpx.Response, projection: Projection) -> Any:
+    """send_projectedで射影済みの値（通常のレスポンスはここで射影する）"""
+    if PROJECTED_EXTENSION in response.extensions:
+        return response.extensions[PROJECTED_EXTENSION]
+    return parse_projected(response.content, projection)
+
+
+def response_head(response: httpx.Response) -> bytes:
+    """レスポンス本文の先頭（send_projectedで受信した場合は受信時に残した部分）"""
+    if HEAD_EXTENSION in response.extensions:
+        return response.extensions[HEAD_EXTENSION]
+    return response.content[:HEAD_BYTES]
+
+
+def response_size(response: httpx.Response) -> int:
+    """レスポンス本文のバイト数"""
+    if BYTES_EXTENSION in response.extensions:
+        return response.extensions[BYTES_EXTENSION]
+    return len(response.content)
+
+
+def _build_client() -> httpx.AsyncClient:
+    if settings.dataforseo_standin:
+        # 循環importを避けるため、スタンドインを使う場合だけ読み込む
+        from app.dataforseo_standin import get_standin
+        return httpx.AsyncClient(transport=get_standin().transport(), timeout=httpx.Timeout(120.0))
+
+    limits = httpx.Limits(
+        max_connections=settings.dataforseo_max_connections,
+        max_keepalive_connections=settings.dataforseo_max_keepalive_connections,
+        keepalive_expiry=settings.dataforseo_keepalive_expiry,
+    )
+    return httpx.AsyncClient(
+        http2=_http2_enabled(),
+        limits=limits,
+        timeout=httpx.Timeout(120.0),
+    )
+
+
+def _prune_closed_loops_locked() -> None:
+    """閉じられたイベントループに紐づくクライアントを破棄（ロック取得済みで呼ぶこと）"""
+    stale_keys = [key for key, (loop, _) in _clients.items() if loop.is_closed()]
+    for key in stale_keys:
+        # ループが閉じているためacloseできない。ソケットはGC時に解放される
+        _clients.pop(key, None)
+
+
+def get_dataforseo_http_client(login: str) -> httpx.AsyncClient:
+    """
+    現在のイベントループと認証情報に対応するプール済みクライアントを取得
+
+    Args:
+        login: DataForSEOのログインID（認証情報ごとにプールを分ける）
+
+    Returns:
+        再利用可能なhttpx.AsyncClient（呼び出し側でcloseしないこと）
+    """
+    loop = asyncio.get_running_loop()
+    key = (id(loop), login)
+    with _lock:
+        _prune_closed_loops_locked()
+        entry = _clients.get(key)
+        if entry and entry[0] is loop and not entry[1].is_closed:
+            return entry[1]
+        client = _build_client()
+        _clients[key] = (loop, client)
+        return client
+
+
+async def close_dataforseo_http_clients() -> None:
+    """現在のイベントループに紐づくクライアントを全てクローズ（FastAPIのlifespan終了時に呼ぶ）"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        _prune_closed_loops_locked()
+        keys = [key for key, (client_loop, _) in _clients.items() if client_loop is loop]
+        clients = [_clients.pop(key)[1] for key in keys]
+    for client in clients:
+        await client.aclose()
@@ -0,0 +1,187 @@
+"""
+記事への画像の配置（ローカル・決定的）
+記事の見出し構造を解析し、画像のalt_textと各セクションの見出し・本文の重なりから配置先を決めて
+![alt](URL) を挿入する。LLMに記事全体を送り返さずに済み、同じ入力からは常に同じ結果になる
+"""
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_IMAGE_MARKDOWN = re.compile(r"!\[[^\]]*\]\(([^)\s]+)")
+# 比較に使わない記号・空白
+_NON_WORD = re.compile(r"[\s\W_]+", re.UNICODE)
+
+# 見出しの一致は本文の一致より重く扱う
+HEADING_WEIGHT = 2.0
+# 重なりを画像の語数で割るときに加える値（語の少ない画像が1語の一致だけで高得点にならないようにする）
+SCORE_SMOOTHING = 4.0
+# alt_textがなくメインキーワードで照合した画像のスコアの倍率（alt_textでの一致を優先する）
+KEYWORD_FALLBACK_WEIGHT = 0.5
+
+
+def split_sections(content: str) -> List[Dict[str, Any]]:
+    """
+    Markdownの見出しで記事をセクションに分割
+
+    Args:
+        content: 記事本文（Markdown）
+
+    Returns:
+        セクションのリスト {"heading", "level", "start", "end"}（start, endは行番号、endは含まない）
+        最初の見出しより前の導入部はheadingが空、levelが0のセクションになる
+    """
+    lines = content.split("\n")
+    sections: List[Dict[str, Any]] = []
+    current = {"heading": "", "level": 0, "start": 0}
+    for index, line in enumerate(lines):
+        match = _HEADING.match(line.strip())
+        if not match:
+            continue
+        if index > current["start"] or current["heading"]:
+            sections.append(dict(current, end=index))
+        current = {"heading": match.group(2), "level": len(match.group(1)), "start": index}
+    sections.append(dict(current, end=len(lines)))
+    return [
+        section for section in sections
+        if section["heading"] or any(line.strip() for line in lines[section["start"]:section["end"]])
+    ]
+
+
+def _bigrams(text: str) -> Set[str]:
+    """文字bigramの集合（分かち書きのない日本語でも語の重なりを測れるようにする）"""
+    normalized = _NON_WORD.sub(" ", text.lower())
+    grams: Set[str] = set()
+    for word in normalized.split():
+        if len(word) == 1:
+            grams.add(word)
+        grams.update(word[i:i + 2] for i in range(len(word) - 1))
+    return grams
+
+
+def _score(image_terms: Set[str], heading_terms: Set[str], body_terms: Set[str]) -> float:
+    if not image_terms:
+        return 0.0
+    heading_overlap = len(image_terms & heading_terms)
+    body_overlap = len(image_terms & body_terms)
+    return (HEADING_WEIGHT * heading_overlap + body_overlap) / (len(image_terms) + SCORE_SMOOTHING)
+
+
+def _insertion_line(lines: List[str], section: Dict[str, Any]) -> int:
+    """セクションの最初の段落の直後（段落がなければ見出しの直後）の行番号"""
+    index = section["start"] + (1 if section["heading"] else 0)
+    end = section["end"]
+    while index < end and not lines[index].strip():
+        index += 1
+    while index < end and lines[index].strip() and not _HEADING.match(lines[index].strip()):
+        index += 1
+    return index
+
+
+def _image_markdown(image: Dict[str, Any]) -> str:
+    alt = (image.get("alt_text") or "").replace("[", "").replace("]", "").replace("\n", " ").strip()
+    return f"![{alt}]({image['url']})"
+
+
+def plan_image_placement(
+    content: str,
+    images: List[Dict[str, Any]],
+    keyword: Optional[str] = None
+) -> List[Tuple[Dict[str, Any], Dict[str, Any], float]]:
+    """
+    各画像の配置先セクションを決める
+
+    スコアの高い組み合わせから順に、1セクション1画像を優先して割り当てる
+    どのセクションとも重ならない画像は、まだ画像のないセクションに記事全体へ分散するよう配置する
+
+    Args:
+        content: 記事本文（Markdown）
+        images: 画像のリスト（url, alt_text）
+        keyword: メインキーワード（alt_textが空の画像の照合に使用）
+
+    Returns:
+        (画像, セクション, スコア)のリスト（記事内の出現順）
+    """
+    lines = content.split("\n")
+    sections = split_sections(content)
+    # 見出しのあるセクションを優先（導入部は見出しがない場合のみ使う）
+    candidates = [section for section in sections if section["heading"]] or sections
+    if not candidates:
+        return []
+
+    placed_urls = set(_IMAGE_MARKDOWN.findall(content))
+    pending = [image for image in images if image.get("url") and image["url"] not in placed_urls]
+
+    section_terms = [
+        (_bigrams(section["heading"]), _bigrams("\n".join(lines[section["start"]:section["end"]])))
+        for section in candidates
+    ]
+    scored = []
+    for image_index, image in enumerate(pending):
+        alt_text = (image.get("alt_text") or "").strip()
+        image_terms = _bigrams(alt_text or keyword or "")
+        weight = 1.0 if alt_text else KEYWORD_FALLBACK_WEIGHT
+        for section_index, (heading_terms, body_terms) in enumerate(section_terms):
+            score = weight * _score(image_terms, heading_terms, body_terms)
+            if score > 0:
+                # 同点の場合は画像・セクションの並び順で決める
+                scored.append((-score, image_index, section_index))
+    scored.sort()
+
+    assigned: Dict[int, Tuple[int, float]] = {}
+    used_sections: Set[int] = set()
+    for negative_score, image_index, section_index in scored:
+        if image_index in assigned or section_index in used_sections:
+            continue
+        assigned[image_index] = (section_index, -negative_score)
+        used_sections.add(section_index)
+
+    # 重なりのない画像（またはセクションが足りない場合）は空いているセクションに均等に配置
+    unassigned = [index for index in range(len(pending)) if index not in assigned]
+    free_sections = [index for index in range(len(candidates)) if index not in used_sections]
+    for position, image_index in enumerate(unassigned):
+        if free_sections:
+            step = len(free_sections) / len(unassigned)
+            section_index = free_sections[min(int(position * step), len(free_sections) - 1)]
+        else:
+            section_index = position % len(candidates)
+        assigned[image_index] = (section_index, 0.0)
+
+    plan = [
+        (pending[image_index], candidates[section_index], score)
+        for image_index, (section_index, score) in assigned.items()
+    ]
+    plan.sort(key=lambda item: (item[1]["start"], pending.index(item[0])))
+    return plan
+
+
+def place_images(content: str, images: List[Dict[str, Any]], keyword: Optional[str] = None) -> str:
+    """
+    記事に画像を挿入
+
+    Args:
+        content: 記事本文（Markdown）
+        images: 画像のリスト（url, alt_text）
+        keyword: メインキーワード
+
+    Returns:
+        各セクションの最初の段落の後に ![alt](URL) を挿入した記事
+    """
+    if not images or not content:
+        return content
+
+    lines = content.split("\n")
+    insertions: Dict[int, List[str]] = {}
+    for image, section, _ in plan_image_placement(content, images, keyword):
+        insertions.setdefault(_insertion_line(lines, section), []).append(_image_markdown(image))
+
+    # 後ろから挿入して行番号がずれないようにする
+    for line_index in sorted(insertions, reverse=True):
+        block = list(insertions[line_index])
+        # 前後の段落と空行で区切る（既に空行があれば追加しない）
+        if line_index > 0 and lines[line_index - 1].strip():
+            block.insert(0, "")
+        if line_index < len(lines) and lines[line_index].strip():
+            block.append("")
+        lines[line_index:line_index] = block
+    return "\n".join(lines)
@@ -0,0 +1,294 @@
+"""
+知識ベースの全文検索インデックス（プロセス内）
+knowledge_baseの各ドキュメントを段落単位のパッセージに分割し、文字bigramの転置インデックスを作ってBM25でスコアリングする
+分かち書きのない日本語でも部分一致で検索でき、検索時はクエリの語のポスティングだけを走査するため件数が増えても遅くならない
+インデックスはupdated_atを基準に差分更新し、削除されたドキュメントは定期的なID照合で取り除く
+"""
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set
+
+from app.config import settings
+
+
+# BM25のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 1パッセージの目安の文字数（段落をこの長さまでまとめる）
+PASSAGE_CHARS = 400
+# Supabaseから1回に取得する件数
+PAGE_SIZE = 500
+
+_NON_WORD = re.compile(r"[\s\W_]+", re.UNICODE)
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n|(?<=[。！？])\s*\n")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    文字bigramに分割（NFKC正規化・小文字化し、記号と空白で区切る）
+
+    Args:
+        text: テキスト
+
+    Returns:
+        トークンのリスト（重複を含む）
+    """
+    normalized = _NON_WORD.sub(" ", unicodedata.normalize("NFKC", text or "").lower())
+    tokens: List[str] = []
+    for word in normalized.split():
+        if len(word) == 1:
+            tokens.append(word)
+        tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def split_passages(content: str, max_chars: int = PASSAGE_CHARS) -> List[str]:
+    """
+    ドキュメントを段落単位のパッセージに分割（短い段落はmax_charsまでまとめる）
+
+    Args:
+        content: ドキュメント本文
+        max_chars: パッセージの目安の文字数
+
+    Returns:
+        パッセージのリスト
+    """
+    paragraphs = [paragraph.strip() for paragraph in _PARAGRAPH_SPLIT.split(content or "") if paragraph.strip()]
+    passages: List[str] = []
+    current = ""
+    for paragraph in paragraphs:
+        # 長すぎる段落は文の区切りで分割
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind("。", 0, max_chars)
+            cut = cut + 1 if cut > 0 else max_chars
+            if current:
+                passages.append(current)
+                current = ""
+            passages.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 1 > max_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        passages.append(current)
+    return passages
+
+
+class KnowledgeIndex:
+    """knowledge_baseのBM25転置インデックス（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # パッセージID -> {"doc_id", "title", "text", "length", "tokens"}
+        self._passages: Dict[int, Dict[str, Any]] = {}
+        # トークン -> {パッセージID: 出現回数}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        # ドキュメントID -> パッセージIDのリスト
+        self._doc_passages: Dict[str, List[int]] = {}
+        self._total_length = 0
+        self._next_passage_id = 0
+        # 差分更新のカーソル（取り込んだ最新のupdated_at）
+        self._cursor: Optional[str] = None
+        self._last_refresh = 0.0
+        self._last_full_sync = 0.0
+
+    def __len__(self) -> int:
+        return len(self._doc_passages)
+
+    def upsert(self, document: Dict[str, Any]) -> None:
+        """
+        ドキュメントを追加または置き換え
+
+        Args:
+            document: knowledge_baseの行（id, title, content, keywords）
+        """
+        doc_id = str(document["id"])
+        title = document.get("title") or ""
+        keywords = " ".join(document.get("keywords") or [])
+        with self._lock:
+            self._remove_locked(doc_id)
+            passage_ids = []
+            for text in split_passages(document.get("content") or ""):
+                # タイトルとキーワードを各パッセージの索引語に含める
+                counts = Counter(tokenize(f"{title} {keywords} {text}"))
+                passage_id = self._next_passage_id
+                self._next_passage_id += 1
+                length = sum(counts.values())
+                self._passages[passage_id] = {
+                    "doc_id": doc_id, "title": title, "text": text, "length": length, "tokens": list(counts)
+                }
+                self._total_length += length
+                for token, count in counts.items():
+                    self._postings.setdefault(token, {})[passage_id] = count
+                passage_ids.append(passage_id)
+            self._doc_passages[doc_id] = passage_ids
+
+    def remove(self, doc_id: str) -> None:
+        """ドキュメントを削除"""
+        with self._lock:
+            self._remove_locked(str(doc_id))
+
+    def _remove_locked(self, doc_id: str) -> None:
+        for passage_id in self._doc_passages.pop(doc_id, []):
+            passage = self._passages.pop(passage_id)
+            self._total_length -= passage["length"]
+            for token in passage["tokens"]:
+                postings = self._postings.get(token)
+                if postings is None:
+                    continue
+                postings.pop(passage_id, None)
+                if not postings:
+                    del self._postings[token]
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        BM25で上位のパッセージを検索
+
+        Args:
+            query: 検索クエリ
+            top_k: 取得件数
+
+        Returns:
+            スコアの高い順のパッセージ {"doc_id", "title", "text", "score"}
+        """
+        query_tokens = set(tokenize(query))
+        with self._lock:
+            count = len(self._passages)
+            if not count or not query_tokens:
+                return []
+            average_length = self._total_length / count
+            scores: Dict[int, float] = {}
+            for token in query_tokens:
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for passage_id, frequency in postings.items():
+                    length = self._passages[passage_id]["length"]
+                    denominator = frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    scores[passage_id] = scores.get(passage_id, 0.0) + idf * frequency * (BM25_K1 + 1) / denominator
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+            return [
+                {
+                    "doc_id": self._passages[passage_id]["doc_id"],
+                    "title": self._passages[passage_id]["title"],
+                    "text": self._passages[passage_id]["text"],
+                    "score": round(score, 4),
+                }
+                for passage_id, score in ranked
+            ]
+
+    def refresh(self, supabase, force: bool = False) -> int:
+        """
+        Supabaseのknowledge_baseから差分を取り込む
+        前回からrefresh間隔が経過していない場合は何もしない。full_sync間隔ごとにIDを照合して削除を反映する
+
+        Args:
+            supabase: Supabaseクライアント
+            force: 間隔に関係なく更新する
+
+        Returns:
+            取り込んだドキュメント数
+        """
+        now = time.monotonic()
+        if not force and now - self._last_refresh < settings.knowledge_index_refresh_seconds:
+            return 0
+        # 別スレッドが更新中なら、その結果を待たずに現在のインデックスで検索する（初回は待つ）
+        if not self._refresh_lock.acquire(blocking=not self._last_refresh):
+            return 0
+        try:
+            if not force and time.monotonic() - self._last_refresh < settings.knowledge_index_refresh_seconds:
+                return 0
+            started = time.perf_counter()
+            updated = 0
+            offset = 0
+            since = self._cursor
+            while True:
+                query = supabase.table("knowledge_base")\
+                    .select("id, title, content, keywords, updated_at")
+                if since:
+                    # 同じupdated_atの行を取りこぼさないよう境界を含めて取得（upsertなので重複しても問題ない）
+                    query = query.gte("updated_at", since)
+                response = query.order("updated_at").order("id")\
+                    .range(offset, offset + PAGE_SIZE - 1)\
+                    .execute()
+                rows = response.data or []
+                for row in rows:
+                    self.upsert(row)
+                    if row.get("updated_at") and (self._cursor is None or row["updated_at"] > self._cursor):
+                        self._cursor = row["updated_at"]
+                updated += len(rows)
+                if len(rows) < PAGE_SIZE:
+                    break
+                offset += PAGE_SIZE
+
+            if force or now - self._last_full_sync >= settings.knowledge_index_full_sync_seconds:
+                self._remove_deleted(supabase)
+                self._last_full_sync = now
+            self._last_refresh = time.monotonic()
+            print(
+                f"[knowledge_index] 更新: {updated}件 / {len(self)}ドキュメント "
+                f"({(time.perf_counter() - started) * 1000:.0f}ms)"
+            )
+            return updated
+        finally:
+            self._refresh_lock.release()
+
+    def _remove_deleted(self, supabase) -> None:
+        """Supabaseに存在しなくなったドキュメントをインデックスから削除"""
+        existing: Set[str] = set()
+        offset = 0
+        while True:
+            response = supabase.table("knowledge_base")\
+                .select("id")\
+                .order("id")\
+                .range(offset, offset + PAGE_SIZE - 1)\
+                .execute()
+            rows = response.data or []
+            existing.update(str(row["id"]) for row in rows)
+            if len(rows) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+        with self._lock:
+            deleted = [doc_id for doc_id in self._doc_passages if doc_id not in existing]
+        for doc_id in deleted:
+            self.remove(doc_id)
+
+
+_index: Optional[KnowledgeIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_knowledge_index() -> KnowledgeIndex:
+    """プロセス共通の知識ベースインデックスを取得"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = KnowledgeIndex()
+        return _index
+
+
+def search_knowledge(supabase, query: str, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    インデックスを差分更新してから知識ベースを検索
+
+    Args:
+        supabase: Supabaseクライアント
+        query: 検索クエリ（キーワード）
+        top_k: 取得するパッセージ数
+
+    Returns:
+        スコアの高い順のパッセージ
+    """
+    index = get_knowledge_index()
+    index.refresh(supabase)
+    return index.search(query, top_k or settings.knowledge_top_k)
@@ -0,0 +1,137 @@
+"""
+LLMレスポンスキャッシュ
+(プロバイダー, モデル, プロンプト, 生成設定)のハッシュをキーに生成テキストを保持する
+後段のステージで失敗した記事を再実行したときに、前段のLLM呼び出しを再課金せずに再生する
+temperature > 0 の呼び出しは常に保存するが、保存済みの出力を使うのは再開・再試行（reuse_sampled）のときだけ
+（通常の生成・再生成では同じ入力でも生成し直し、出力に変化を持たせる）
+"""
+import hashlib
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from app.config import settings
+from app.metrics import record_cache_hit
+from app.response_cache import TwoTierCache
+
+
+# プロンプト: 文字列（Gemini）またはメッセージのリスト（OpenAI）
+Prompt = Union[str, List[Dict[str, Any]]]
+
+# temperature未指定時のOpenAI・Geminiの既定値
+DEFAULT_TEMPERATURE = 1.0
+
+_cache: Optional[TwoTierCache] = None
+
+
+def get_llm_cache() -> Optional[TwoTierCache]:
+    """LLM用のキャッシュを取得（無効化されている場合はNone）"""
+    global _cache
+    if not settings.llm_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = TwoTierCache(
+            name="llm_responses",
+            db_path=settings.llm_cache_path,
+            max_memory_items=settings.llm_cache_memory_items,
+            max_disk_items=settings.llm_cache_disk_items,
+        )
+    return _cache
+
+
+def make_llm_cache_key(provider: str, model: str, prompt: Prompt, config: Optional[Dict[str, Any]] = None) -> str:
+    """プロバイダー・モデル・プロンプト・生成設定からキャッシュキーを生成"""
+    canonical = json.dumps(
+        {"provider": provider, "model": model, "prompt": prompt, "config": config or {}},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _can_reuse(config: Optional[Dict[str, Any]], reuse_sampled: bool) -> bool:
+    """保存済みの出力を返してよいか（temperature > 0 の呼び出しはreuse_sampledかllm_cache_sampledの場合のみ）"""
+    if reuse_sampled or settings.llm_cache_sampled:
+        return True
+    temperature = (config or {}).get("temperature", DEFAULT_TEMPERATURE)
+    return not temperature
+
+
+def cached_llm_text(
+    provider: str,
+    model: str,
+    operation: str,
+    prompt: Prompt,
+    config: Optional[Dict[str, Any]],
+    call: Callable[[], str],
+    validate: Optional[Callable[[str], Any]] = None,
+    reuse_sampled: bool = False
+) -> str:
+    """
+    キャッシュにあれば保存済みのテキストを返し、なければcallを実行して保存
+
+    Args:
+        provider: "openai" または "gemini"
+        model: モデル名
+        operation: 呼び出し箇所（キャッシュヒットのメトリクスに使用）
+        prompt: プロンプト
+        config: 出力に影響する生成設定（temperature、max_tokensなど）
+        call: 実際にLLMを呼び出して生成テキストを返す関数
+        validate: 保存前に生成テキストを検証する関数（例外を送出した場合は保存せずにそのまま送出）
+        reuse_sampled: temperature > 0 の呼び出しでも保存済みの出力を返す（記事の再開・再試行）
+
+    Returns:
+        生成テキスト
+    """
+    return cached_routed_llm_text(
+        provider, model, operation, prompt, config, lambda: (call(), provider, model), validate, reuse_sampled
+    )
+
+
+def cached_routed_llm_text(
+    provider: str,
+    model: str,
+    operation: str,
+    prompt: Prompt,
+    config: Optional[Dict[str, Any]],
+    call: Callable[[], Tuple[str, str, str]],
+    validate: Optional[Callable[[str], Any]] = None,
+    reuse_sampled: bool = False
+) -> str:
+    """
+    LLMRouter経由の呼び出し用のcached_llm_text
+    優先プロバイダー・モデルのキーで参照し、生成したテキストは実際に生成したプロバイダー・モデルのキーで保存する
+    （フェイルオーバー・ヘッジでもう一方が書いた出力を、優先モデルの結果として再生しない）
+
+    Args:
+        provider: 優先プロバイダー
+        model: 優先プロバイダーのモデル名
+        operation: 呼び出し箇所（キャッシュヒットのメトリクスに使用）
+        prompt: プロンプト
+        config: 出力に影響する生成設定（temperature、max_tokensなど）
+        call: LLMを呼び出して(生成テキスト, 生成したプロバイダー, 生成したモデル)を返す関数
+        validate: 保存前に生成テキストを検証する関数（例外を送出した場合は保存せずにそのまま送出）
+        reuse_sampled: temperature > 0 の呼び出しでも保存済みの出力を返す（記事の再開・再試行）
+
+    Returns:
+        生成テキスト
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return call()[0]
+
+    key = make_llm_cache_key(provider, model, prompt, config)
+    if _can_reuse(config, reuse_sampled):
+        cached = cache.get(key)
+        if cached is not None:
+            record_cache_hit("llm", f"{model}:{operation}")
+            return cached
+
+    text, source_provider, source_model = call()
+    if validate is not None:
+        validate(text)
+    if text:
+        if (source_provider, source_model) != (provider, model):
+            key = make_llm_cache_key(source_provider, source_model, prompt, config)
+        cache.set(key, text, settings.llm_cache_ttl_seconds)
+    return text
@@ -0,0 +1,169 @@
+"""
+LLMクライアントのプール
+APIキーごとにOpenAIクライアントとGeminiのGenerativeServiceClientを保持して再利用する
+genai.configureはプロセス全体の設定を書き換えるため使わず、APIキーに対応するクライアントにリクエストを組み立てて渡す
+（別ユーザーのジョブが同時に動いても、互いのAPIキーで呼び出すことがない）
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple, Union
+
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+from openai import OpenAI
+
+from app.config import settings
+
+
+# (プロバイダー, APIキーのハッシュ) -> (クライアント, 最終利用時刻)
+_clients: Dict[Tuple[str, str], Tuple[Any, float]] = {}
+_lock = threading.Lock()
+
+
+def _key_id(api_key: Optional[str]) -> str:
+    """プールのキー（APIキーそのものは保持しない）"""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+def _evict_idle_locked(now: float) -> None:
+    """一定時間使われていないクライアントをプールから外す（ロック取得済みで呼ぶこと）
+    実行中の呼び出しが参照している可能性があるため明示的には閉じず、参照がなくなった時点でGCに任せる
+    """
+    idle_seconds = settings.llm_client_idle_seconds
+    stale = [key for key, (_, last_used) in _clients.items() if now - last_used > idle_seconds]
+    for key in stale:
+        _clients.pop(key, None)
+
+
+def _get_or_create(provider: str, api_key: Optional[str], factory) -> Any:
+    now = time.monotonic()
+    key = (provider, _key_id(api_key))
+    with _lock:
+        _evict_idle_locked(now)
+        entry = _clients.get(key)
+        client = entry[0] if entry else factory()
+        _clients[key] = (client, now)
+        return client
+
+
+def get_openai_client(api_key: Optional[str]) -> OpenAI:
+    """
+    APIキーに対応するOpenAIクライアントを取得（同じキーでは同じクライアントとコネクションプールを共有）
+
+    Args:
+        api_key: OpenAIのAPIキー（Noneの場合は環境変数OPENAI_API_KEY）
+
+    Returns:
+        OpenAIクライアント（スレッドセーフ。呼び出し側でcloseしないこと）
+    """
+    return _get_or_create("openai", api_key, lambda: OpenAI(api_key=api_key))
+
+
+def get_gemini_client(api_key: Optional[str]) -> glm.GenerativeServiceClient:
+    """
+    APIキーに対応するGeminiのGenerativeServiceClientを取得
+
+    Args:
+        api_key: GeminiのAPIキー（Noneの場合は環境変数GOOGLE_API_KEY）
+
+    Returns:
+        GenerativeServiceClient
+    """
+    api_key = api_key or os.getenv("GOOGLE_API_KEY")
+    return _get_or_create(
+        "gemini",
+        api_key,
+        lambda: glm.GenerativeServiceClient(client_options={"api_key": api_key})
+    )
+
+
+class GeminiModel:
+    """
+    APIキーごとのGenerativeServiceClientで呼び出すGeminiモデル（GenerativeModelのgenerate_contentと同じ使い方）
+    GenerativeModelはgenai.configureのプロセス共通のクライアントを使うため、リクエストを組み立ててクライアントに直接渡す
+    """
+
+    def __init__(self, client: glm.GenerativeServiceClient, model_name: str = "gemini-2.0-flash"):
+        """
+        Args:
+            client: GenerativeServiceClient（プールのものを共有する）
+            model_name: モデル名
+        """
+        self._client = client
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+
+    def generate_content(
+        self,
+        contents: Union[str, glm.Content],
+        *,
+        generation_config: Optional[Dict[str, Any]] = None,
+        stream: bool = False,
+        request_options: Optional[Dict[str, Any]] = None
+    ) -> genai.types.GenerateContentResponse:
+        """
+        テキストを生成
+
+        Args:
+            contents: プロンプト
+            generation_config: 生成設定（temperature、max_output_tokensなど）
+            stream: Trueの場合はチャンクごとに受け取るレスポンスを返す
+            request_options: RPCのオプション（例: {"timeout": 30.0}。ストリーミングでは最後のチャンクまでの期限）
+
+        Returns:
+            GenerateContentResponse
+        """
+        if isinstance(contents, str):
+            contents = glm.Content(role="user", parts=[glm.Part(text=contents)])
+        request = glm.GenerateContentRequest(
+            model=self.model_name,
+            contents=[contents],
+            generation_config=glm.GenerationConfig(**generation_config) if generation_config else None,
+        )
+        options = request_options or {}
+        if stream:
+            return genai.types.GenerateContentResponse.from_iterator(
+                self._client.stream_generate_content(request, **options)
+            )
+        return genai.types.GenerateContentResponse.from_response(self._client.generate_content(request, **options))
+
+
+def get_gemini_model(api_key: Optional[str], model_name: str = "gemini-2.0-flash") -> GeminiModel:
+    """
+    APIキーのクライアントで呼び出すGeminiモデルを作成（genai.configureのグローバル設定を使わない）
+
+    Args:
+        api_key: GeminiのAPIキー
+        model_name: モデル名
+
+    Returns:
+        GeminiModel
+    """
+    return GeminiModel(get_gemini_client(api_key), model_name)
+
+
+def with_request_timeout(client: Any, timeout: float) -> Any:
+    """
+    リクエストのタイムアウトを設定したOpenAIクライアントを返す
+    期限を過ぎた呼び出しはSDK側で打ち切られ、呼び出しているスレッドが解放される
+    （SDK内の再試行も行わない。再試行・切り替えは呼び出し側で行う）
+    Geminiはgenerate_contentのrequest_options={"timeout": ...}で指定する
+
+    Args:
+        client: OpenAIクライアント（プールのものはそのまま共有される）
+        timeout: タイムアウト（秒）
+
+    Returns:
+        タイムアウト付きのクライアント（OpenAIクライアント以外はそのまま返す）
+    """
+    if isinstance(client, OpenAI):
+        # コネクションプール（httpx.Client）は元のクライアントと共有される
+        return client.with_options(timeout=timeout, max_retries=0)
+    return client
+
+
+def pool_size() -> int:
+    """プール中のクライアント数"""
+    with _lock:
+        return len(_clients)
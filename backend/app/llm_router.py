@@ -0,0 +1,289 @@
+"""
+LLM呼び出しのルーター（期限・ヘッジ・フェイルオーバー）
+呼び出し箇所ごとに期限を設け、優先プロバイダーの応答が過去のp95レイテンシを超えて遅れている場合は
+もう一方のプロバイダー（未設定なら同じプロバイダー）に同じリクエストを重ねて送り、先に返った結果を使う
+優先プロバイダーがエラー・レート制限になった場合は、すぐにもう一方のプロバイダーへ切り替える
+どちらのプロバイダーもユーザーごとのAPIキーのクライアント（ArticleGenerator.__init__で取得したもの）を使う
+各試行のリクエストには残り時間をタイムアウトとして設定し、ヘッジで負けた試行や期限切れの試行もSDK側で打ち切る
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.llm_clients import with_request_timeout
+from app.llm_stream import stream_gemini, stream_openai_chat
+from app.metrics import record_llm_call
+
+
+# プロバイダーごとのモデル
+PROVIDER_MODELS = {
+    "openai": "gpt-4o",
+    "gemini": "gemini-2.0-flash",
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.llm_router_max_workers,
+                thread_name_prefix="llm_router",
+            )
+        return _executor
+
+
+class LatencyTracker:
+    """(プロバイダー, 呼び出し箇所)ごとに直近の成功レイテンシを保持してパーセンタイルを求める（スレッドセーフ）"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, operation: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.setdefault((provider, operation), deque(maxlen=self.window))
+            samples.append(seconds)
+
+    def percentile(self, provider: str, operation: str, percentile: float) -> Optional[float]:
+        """
+        パーセンタイルのレイテンシ（秒）
+
+        Returns:
+            サンプルがllm_hedge_min_samples件未満の場合はNone
+        """
+        with self._lock:
+            samples = sorted(self._samples.get((provider, operation), ()))
+        if len(samples) < settings.llm_hedge_min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+# プロセス共通（ユーザーが変わってもプロバイダーの遅さは共通）
+latency_tracker = LatencyTracker()
+
+
+class LLMRouterError(Exception):
+    """すべての試行が失敗した、または期限内に応答がなかった"""
+
+
+class LLMRouter:
+    """OpenAI・Geminiへのテキスト生成をルーティングする"""
+
+    def __init__(self, openai_client: Any = None, gemini_model: Any = None):
+        """
+        Args:
+            openai_client: OpenAIクライアント（APIキーが設定されていない場合はNone）
+            gemini_model: GeminiModel（APIキーが設定されていない場合はNone）
+        """
+        self._clients = {"openai": openai_client, "gemini": gemini_model}
+
+    def available(self, provider: str) -> bool:
+        return self._clients.get(provider) is not None
+
+    def _alternate(self, provider: str) -> str:
+        other = "gemini" if provider == "openai" else "openai"
+        return other if settings.llm_failover_enabled and self.available(other) else provider
+
+    def _call(
+        self,
+        provider: str,
+        operation: str,
+        prompt: str,
+        system: Optional[str],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        on_text: Optional[Callable[[str], None]],
+        timeout: float
+    ) -> str:
+        """1つのプロバイダーで1回生成（timeout秒を過ぎたらSDK側で打ち切る）"""
+        model = PROVIDER_MODELS[provider]
+        client = with_request_timeout(self._clients[provider], timeout)
+        deadline = time.monotonic() + timeout
+        if provider == "openai":
+            messages: List[Dict[str, str]] = []
+            if system:
+                messages.append({"role": "system", "content": system})
+            messages.append({"role": "user", "content": prompt})
+            kwargs: Dict[str, Any] = {}
+            if temperature is not None:
+                kwargs["temperature"] = temperature
+            if max_tokens is not None:
+                kwargs["max_tokens"] = max_tokens
+            if settings.llm_streaming_enabled:
+                return stream_openai_chat(client, model, messages, operation, on_text=on_text, deadline=deadline, **kwargs)
+            started = time.perf_counter()
+            response = client.chat.completions.create(model=model, messages=messages, **kwargs)
+            record_llm_call("openai", model, operation, started, response)
+            return response.choices[0].message.content or ""
+
+        # Geminiにはシステムプロンプトをプロンプトの先頭に付ける
+        text = f"{system}\n\n{prompt}" if system else prompt
+        generation_config: Dict[str, Any] = {}
+        if temperature is not None:
+            generation_config["temperature"] = temperature
+        if max_tokens is not None:
+            generation_config["max_output_tokens"] = max_tokens
+        request_options = {"timeout": timeout}
+        if settings.llm_streaming_enabled:
+            return stream_gemini(
+                client, model, text, operation,
+                on_text=on_text, generation_config=generation_config or None, deadline=deadline,
+                request_options=request_options
+            )
+        started = time.perf_counter()
+        response = client.generate_content(
+            text, generation_config=generation_config or None, request_options=request_options
+        )
+        record_llm_call("gemini", model, operation, started, response, prompt=text)
+        return response.text
+
+    def _hedge_delay(self, provider: str, operation: str) -> Optional[float]:
+        """重ねて送るまでの待ち時間（p95レイテンシ。サンプル不足ならヘッジしない）"""
+        if not settings.llm_hedge_enabled:
+            return None
+        p95 = latency_tracker.percentile(provider, operation, settings.llm_hedge_percentile)
+        if p95 is None:
+            return None
+        return max(settings.llm_hedge_min_delay_seconds, p95)
+
+    def generate(self, operation: str, prompt: str, primary: str, **kwargs: Any) -> str:
+        """テキストを生成（期限・ヘッジ・フェイルオーバーつき。引数はrouteと同じ）"""
+        return self.route(operation, prompt, primary, **kwargs)[0]
+
+    def route(
+        self,
+        operation: str,
+        prompt: str,
+        primary: str,
+        system: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        deadline: Optional[float] = None,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> Tuple[str, str, str]:
+        """
+        テキストを生成し、実際に生成したプロバイダー・モデルとともに返す（期限・ヘッジ・フェイルオーバーつき）
+
+        Args:
+            operation: 呼び出し箇所（期限の設定、レイテンシの集計、メトリクスに使用）
+            prompt: プロンプト
+            primary: 優先プロバイダー（"openai" または "gemini"。未設定ならもう一方を使う）
+            system: システムプロンプト
+            temperature: temperature
+            max_tokens: 出力トークンの上限
+            deadline: 期限（秒。Noneの場合は設定の呼び出し箇所ごとの期限）
+            on_text: ストリーミング中の全文を受け取るコールバック（最初にテキストを返した試行のみ渡す）
+
+        Returns:
+            (生成されたテキスト, 生成したプロバイダー, 生成したモデル)
+
+        Raises:
+            LLMRouterError: すべての試行が失敗した、または期限内に応答がなかった場合
+        """
+        if not self.available(primary):
+            primary = "gemini" if primary == "openai" else "openai"
+            if not self.available(primary):
+                raise LLMRouterError("OpenAI・GeminiのAPIキーがどちらも設定されていません")
+        deadline = deadline or settings.llm_deadlines.get(operation, settings.llm_deadline_default_seconds)
+        started = time.monotonic()
+        executor = _get_executor()
+
+        # 途中テキストは最初にテキストを返した試行だけから渡し、結果が決まった後は渡さない
+        state = {"leader": None, "done": False}
+        state_lock = threading.Lock()
+
+        def forward(attempt: int, text: str) -> None:
+            if on_text is None:
+                return
+            with state_lock:
+                if state["done"]:
+                    return
+                if state["leader"] is None:
+                    state["leader"] = attempt
+                if state["leader"] != attempt:
+                    return
+            on_text(text)
+
+        def run(attempt: int, provider: str) -> str:
+            attempt_started = time.perf_counter()
+            # 後から送ったヘッジ・フェイルオーバーも、呼び出し全体の期限までに打ち切る
+            remaining = max(0.1, deadline - (time.monotonic() - started))
+            text = self._call(
+                provider, operation, prompt, system, temperature, max_tokens,
+                lambda partial: forward(attempt, partial), remaining
+            )
+            latency_tracker.record(provider, operation, time.perf_counter() - attempt_started)
+            return text
+
+        attempts: Dict[Future, Tuple[int, str]] = {}
+        errors: List[str] = []
+
+        def launch(provider: str, reason: str) -> None:
+            attempt = len(attempts)
+            if attempt:
+                print(f"[llm_router] {operation}: {provider}に{reason}（{time.monotonic() - started:.1f}秒経過）")
+            # スレッドにもメトリクスのユーザー・記事を引き継ぐ
+            context = contextvars.copy_context()
+            attempts[executor.submit(context.run, run, attempt, provider)] = (attempt, provider)
+
+        launch(primary, "送信")
+        hedge_at = self._hedge_delay(primary, operation)
+        hedged = False
+        pending = set(attempts)
+        try:
+            while pending:
+                remaining = deadline - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                timeout = remaining
+                if not hedged and hedge_at is not None:
+                    timeout = max(0.0, min(remaining, hedge_at - (time.monotonic() - started)))
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    attempt, provider = attempts[future]
+                    try:
+                        text = future.result()
+                    except Exception as e:
+                        errors.append(f"{provider}: {str(e)}")
+                        print(f"[llm_router] {operation}: {provider}が失敗しました: {str(e)}")
+                        with state_lock:
+                            if state["leader"] == attempt:
+                                state["leader"] = None
+                        continue
+                    if attempt:
+                        print(f"[llm_router] {operation}: {provider}の応答を使用します")
+                    return text, provider, PROVIDER_MODELS[provider]
+
+                if done and not pending and len(attempts) < 2:
+                    # 失敗したのでもう一方のプロバイダーに切り替える
+                    _, failed_provider = attempts[next(iter(done))]
+                    fallback = self._alternate(failed_provider)
+                    if fallback != failed_provider or settings.llm_retry_same_provider:
+                        launch(fallback, "フェイルオーバー")
+                        hedged = True
+                        pending = {future for future in attempts if not future.done()}
+                    continue
+
+                if not done and not hedged and hedge_at is not None and time.monotonic() - started >= hedge_at:
+                    # p95を超えて遅れているので、もう一方にも同じリクエストを送る
+                    launch(self._alternate(primary), f"ヘッジ送信（p95={hedge_at:.1f}秒）")
+                    hedged = True
+                    pending = {future for future in attempts if not future.done()}
+        finally:
+            with state_lock:
+                state["done"] = True
+
+        if errors and not pending:
+            raise LLMRouterError(f"{operation}: すべての試行が失敗しました（{'; '.join(errors)}）")
+        raise LLMRouterError(f"{operation}: {deadline}秒以内に応答がありませんでした")
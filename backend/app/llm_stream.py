@@ -0,0 +1,182 @@
+"""
+LLMのストリーミング生成と下書きの途中保存
+OpenAI・Geminiのトークンストリームを読み進めながら、途中までのテキストをコールバックに渡す
+記事生成タスクはDraftWriterで一定間隔ごとにarticlesへ書き込み、記事詳細画面のポーリングで生成中の本文を表示する
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from app.metrics import record_llm_call
+from app.sanitize import sanitize_html
+
+
+# 途中までの生成テキストを受け取るコールバック
+TextCallback = Callable[[str], None]
+
+
+def stream_openai_chat(
+    client: Any,
+    model: str,
+    messages: List[Dict[str, str]],
+    operation: str,
+    on_text: Optional[TextCallback] = None,
+    deadline: Optional[float] = None,
+    **kwargs: Any
+) -> str:
+    """
+    OpenAIのChat Completionをストリーミングで実行
+
+    Args:
+        client: OpenAIクライアント
+        model: モデル名
+        messages: メッセージ
+        operation: メトリクスに記録する呼び出し箇所
+        on_text: 差分を受け取るたびに、それまでの全文を渡すコールバック
+        deadline: time.monotonic()基準の期限（少しずつ届き続けるストリームも期限で打ち切る）
+        **kwargs: chat.completions.createに渡すその他の引数
+
+    Returns:
+        生成されたテキスト全体
+    """
+    started = time.perf_counter()
+    stream = client.chat.completions.create(model=model, messages=messages, stream=True, **kwargs)
+    parts: List[str] = []
+    for chunk in stream:
+        if deadline is not None and time.monotonic() > deadline:
+            # 接続を閉じて以降のチャンクを受け取らない
+            if getattr(stream, "response", None) is not None:
+                stream.response.close()
+            raise TimeoutError(f"{operation}: ストリーミングが期限内に終わりませんでした")
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            if on_text:
+                on_text("".join(parts))
+    # ストリーミングのチャンクにはusageが含まれない（openai 1.3.7はstream_options未対応）ため、
+    # メッセージと生成テキストからトークン数を見積もって記録する
+    record_llm_call("openai", model, operation, started, prompt=messages, completion="".join(parts))
+    return "".join(parts)
+
+
+def stream_gemini(
+    gemini_model: Any,
+    model_name: str,
+    prompt: str,
+    operation: str,
+    on_text: Optional[TextCallback] = None,
+    generation_config: Optional[Dict[str, Any]] = None,
+    deadline: Optional[float] = None,
+    request_options: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Geminiのgenerate_contentをストリーミングで実行
+
+    Args:
+        gemini_model: GeminiModel
+        model_name: メトリクスに記録するモデル名
+        prompt: プロンプト
+        operation: メトリクスに記録する呼び出し箇所
+        on_text: チャンクを受け取るたびに、それまでの全文を渡すコールバック
+        generation_config: 生成設定
+        deadline: time.monotonic()基準の期限
+        request_options: RPCのオプション（例: {"timeout": 残り秒数}）
+
+    Returns:
+        生成されたテキスト全体
+    """
+    started = time.perf_counter()
+    response = gemini_model.generate_content(
+        prompt, generation_config=generation_config, stream=True, request_options=request_options
+    )
+    parts: List[str] = []
+    for chunk in response:
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"{operation}: ストリーミングが期限内に終わりませんでした")
+        try:
+            text = chunk.text
+        except ValueError:
+            # 安全フィルタなどでテキストを含まないチャンク
+            continue
+        if text:
+            parts.append(text)
+            if on_text:
+                on_text("".join(parts))
+    record_llm_call("gemini", model_name, operation, started, response, prompt=prompt, completion="".join(parts))
+    return "".join(parts)
+
+
+class DraftWriter:
+    """
+    生成途中のタイトル・本文を一定間隔でarticlesに書き込む
+    書き込みはロックの外で行い、書き込み中に届いた内容は次の書き込みにまとめる（ストリーミングのコールバックを待たせない）
+    """
+
+    def __init__(self, write: Callable[[Dict[str, Any]], Any], interval: float = 2.0):
+        """
+        Args:
+            write: 更新内容を受け取り記事に保存する関数
+            interval: 書き込みの最短間隔（秒）
+        """
+        self._write = write
+        self.interval = interval
+        self._pending: Dict[str, Any] = {}
+        self._last_flush = 0.0
+        self._closed = False
+        # 書き込んだことのあるフィールド（生成が失敗したときに元の内容へ戻す）
+        self._written: Set[str] = set()
+        # _pending・_closedを守るロックと、書き込みを1つずつにするロック（取得順は_write_lock → _lock）
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def update(self, **fields: Any) -> None:
+        """途中の内容を受け取り、前回の書き込みからinterval以上経っていれば保存"""
+        with self._lock:
+            if self._closed:
+                return
+            self._pending.update(fields)
+            if time.monotonic() - self._last_flush < self.interval:
+                return
+        # 別のスレッドが書き込み中なら待たずに戻る（内容は次の書き込みで保存される）
+        self._flush(block=False)
+
+    def flush(self) -> None:
+        """未保存の内容を保存"""
+        self._flush(block=True)
+
+    def close(self) -> None:
+        """以降の書き込みを止める（最終結果の保存前に呼び、遅れて届いた途中内容で上書きしないようにする）"""
+        with self._lock:
+            self._closed = True
+            self._pending = {}
+        # 書き込み中の途中内容が最終結果より後に保存されないよう、完了を待つ
+        with self._write_lock:
+            pass
+
+    def written_fields(self) -> Set[str]:
+        """途中保存で書き込んだフィールド"""
+        with self._lock:
+            return set(self._written)
+
+    def _flush(self, block: bool) -> None:
+        if not self._write_lock.acquire(blocking=block):
+            return
+        try:
+            with self._lock:
+                if self._closed or not self._pending:
+                    return
+                updates = self._pending
+                self._pending = {}
+                self._last_flush = time.monotonic()
+                self._written.update(updates)
+            if "content" in updates:
+                updates["content"] = sanitize_html(updates["content"])
+            try:
+                self._write(updates)
+            except Exception as e:
+                # 途中保存の失敗は生成を止めない
+                print(f"[draft] 途中保存に失敗しました（続行）: {str(e)}")
+        finally:
+            self._write_lock.release()
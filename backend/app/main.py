@@ -4,14 +4,29 @@ from fastapi.responses import Response
 from fastapi import Request
 from app.routers import auth as auth_router, articles as articles_router, settings as settings_router, images as images_router, options as options_router, keyword_data as keyword_data_router, serp_analysis as serp_analysis_router, domain_analytics as domain_analytics_router, dataforseo_labs as dataforseo_labs_router, integrated_analysis as integrated_analysis_router, integrated_analysis_results as integrated_analysis_results_router
 from app.config import settings as app_settings
+from app.dataforseo_transport import close_dataforseo_http_clients
+from app.dataforseo_tasks import stop_task_queue
+from app.metrics import render_prometheus
+from contextlib import asynccontextmanager
 import os
 
 # データベーステーブルはSupabaseで管理（SQLスクリプトで作成済み）
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """アプリケーションの起動・終了処理"""
+    yield
+    # DataForSEO標準キューのポーラーを停止し、プール済みコネクションを閉じる
+    stop_task_queue()
+    await close_dataforseo_http_clients()
+
+
 app = FastAPI(
     title="メガネ記事案ジェネレーター API",
     description="メガネ関連記事を自動生成するAPI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS設定
@@ -75,3 +90,12 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    """外部API呼び出しのコスト・レイテンシ（Prometheusテキスト形式）"""
+    # METRICS_TOKENが設定されている場合はBearerトークンで保護
+    if app_settings.metrics_token:
+        if request.headers.get("authorization") != f"Bearer {app_settings.metrics_token}":
+            return Response(status_code=401)
+    return Response(content=render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
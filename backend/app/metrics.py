@@ -0,0 +1,316 @@
+"""
+外部API呼び出しのコスト・レイテンシ計測
+DataForSEO・OpenAI・Geminiの呼び出しごとにレイテンシ、転送バイト数、DataForSEOのcost、LLMのトークン数を記録し、
+Prometheusテキスト形式（/metrics）と記事ごとのコスト内訳（articles.cost_breakdown）として出力する
+ユーザー・記事はcontextvarsで呼び出し元から引き継ぐ
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+# レイテンシヒストグラムのバケット（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_current_user: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("metrics_user", default=None)
+_current_article: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("metrics_article", default=None)
+
+_METRIC_HELP = {
+    "blog_upstream_requests_total": ("counter", "外部APIの呼び出し回数"),
+    "blog_upstream_request_duration_seconds": ("histogram", "外部API呼び出しのレイテンシ（秒）"),
+    "blog_upstream_response_bytes_total": ("counter", "外部APIから受信したバイト数"),
+    "blog_dataforseo_cost_usd_total": ("counter", "DataForSEOの利用料金（USD）"),
+    "blog_llm_tokens_total": ("counter", "LLMの消費トークン数（source=\"estimate\" はプロンプト・生成テキストからの見積もり）"),
+    "blog_cache_hits_total": ("counter", "キャッシュヒットで省略した外部API呼び出し数"),
+    "blog_stage_duration_seconds": ("histogram", "記事生成ステージの所要時間（秒）"),
+    "blog_prompt_tokens_total": ("counter", "組み立てたプロンプトのトークン数（セクション別、sectionが空の行は全体）"),
+}
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Dict[str, Any]] = {}
+_article_breakdowns: Dict[str, Dict[str, Any]] = {}
+
+
+@contextmanager
+def metrics_context(user_id: Optional[str] = None, article_id: Optional[str] = None) -> Iterator[None]:
+    """このブロック内の計測をユーザー・記事に紐づける"""
+    user_token = _current_user.set(user_id)
+    article_token = _current_article.set(article_id)
+    try:
+        yield
+    finally:
+        _current_article.reset(article_token)
+        _current_user.reset(user_token)
+
+
+def set_metrics_user(user_id: Optional[str]) -> None:
+    """現在のコンテキストのユーザーを設定（記事取得後にuser_idが判明した場合など）"""
+    _current_user.set(user_id)
+
+
+def _labels(**labels: Any) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _inc(name: str, value: float, **labels: Any) -> None:
+    key = (name, _labels(**labels))
+    _counters[key] = _counters.get(key, 0.0) + value
+
+
+def _observe(name: str, value: float, **labels: Any) -> None:
+    key = (name, _labels(**labels))
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+        _histograms[key] = histogram
+    for index, bound in enumerate(LATENCY_BUCKETS):
+        if value <= bound:
+            histogram["buckets"][index] += 1
+    histogram["sum"] += value
+    histogram["count"] += 1
+
+
+def _article_entry(article_id: str) -> Dict[str, Any]:
+    entry = _article_breakdowns.get(article_id)
+    if entry is None:
+        entry = {
+            "dataforseo": {},
+            "llm": {},
+            "stages": {},
+            "prompts": {},
+            "dataforseo_cost_usd": 0.0,
+            "llm_tokens": 0,
+            "upstream_seconds": 0.0,
+        }
+        _article_breakdowns[article_id] = entry
+    return entry
+
+
+def record_dataforseo_call(
+    endpoint: str,
+    seconds: float,
+    response_bytes: int = 0,
+    cost: Optional[float] = None,
+    status: Any = 200
+) -> None:
+    """
+    DataForSEOの呼び出しを記録
+
+    Args:
+        endpoint: エンドポイントのパス（例: /v3/serp/google/organic/advanced/live）
+        seconds: 再試行を含む所要時間
+        response_bytes: レスポンスのバイト数
+        cost: レスポンスのcost（USD）
+        status: HTTPステータス
+    """
+    user = _current_user.get() or "unknown"
+    article_id = _current_article.get()
+    cost = float(cost or 0)
+    with _lock:
+        _inc("blog_upstream_requests_total", 1, provider="dataforseo", endpoint=endpoint, user=user, status=status)
+        _observe("blog_upstream_request_duration_seconds", seconds, provider="dataforseo", endpoint=endpoint)
+        _inc("blog_upstream_response_bytes_total", response_bytes, provider="dataforseo", endpoint=endpoint)
+        if cost:
+            _inc("blog_dataforseo_cost_usd_total", cost, endpoint=endpoint, user=user)
+        if article_id:
+            entry = _article_entry(article_id)
+            item = entry["dataforseo"].setdefault(endpoint, {"calls": 0, "cost_usd": 0.0, "seconds": 0.0, "bytes": 0})
+            item["calls"] += 1
+            item["cost_usd"] += cost
+            item["seconds"] += seconds
+            item["bytes"] += response_bytes
+            entry["dataforseo_cost_usd"] += cost
+            entry["upstream_seconds"] += seconds
+
+
+def _llm_usage(provider: str, response: Any) -> Tuple[int, int]:
+    """レスポンスから(入力トークン, 出力トークン)を取り出す（取得できない場合は0）"""
+    if provider == "openai":
+        usage = getattr(response, "usage", None)
+        return (
+            getattr(usage, "prompt_tokens", 0) or 0,
+            getattr(usage, "completion_tokens", 0) or 0,
+        )
+    # google-generativeai 0.3.x のレスポンスにはusage_metadataがない（新しいSDKのみ）
+    usage = getattr(response, "usage_metadata", None)
+    return (
+        getattr(usage, "prompt_token_count", 0) or 0,
+        getattr(usage, "candidates_token_count", 0) or 0,
+    )
+
+
+def _prompt_text(prompt: Any) -> str:
+    """プロンプト（文字列またはChat Completionのメッセージ）をテキストにする"""
+    if isinstance(prompt, str):
+        return prompt
+    if isinstance(prompt, (list, tuple)):
+        return "\n".join(str(message.get("content") or "") for message in prompt if isinstance(message, dict))
+    return str(prompt or "")
+
+
+def _response_text(provider: str, response: Any) -> str:
+    """レスポンスの生成テキスト（取得できない場合は空文字）"""
+    try:
+        if provider == "openai":
+            return response.choices[0].message.content or ""
+        return response.text or ""
+    except (AttributeError, IndexError, TypeError, ValueError):
+        # ストリーミングの最終チャンク、安全フィルタでテキストを含まないレスポンスなど
+        return ""
+
+
+def _estimate_tokens(text: str, model: str) -> int:
+    # prompt_builderがこのモジュールを使うため、ここで読み込む
+    from app.prompt_builder import count_tokens
+    return count_tokens(text, model)
+
+
+def record_llm_call(
+    provider: str,
+    model: str,
+    operation: str,
+    started: float,
+    response: Any = None,
+    prompt: Any = None,
+    completion: Optional[str] = None
+) -> None:
+    """
+    LLMの呼び出しを記録
+    レスポンスにトークン数が含まれない場合（ストリーミング、google-generativeai 0.3.xなど）は
+    プロンプトと生成テキストからトークン数を見積もり、source="estimate" として記録する
+
+    Args:
+        provider: "openai" または "gemini"
+        model: モデル名
+        operation: 呼び出し箇所（例: "title", "content"）
+        started: 呼び出し開始時のtime.perf_counter()
+        response: SDKのレスポンス（トークン数の取得に使用）
+        prompt: プロンプト（文字列またはメッセージのリスト。トークン数の見積もりに使用）
+        completion: 生成テキスト（省略時はresponseから取得。トークン数の見積もりに使用）
+    """
+    seconds = time.perf_counter() - started
+    succeeded = response is not None or completion is not None
+    prompt_tokens, completion_tokens = _llm_usage(provider, response) if response is not None else (0, 0)
+    source = "usage"
+    if not prompt_tokens and not completion_tokens and succeeded:
+        if completion is None:
+            completion = _response_text(provider, response)
+        prompt_tokens = _estimate_tokens(_prompt_text(prompt), model)
+        completion_tokens = _estimate_tokens(completion, model)
+        source = "estimate"
+    user = _current_user.get() or "unknown"
+    article_id = _current_article.get()
+    endpoint = f"{model}:{operation}"
+    with _lock:
+        _inc("blog_upstream_requests_total", 1, provider=provider, endpoint=endpoint, user=user, status="ok" if succeeded else "error")
+        _observe("blog_upstream_request_duration_seconds", seconds, provider=provider, endpoint=endpoint)
+        _inc("blog_llm_tokens_total", prompt_tokens, provider=provider, model=model, operation=operation, user=user, kind="prompt", source=source)
+        _inc("blog_llm_tokens_total", completion_tokens, provider=provider, model=model, operation=operation, user=user, kind="completion", source=source)
+        if article_id:
+            entry = _article_entry(article_id)
+            item = entry["llm"].setdefault(endpoint, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0})
+            item["calls"] += 1
+            item["prompt_tokens"] += prompt_tokens
+            item["completion_tokens"] += completion_tokens
+            item["seconds"] += seconds
+            if source == "estimate":
+                # 見積もりを含む場合は内訳にも明示する
+                item["estimated_tokens"] = True
+            entry["llm_tokens"] += prompt_tokens + completion_tokens
+            entry["upstream_seconds"] += seconds
+
+
+def record_cache_hit(cache: str, endpoint: str) -> None:
+    """キャッシュヒットを記録"""
+    with _lock:
+        _inc("blog_cache_hits_total", 1, cache=cache, endpoint=endpoint)
+
+
+def record_prompt_tokens(model: str, operation: str, total: int, sections: Dict[str, int]) -> None:
+    """
+    組み立てたプロンプトのトークン数を記録
+
+    Args:
+        model: モデル名
+        operation: 呼び出し箇所
+        total: プロンプト全体のトークン数
+        sections: セクション名 -> 予算に収めた後のトークン数
+    """
+    article_id = _current_article.get()
+    with _lock:
+        _inc("blog_prompt_tokens_total", total, model=model, operation=operation, section="")
+        for section, tokens in sections.items():
+            _inc("blog_prompt_tokens_total", tokens, model=model, operation=operation, section=section)
+        if article_id:
+            _article_entry(article_id)["prompts"][f"{model}:{operation}"] = {"tokens": total, "sections": dict(sections)}
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """記事生成ステージの所要時間を記録"""
+    article_id = _current_article.get()
+    with _lock:
+        _observe("blog_stage_duration_seconds", seconds, stage=stage)
+        if article_id:
+            stages = _article_entry(article_id)["stages"]
+            stages[stage] = round(stages.get(stage, 0.0) + seconds, 3)
+
+
+def pop_article_breakdown(article_id: str) -> Optional[Dict[str, Any]]:
+    """記事のコスト内訳を取り出して破棄（記録がなければNone）"""
+    with _lock:
+        entry = _article_breakdowns.pop(article_id, None)
+    if entry is None:
+        return None
+    entry["dataforseo_cost_usd"] = round(entry["dataforseo_cost_usd"], 6)
+    entry["upstream_seconds"] = round(entry["upstream_seconds"], 3)
+    for item in entry["dataforseo"].values():
+        item["cost_usd"] = round(item["cost_usd"], 6)
+        item["seconds"] = round(item["seconds"], 3)
+    for item in entry["llm"].values():
+        item["seconds"] = round(item["seconds"], 3)
+    return entry
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = [
+        '{}="{}"'.format(key, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for key, value in pairs
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    """サンプル値を丸めずに出力（:gでは6桁に丸められ、大きなバイト数・トークン数の合計がずれる）"""
+    return repr(float(value))
+
+
+def render_prometheus() -> str:
+    """Prometheusテキスト形式で全メトリクスを出力"""
+    lines: List[str] = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, dict(value, buckets=list(value["buckets"]))) for key, value in _histograms.items())
+
+    for name, (metric_type, help_text) in _METRIC_HELP.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        if metric_type == "counter":
+            for (metric_name, labels), value in counters:
+                if metric_name == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            continue
+        for (metric_name, labels), histogram in histograms:
+            if metric_name != name:
+                continue
+            for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', f'{bound:g}'))} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
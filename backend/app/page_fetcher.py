@@ -0,0 +1,207 @@
+"""
+競合ページの並行取得と本文テキスト抽出
+全体とホストごとの同時接続数を制限して並行に取得し、上限バイト数で読み込みを打ち切る
+HTMLは受信しながらパースし、script・style・ナビゲーションなどを除いた本文テキストだけを返す
+"""
+import asyncio
+import codecs
+import re
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from app.config import settings
+
+
+# 中身をテキストとして扱わない要素
+_SKIP_TAGS = {
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe",
+    "nav", "header", "footer", "aside", "form", "button", "select",
+}
+# 本文領域とみなす要素（ここに十分なテキストがあれば、それ以外は使わない）
+_MAIN_TAGS = {"main", "article"}
+# 改行で区切るブロック要素
+_BLOCK_TAGS = {
+    "p", "div", "section", "br", "li", "ul", "ol", "table", "tr", "td", "th",
+    "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "dd", "dt",
+} | _MAIN_TAGS
+# 空要素（終了タグがない）
+_VOID_TAGS = {"br", "img", "hr", "meta", "link", "input", "source", "wbr", "area", "base", "col", "embed", "param", "track"}
+
+# 本文領域のテキストがこの文字数未満なら、ページ全体のテキストを使う
+MIN_MAIN_TEXT_CHARS = 200
+
+_USER_AGENT = "Mozilla/5.0 (compatible; BlogAutomationBot/1.0)"
+
+
+class TextExtractor(HTMLParser):
+    """受け取ったHTMLの断片から本文テキストを組み立てる"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self._in_title = False
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._parts: List[str] = []
+        self._main_parts: List[str] = []
+        # 見出しを抽出結果に残す（分析で見出しの傾向を見るため）
+        self.headings: List[str] = []
+        self._heading_parts: Optional[List[str]] = None
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        if tag in _VOID_TAGS:
+            if tag == "br":
+                self._newline()
+            return
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+            return
+        if tag == "title":
+            self._in_title = True
+        if tag in _MAIN_TAGS:
+            self._main_depth += 1
+        if tag in ("h1", "h2", "h3") and not self._skip_depth:
+            self._heading_parts = []
+        if tag in _BLOCK_TAGS:
+            self._newline()
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+            return
+        if tag == "title":
+            self._in_title = False
+        if tag in _MAIN_TAGS:
+            self._main_depth = max(0, self._main_depth - 1)
+        if tag in ("h1", "h2", "h3") and self._heading_parts is not None:
+            heading = " ".join("".join(self._heading_parts).split())
+            if heading:
+                self.headings.append(heading)
+            self._heading_parts = None
+        if tag in _BLOCK_TAGS:
+            self._newline()
+
+    def handle_data(self, data: str) -> None:
+        if self._in_title:
+            self.title += data
+            return
+        if self._skip_depth or not data.strip():
+            return
+        self._parts.append(data)
+        if self._main_depth:
+            self._main_parts.append(data)
+        if self._heading_parts is not None:
+            self._heading_parts.append(data)
+
+    def _newline(self) -> None:
+        if self._parts and self._parts[-1] != "\n":
+            self._parts.append("\n")
+        if self._main_depth and self._main_parts and self._main_parts[-1] != "\n":
+            self._main_parts.append("\n")
+
+    def text_length(self) -> int:
+        return sum(len(part) for part in self._parts)
+
+    def text(self) -> str:
+        """本文テキスト（本文領域が十分にあればその部分だけ）"""
+        main = _normalize_text("".join(self._main_parts))
+        if len(main) >= MIN_MAIN_TEXT_CHARS:
+            return main
+        return _normalize_text("".join(self._parts))
+
+
+def _normalize_text(text: str) -> str:
+    lines = (" ".join(line.split()) for line in text.split("\n"))
+    return re.sub(r"\n{2,}", "\n", "\n".join(line for line in lines if line)).strip()
+
+
+async def _fetch_one(
+    client: httpx.AsyncClient,
+    url: str,
+    max_bytes: int,
+    max_chars: int
+) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"url": url, "title": "", "headings": [], "text": "", "bytes": 0, "status": None, "error": None}
+    extractor = TextExtractor()
+    async with client.stream("GET", url) as response:
+        result["status"] = response.status_code
+        if response.status_code != 200:
+            result["error"] = f"HTTP {response.status_code}"
+            return result
+        content_type = response.headers.get("Content-Type", "")
+        if content_type and "html" not in content_type and "text" not in content_type:
+            result["error"] = f"HTMLではありません: {content_type}"
+            return result
+
+        decoder = codecs.getincrementaldecoder(response.charset_encoding or "utf-8")(errors="replace")
+        async for chunk in response.aiter_bytes():
+            result["bytes"] += len(chunk)
+            extractor.feed(decoder.decode(chunk))
+            # 上限バイト数、または十分なテキストが取れた時点で打ち切る
+            if result["bytes"] >= max_bytes or extractor.text_length() >= max_chars * 3:
+                break
+        extractor.feed(decoder.decode(b"", final=True))
+
+    extractor.close()
+    result["title"] = " ".join(extractor.title.split())
+    result["headings"] = extractor.headings[:30]
+    result["text"] = extractor.text()[:max_chars]
+    return result
+
+
+async def fetch_pages(
+    urls: List[str],
+    max_concurrency: Optional[int] = None,
+    per_host: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    timeout: Optional[float] = None,
+    max_chars: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    複数のページを並行に取得して本文テキストを抽出
+
+    Args:
+        urls: 取得するURL
+        max_concurrency: 全体の同時取得数
+        per_host: 同一ホストへの同時取得数
+        max_bytes: 1ページあたりの最大受信バイト数
+        timeout: 1ページあたりのタイムアウト（秒、リダイレクト・受信を含む）
+        max_chars: 1ページあたりの最大テキスト文字数
+
+    Returns:
+        URLと同じ順序の結果 {"url", "title", "headings", "text", "bytes", "status", "error"}
+    """
+    max_concurrency = max_concurrency or settings.page_fetch_concurrency
+    per_host = per_host or settings.page_fetch_per_host
+    max_bytes = max_bytes or settings.page_fetch_max_bytes
+    timeout = timeout or settings.page_fetch_timeout
+    max_chars = max_chars or settings.page_fetch_max_chars
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def fetch(client: httpx.AsyncClient, url: str) -> Dict[str, Any]:
+        host = urlparse(url).netloc.lower()
+        host_semaphore = host_semaphores.setdefault(host, asyncio.Semaphore(per_host))
+        async with semaphore, host_semaphore:
+            try:
+                return await asyncio.wait_for(_fetch_one(client, url, max_bytes, max_chars), timeout)
+            except asyncio.TimeoutError:
+                error = f"{timeout}秒以内に取得できませんでした"
+            except (httpx.HTTPError, UnicodeError, LookupError) as e:
+                error = str(e) or type(e).__name__
+            return {"url": url, "title": "", "headings": [], "text": "", "bytes": 0, "status": None, "error": error}
+
+    valid_urls = [url for url in urls if url and urlparse(url).scheme in ("http", "https")]
+    if not valid_urls:
+        return []
+    async with httpx.AsyncClient(
+        follow_redirects=True,
+        headers={"User-Agent": _USER_AGENT, "Accept": "text/html,application/xhtml+xml"},
+        timeout=httpx.Timeout(timeout),
+        limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+    ) as client:
+        return await asyncio.gather(*(fetch(client, url) for url in valid_urls))
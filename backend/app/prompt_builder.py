@@ -0,0 +1,269 @@
+"""
+トークン予算つきのプロンプト組み立て
+プロンプトの可変部分（知識ベース、競合分析、競合ページ本文など）をセクションとして登録し、
+モデルごとの上限から固定部分を除いた予算をセクションに配分して、超過分を切り詰め・要約してから埋め込む
+最終的なトークン数はメトリクスに記録する
+"""
+import json
+import math
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.metrics import record_prompt_tokens
+
+try:
+    import tiktoken
+except ImportError:  # tiktokenは任意依存（なければ文字種から概算）
+    tiktoken = None
+
+
+# 切り詰めたことを示す記号
+TRUNCATION_MARK = "…（省略）"
+
+_CJK_CHARS = "\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef"
+_CJK = re.compile(f"[{_CJK_CHARS}]")
+_ASCII_RUN = re.compile(r"[\x21-\x7e]+")
+# CJK・英数字・空白以外（絵文字など）
+_OTHER = re.compile(rf"[^\s\x21-\x7e{_CJK_CHARS}]")
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        # OpenAI以外のモデル、またはエンコーディングを取得できない環境では概算を使う
+        return None
+
+
+def count_tokens(text: str, model: str = "") -> int:
+    """
+    トークン数を数える（tiktokenがない・対応していないモデルは概算）
+
+    概算では日本語（CJK）は1文字1トークン、英数字・記号は4文字1トークンとみなす
+    （gpt-4o・Geminiのトークナイザよりやや多めに見積もる）
+
+    Args:
+        text: テキスト
+        model: モデル名
+
+    Returns:
+        トークン数
+    """
+    if not text:
+        return 0
+    encoding = _encoding(model) if model else None
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    ascii_tokens = sum(math.ceil(len(run) / 4) for run in _ASCII_RUN.findall(text))
+    return len(_CJK.findall(text)) + ascii_tokens + len(_OTHER.findall(text))
+
+
+def token_limit(model: str) -> int:
+    """モデルのプロンプト上限（トークン）"""
+    return settings.prompt_token_limits.get(model, settings.prompt_token_limit_default)
+
+
+def truncate_text(text: str, max_tokens: int, model: str = "") -> str:
+    """
+    予算に収まるよう末尾を切り詰める（段落・文の区切りを優先して切る）
+
+    Args:
+        text: テキスト
+        max_tokens: 予算（トークン）
+        model: モデル名
+
+    Returns:
+        切り詰めたテキスト（切り詰めた場合は末尾に省略記号）
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    budget = max_tokens - count_tokens(TRUNCATION_MARK, model)
+    if budget <= 0:
+        return ""
+    # 予算に収まる最長の文字数を二分探索
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle], model) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    head = text[:low]
+    # 後半に段落・文の区切りがあればそこで切る
+    for separator in ("\n\n", "\n", "。", ". "):
+        cut = head.rfind(separator)
+        if cut >= len(head) // 2:
+            head = head[:cut + len(separator)]
+            break
+    return head.rstrip() + TRUNCATION_MARK
+
+
+def _compact(value: Any, max_items: int, max_chars: int) -> Any:
+    if isinstance(value, dict):
+        return {key: _compact(item, max_items, max_chars) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_compact(item, max_items, max_chars) for item in value[:max_items]]
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + "…"
+    return value
+
+
+def compact_json(text: str, max_tokens: int, model: str = "") -> str:
+    """
+    JSONテキストを要約して予算に収める
+    キー構造を残したまま、配列の件数と文字列の長さを段階的に減らす（JSONでなければ末尾を切り詰める）
+
+    Args:
+        text: JSONテキスト
+        max_tokens: 予算（トークン）
+        model: モデル名
+
+    Returns:
+        予算に収めたテキスト
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    try:
+        value = json.loads(text)
+    except (TypeError, ValueError):
+        return truncate_text(text, max_tokens, model)
+    for max_items, max_chars in ((10, 200), (5, 120), (3, 80), (2, 60), (1, 40)):
+        compacted = json.dumps(_compact(value, max_items, max_chars), ensure_ascii=False)
+        if count_tokens(compacted, model) <= max_tokens:
+            return compacted
+    return truncate_text(compacted, max_tokens, model)
+
+
+class PromptBuilder:
+    """
+    プロンプトの可変セクションに予算を配分する
+
+    使い方:
+        builder = PromptBuilder("gpt-4o", "title")
+        builder.add("knowledge", knowledge_context, max_tokens=1500)
+        builder.add("summaries", summaries, max_tokens=2000, shrink=compact_json)
+        sections = builder.fit(reserved_tokens=count_tokens(固定部分))
+        prompt = f"...{sections['knowledge']}...{sections['summaries']}..."
+        builder.finish(prompt)
+    """
+
+    def __init__(self, model: str, operation: str, limit: Optional[int] = None):
+        """
+        Args:
+            model: モデル名（トークン数の計算と上限の決定に使用）
+            operation: 呼び出し箇所（メトリクスに使用）
+            limit: プロンプト全体の上限（Noneの場合は設定のモデル別上限）
+        """
+        self.model = model
+        self.operation = operation
+        self.limit = limit or token_limit(model)
+        self._sections: List[Dict[str, Any]] = []
+        self._fitted: Dict[str, Dict[str, int]] = {}
+
+    def add(
+        self,
+        name: str,
+        text: Optional[str],
+        max_tokens: Optional[int] = None,
+        weight: float = 1.0,
+        shrink: Callable[[str, int, str], str] = truncate_text
+    ) -> "PromptBuilder":
+        """
+        セクションを登録
+
+        Args:
+            name: セクション名
+            text: セクションの内容
+            max_tokens: このセクションの上限（全体の予算に余裕があってもこれ以上は使わない）
+            weight: 全体の予算が足りない場合の配分の重み
+            shrink: 予算に収める関数 (text, max_tokens, model) -> text
+        """
+        text = text or ""
+        self._sections.append({
+            "name": name,
+            "text": text,
+            "tokens": count_tokens(text, self.model),
+            "max_tokens": max_tokens,
+            "weight": weight,
+            "shrink": shrink,
+        })
+        return self
+
+    def _allocate(self, available: int) -> Dict[str, int]:
+        """各セクションの予算を決める（必要量の少ないセクションから満たし、余りを重みで再配分）"""
+        demands = {
+            section["name"]: min(section["tokens"], section["max_tokens"] or section["tokens"])
+            for section in self._sections
+        }
+        budgets: Dict[str, int] = {}
+        pending = [section for section in self._sections if demands[section["name"]] > 0]
+        remaining = max(0, available)
+        while pending:
+            total_weight = sum(section["weight"] for section in pending)
+            satisfied = [
+                section for section in pending
+                if demands[section["name"]] <= remaining * section["weight"] / total_weight
+            ]
+            if not satisfied:
+                for section in pending:
+                    budgets[section["name"]] = int(remaining * section["weight"] / total_weight)
+                break
+            for section in satisfied:
+                budgets[section["name"]] = demands[section["name"]]
+                remaining -= demands[section["name"]]
+            pending = [section for section in pending if section not in satisfied]
+        for section in self._sections:
+            budgets.setdefault(section["name"], 0)
+        return budgets
+
+    def fit(self, reserved_tokens: int = 0) -> Dict[str, str]:
+        """
+        セクションを予算に収める
+
+        Args:
+            reserved_tokens: セクション以外（固定の指示文など）のトークン数
+
+        Returns:
+            セクション名 -> 予算に収めた内容
+        """
+        budgets = self._allocate(self.limit - reserved_tokens)
+        fitted: Dict[str, str] = {}
+        for section in self._sections:
+            name = section["name"]
+            text = section["text"]
+            if section["tokens"] > budgets[name]:
+                text = section["shrink"](text, budgets[name], self.model) if budgets[name] > 0 else ""
+            fitted[name] = text
+            self._fitted[name] = {"original": section["tokens"], "final": count_tokens(text, self.model)}
+        return fitted
+
+    def finish(self, prompt: Any) -> int:
+        """
+        組み立てたプロンプトのトークン数を記録
+
+        Args:
+            prompt: プロンプト（文字列、またはOpenAIのメッセージのリスト）
+
+        Returns:
+            プロンプト全体のトークン数
+        """
+        if isinstance(prompt, list):
+            text = "\n".join(str(message.get("content", "")) for message in prompt)
+        else:
+            text = str(prompt)
+        total = count_tokens(text, self.model)
+        sections = {name: counts["final"] for name, counts in self._fitted.items()}
+        record_prompt_tokens(self.model, self.operation, total, sections)
+
+        shrunk = [
+            f"{name} {counts['original']}→{counts['final']}"
+            for name, counts in self._fitted.items() if counts["final"] < counts["original"]
+        ]
+        if shrunk or total > self.limit:
+            print(f"[prompt_builder] {self.operation}: {total}/{self.limit} tokens（{', '.join(shrunk) or '切り詰めなし'}）")
+        return total
@@ -0,0 +1,176 @@
+"""
+2層レスポンスキャッシュ
+メモリ上のLRU（上限件数あり）の後ろにSQLiteの永続層を置き、TTL付きで値を保持する
+値はJSONシリアライズ可能なオブジェクトであること
+"""
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class TwoTierCache:
+    """インメモリLRU + SQLite の2層キャッシュ（スレッドセーフ）"""
+
+    def __init__(
+        self,
+        name: str,
+        db_path: Optional[str],
+        max_memory_items: int = 256,
+        max_disk_items: int = 5000,
+    ):
+        """
+        Args:
+            name: キャッシュ名（SQLiteのテーブル名にも使用）
+            db_path: SQLiteファイルのパス（Noneまたは空文字ならメモリ層のみ）
+            max_memory_items: メモリ層の最大件数
+            max_disk_items: ディスク層の最大件数
+        """
+        self.name = name
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._sets_since_trim = 0
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "expired": 0,
+        }
+        if db_path:
+            self._open_disk(db_path)
+
+    def _open_disk(self, db_path: str) -> None:
+        try:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(db_path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.name} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{self.name}_accessed_at ON {self.name} (accessed_at)"
+            )
+            conn.commit()
+            self._conn = conn
+        except (sqlite3.Error, OSError) as exc:
+            # ディスク層が使えない環境（読み取り専用FSなど）ではメモリ層のみで動作
+            print(f"[{self.name}] ディスクキャッシュを無効化します: {exc}")
+            self._conn = None
+
+    def _remember_locked(self, key: str, expires_at: float, value: Any) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self._stats["memory_evictions"] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        """キャッシュから値を取得（期限切れ・未登録はNone）"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return copy.deepcopy(value)
+                self._memory.pop(key, None)
+                self._stats["expired"] += 1
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        f"SELECT value, expires_at FROM {self.name} WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        raw_value, expires_at = row
+                        if expires_at > now:
+                            self._conn.execute(
+                                f"UPDATE {self.name} SET accessed_at = ? WHERE key = ?", (now, key)
+                            )
+                            self._conn.commit()
+                            value = json.loads(raw_value)
+                            self._remember_locked(key, expires_at, value)
+                            self._stats["disk_hits"] += 1
+                            return copy.deepcopy(value)
+                        self._conn.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+                        self._conn.commit()
+                        self._stats["expired"] += 1
+                except sqlite3.Error as exc:
+                    print(f"[{self.name}] ディスクキャッシュ読み込みエラー: {exc}")
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        """値をキャッシュに保存"""
+        if ttl_seconds <= 0:
+            return
+        now = time.time()
+        expires_at = now + ttl_seconds
+        with self._lock:
+            self._remember_locked(key, expires_at, copy.deepcopy(value))
+            self._stats["sets"] += 1
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {self.name} (key, value, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), expires_at, now),
+                )
+                self._conn.commit()
+                self._sets_since_trim += 1
+                if self._sets_since_trim >= 50:
+                    self._trim_disk_locked(now)
+            except (sqlite3.Error, TypeError, ValueError) as exc:
+                print(f"[{self.name}] ディスクキャッシュ書き込みエラー: {exc}")
+
+    def _trim_disk_locked(self, now: float) -> None:
+        """期限切れの削除と、上限件数を超えた古いエントリの削除"""
+        self._sets_since_trim = 0
+        cursor = self._conn.execute(f"DELETE FROM {self.name} WHERE expires_at <= ?", (now,))
+        self._stats["expired"] += max(cursor.rowcount, 0)
+        count = self._conn.execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+        overflow = count - self.max_disk_items
+        if overflow > 0:
+            self._conn.execute(
+                f"DELETE FROM {self.name} WHERE key IN ("
+                f"SELECT key FROM {self.name} ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            )
+            self._stats["disk_evictions"] += overflow
+        self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        """エントリを削除"""
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._conn is not None:
+                try:
+                    self._conn.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+                    self._conn.commit()
+                except sqlite3.Error as exc:
+                    print(f"[{self.name}] ディスクキャッシュ削除エラー: {exc}")
+
+    def stats(self) -> Dict[str, int]:
+        """ヒット・ミス・追い出し件数のスナップショット"""
+        with self._lock:
+            result = dict(self._stats)
+            result["memory_items"] = len(self._memory)
+            return result
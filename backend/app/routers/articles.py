@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, status, BackgroundTasks
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 from pydantic import BaseModel
 import requests
@@ -13,6 +13,7 @@ from app.tasks import generate_article_task
 from app.rate_limit import rate_limit
 from app.sanitize import sanitize_html
 from app.utils import get_client_ip
+from app.config import settings
 
 router = APIRouter()
 
@@ -256,6 +257,19 @@ async def create_article_endpoint(
     )
     print(f"[create_article_endpoint] 記事作成完了: id={article.get('id')}, status={article.get('status')}")
     
+    # 重要キーワードを保存（キーワード分析・記事生成・再開で使用）
+    important_keywords = {
+        f"important_keyword{index}": getattr(article_data, f"important_keyword{index}")
+        for index in range(1, 4)
+        if getattr(article_data, f"important_keyword{index}")
+    }
+    if important_keywords:
+        try:
+            article = update_article(article.get("id"), str(current_user.get("id")), important_keywords) or article
+        except Exception as e:
+            # add_important_keyword_columns.sql が未適用の場合は保存せずに続行
+            print(f"[create_article_endpoint] 重要キーワードの保存に失敗しました（続行）: {str(e)}")
+    
     # 履歴を記録
     create_article_history(
         article_id=article.get("id"),
@@ -471,6 +485,11 @@ class KeywordSelection(BaseModel):
     selected_keywords: List[str]
 
 
+class KeywordAnalysisOptions(BaseModel):
+    # Google Ads APIの呼び出し方法（"live" または標準キューの "queued"。省略時は設定値）
+    dataforseo_mode: Optional[str] = None
+
+
 @router.post(
     "/{article_id}/start-keyword-analysis",
     dependencies=[Depends(rate_limit(limit=10, window_seconds=60))]
@@ -479,6 +498,7 @@ async def start_keyword_analysis_endpoint(
     article_id: UUID,
     background_tasks: BackgroundTasks,
     request: Request,
+    options: Optional[KeywordAnalysisOptions] = None,
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -511,14 +531,21 @@ async def start_keyword_analysis_endpoint(
             detail="キーワード分析は既に実行中です"
         )
     
+    dataforseo_mode = (options.dataforseo_mode if options else None) or settings.dataforseo_keyword_analysis_mode
+    if dataforseo_mode not in ("live", "queued"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="dataforseo_modeは live または queued を指定してください"
+        )
+    
     # 記事データを準備
     article_data = {
         "keyword": article.get("keyword"),
         "target": article.get("target"),
         "article_type": article.get("article_type"),
-        "important_keyword1": None,
-        "important_keyword2": None,
-        "important_keyword3": None,
+        "important_keyword1": article.get("important_keyword1"),
+        "important_keyword2": article.get("important_keyword2"),
+        "important_keyword3": article.get("important_keyword3"),
         "secondary_keywords": []
     }
     
@@ -549,7 +576,8 @@ async def start_keyword_analysis_endpoint(
             analyze_keywords_task(
                 article_id=str(article_id),
                 article_data=article_data,
-                user_id=str(current_user.get("id"))
+                user_id=str(current_user.get("id")),
+                dataforseo_mode=dataforseo_mode
             )
         except Exception as e:
             print(f"[start_keyword_analysis_endpoint] 別スレッドでのタスク実行エラー: {str(e)}")
@@ -566,7 +594,8 @@ async def start_keyword_analysis_endpoint(
             analyze_keywords_task,
             article_id=str(article_id),
             article_data=article_data,
-            user_id=str(current_user.get("id"))
+            user_id=str(current_user.get("id")),
+            dataforseo_mode=dataforseo_mode
         )
         print(f"[start_keyword_analysis_endpoint] キーワード分析タスクをBackgroundTasksにも追加しました")
     except Exception as e:
@@ -634,9 +663,9 @@ async def select_keywords_endpoint(
             "keyword": article.get("keyword"),
             "target": article.get("target"),
             "article_type": article.get("article_type"),
-            "important_keyword1": None,
-            "important_keyword2": None,
-            "important_keyword3": None,
+            "important_keyword1": article.get("important_keyword1"),
+            "important_keyword2": article.get("important_keyword2"),
+            "important_keyword3": article.get("important_keyword3"),
             "secondary_keywords": selected_keywords  # 選択されたキーワードをセカンダリキーワードとして使用
         }
         
@@ -672,6 +701,59 @@ async def select_keywords_endpoint(
         )
 
 
+@router.post(
+    "/{article_id}/resume",
+    dependencies=[Depends(rate_limit(limit=10, window_seconds=60))]
+)
+async def resume_article_endpoint(
+    article_id: UUID,
+    background_tasks: BackgroundTasks,
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    失敗した記事生成を再開（成功済みのステージはチェックポイントから復元）
+    """
+    from app.tasks import resume_article_task
+
+    article = get_article_by_id(str(article_id), str(current_user.get("id")))
+
+    if not article:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="記事が見つかりません"
+        )
+
+    if article.get("status") != "failed":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="記事生成に失敗した記事のみ再開できます"
+        )
+
+    update_article(
+        str(article_id),
+        str(current_user.get("id")),
+        {"status": "processing", "error_message": None}
+    )
+    create_article_history(
+        article_id=str(article_id),
+        action="resumed",
+        changes={"previous_error": article.get("error_message")}
+    )
+
+    background_tasks.add_task(
+        resume_article_task,
+        article_id=str(article_id),
+        user_id=str(current_user.get("id"))
+    )
+
+    return {
+        "message": "記事生成を再開しました",
+        "article_id": str(article_id),
+        "status": "processing"
+    }
+
+
 @router.post(
     "/{article_id}/publish-wordpress",
     dependencies=[Depends(rate_limit(limit=10, window_seconds=300))]
@@ -4,16 +4,22 @@ DataForSEO Labs API ルーター
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from typing import Dict, Any, Optional, List
-import requests
 import json
 import os
 from app.dependencies import get_current_user
-from app.dataforseo_client import get_dataforseo_config, _get_auth_header
+from app.dataforseo_gateway import (
+    resolve_router_config,
+    post_dataforseo,
+    router_result,
+    describe_error,
+)
+from app.dataforseo_transport import build_auth_headers, dataforseo_url
 from app.rate_limit import rate_limit
 
 router = APIRouter()
 
-BASE_URL = "https://api.dataforseo.com/v3/dataforseo_labs/google"
+# ベースURLは設定で切り替えられるため、パスだけを持ちリクエストごとにURLにする
+BASE_PATH = "/v3/dataforseo_labs/google"
 
 
 @router.post(
@@ -52,24 +58,8 @@ async def analyze_dataforseo_labs(
     user_id = str(current_user.get("id"))
     
     # DataForSEO認証情報を取得
-    config = get_dataforseo_config(user_id)
-    if not config:
-        login = os.getenv("DATAFORSEO_LOGIN")
-        password = os.getenv("DATAFORSEO_PASSWORD")
-        if not login or not password:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="DataForSEO設定が完了していません。設定ページでDataForSEO情報を登録してください。"
-            )
-        config = {"login": login, "password": password}
-    
-    # 認証ヘッダーを生成
-    auth_header = _get_auth_header(config["login"], config["password"])
-    
-    headers = {
-        'Authorization': auth_header,
-        'Content-Type': 'application/json'
-    }
+    config = resolve_router_config(user_id)
+    headers = build_auth_headers(config)
     
     # エンドポイントごとのペイロードを生成
     payload_dict = {}
@@ -88,7 +78,7 @@ async def analyze_dataforseo_labs(
             "replace_with_core_keyword": False,
             "limit": 100
         }
-        url = f"{BASE_URL}/related_keywords/live"
+        url = dataforseo_url(f"{BASE_PATH}/related_keywords/live")
     
     elif endpoint == "keywords_for_site":
         if not target:
@@ -103,7 +93,7 @@ async def analyze_dataforseo_labs(
             "include_clickstream_data": False,
             "limit": 100
         }
-        url = f"{BASE_URL}/keywords_for_site/live"
+        url = dataforseo_url(f"{BASE_PATH}/keywords_for_site/live")
     
     elif endpoint == "keyword_suggestions":
         if not keyword:
@@ -118,7 +108,7 @@ async def analyze_dataforseo_labs(
             "exact_match": False,
             "limit": 100
         }
-        url = f"{BASE_URL}/keyword_suggestions/live"
+        url = dataforseo_url(f"{BASE_PATH}/keyword_suggestions/live")
     
     elif endpoint == "keyword_ideas":
         if not keywords:
@@ -132,7 +122,7 @@ async def analyze_dataforseo_labs(
             "include_clickstream_data": False,
             "limit": 100
         }
-        url = f"{BASE_URL}/keyword_ideas/live"
+        url = dataforseo_url(f"{BASE_PATH}/keyword_ideas/live")
     
     elif endpoint == "ranked_keywords":
         if not target:
@@ -147,7 +137,7 @@ async def analyze_dataforseo_labs(
             "load_rank_absolute": False,
             "limit": 100
         }
-        url = f"{BASE_URL}/ranked_keywords/live"
+        url = dataforseo_url(f"{BASE_PATH}/ranked_keywords/live")
     
     elif endpoint == "serp_competitors":
         if not keywords:
@@ -159,7 +149,7 @@ async def analyze_dataforseo_labs(
             "include_subdomains": True,
             "limit": 100
         }
-        url = f"{BASE_URL}/serp_competitors/live"
+        url = dataforseo_url(f"{BASE_PATH}/serp_competitors/live")
     
     elif endpoint == "competitors_domain":
         if not target:
@@ -173,7 +163,7 @@ async def analyze_dataforseo_labs(
             "include_clickstream_data": False,
             "limit": 100
         }
-        url = f"{BASE_URL}/competitors_domain/live"
+        url = dataforseo_url(f"{BASE_PATH}/competitors_domain/live")
     
     elif endpoint == "domain_intersection":
         if not target1 or not target2:
@@ -188,7 +178,7 @@ async def analyze_dataforseo_labs(
             "intersections": True,
             "limit": 100
         }
-        url = f"{BASE_URL}/domain_intersection/live"
+        url = dataforseo_url(f"{BASE_PATH}/domain_intersection/live")
     
     elif endpoint == "keyword_overview":
         if not keywords:
@@ -200,7 +190,7 @@ async def analyze_dataforseo_labs(
             "include_serp_info": False,
             "include_clickstream_data": False
         }
-        url = f"{BASE_URL}/keyword_overview/live"
+        url = dataforseo_url(f"{BASE_PATH}/keyword_overview/live")
     
     elif endpoint == "bulk_keyword_difficulty":
         if not keywords:
@@ -210,7 +200,7 @@ async def analyze_dataforseo_labs(
             "location_code": location_code,
             "language_code": language_code
         }
-        url = f"{BASE_URL}/bulk_keyword_difficulty/live"
+        url = dataforseo_url(f"{BASE_PATH}/bulk_keyword_difficulty/live")
     
     elif endpoint == "search_intent":
         if not keywords:
@@ -219,7 +209,7 @@ async def analyze_dataforseo_labs(
             "keywords": keywords,
             "language_code": language_code
         }
-        url = f"{BASE_URL}/search_intent/live"
+        url = dataforseo_url(f"{BASE_PATH}/search_intent/live")
     
     elif endpoint == "top_searches":
         payload_dict = {
@@ -230,7 +220,7 @@ async def analyze_dataforseo_labs(
             "include_clickstream_data": False,
             "limit": 100
         }
-        url = f"{BASE_URL}/top_searches/live"
+        url = dataforseo_url(f"{BASE_PATH}/top_searches/live")
     
     else:
         raise HTTPException(
@@ -245,40 +235,28 @@ async def analyze_dataforseo_labs(
         print(f"[dataforseo_labs] API呼び出し: {endpoint} - {url}")
         print(f"[dataforseo_labs] Payload: {payload}")
         
-        response = requests.post(url, headers=headers, data=payload, timeout=120)
+        response = await post_dataforseo(url, payload, config)
         print(f"[dataforseo_labs] レスポンス HTTP Status: {response.status_code}")
         
         # 提供されたDataForSEOLabsAPI.pyと同じ形式で結果を保存
-        result = {
-            "url": url,
-            "payload": payload,
-            "headers": dict(headers),
-            "response_text": response.text,
-            "http_status_code": response.status_code,
-        }
+        result = router_result(url, payload, headers, response)
         
-        # JSONレスポンスをパース（可能な場合）
-        try:
-            response_json = response.json()
-            result["response_json"] = response_json
-            
-            # エラーステータスコードをチェック
-            if isinstance(response_json, dict):
-                tasks = response_json.get("tasks", [])
-                if tasks and len(tasks) > 0:
-                    task_status = tasks[0].get("status_code")
-                    task_message = tasks[0].get("status_message", "")
-                    if task_status and task_status != 20000:
-                        print(f"[dataforseo_labs] APIエラー: status_code={task_status}, message={task_message}")
-        except:
-            pass
+        # エラーステータスコードをチェック
+        response_json = result.get("response_json")
+        if isinstance(response_json, dict):
+            tasks = response_json.get("tasks") or []
+            if tasks:
+                task_status = tasks[0].get("status_code")
+                task_message = tasks[0].get("status_message", "")
+                if task_status and task_status != 20000:
+                    print(f"[dataforseo_labs] APIエラー: status_code={task_status}, message={task_message}")
         
         return result
             
     except Exception as e:
-        print(f"[dataforseo_labs] API呼び出しエラー: {endpoint} - {str(e)}")
+        print(f"[dataforseo_labs] API呼び出しエラー: {endpoint} - {describe_error(e)}")
         raise HTTPException(
             status_code=500,
-            detail=f"API呼び出しエラー: {str(e)}"
+            detail=f"API呼び出しエラー: {describe_error(e)}"
         )
 
@@ -4,11 +4,17 @@ DataForSEO Domain Analytics API ルーター
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from typing import Dict, Any, Optional, List
-import requests
 import json
 import os
 from app.dependencies import get_current_user
-from app.dataforseo_client import get_dataforseo_config, _get_auth_header
+from app.dataforseo_gateway import (
+    resolve_router_config,
+    post_dataforseo_many,
+    router_result,
+    router_error_result,
+    describe_error,
+)
+from app.dataforseo_transport import build_auth_headers, dataforseo_url
 from app.rate_limit import rate_limit
 
 router = APIRouter()
@@ -39,24 +45,8 @@ async def analyze_domain_analytics(
     user_id = str(current_user.get("id"))
     
     # DataForSEO認証情報を取得
-    config = get_dataforseo_config(user_id)
-    if not config:
-        login = os.getenv("DATAFORSEO_LOGIN")
-        password = os.getenv("DATAFORSEO_PASSWORD")
-        if not login or not password:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="DataForSEO設定が完了していません。設定ページでDataForSEO情報を登録してください。"
-            )
-        config = {"login": login, "password": password}
-    
-    # 認証ヘッダーを生成
-    auth_header = _get_auth_header(config["login"], config["password"])
-    
-    headers = {
-        'Authorization': auth_header,
-        'Content-Type': 'application/json'
-    }
+    config = resolve_router_config(user_id)
+    headers = build_auth_headers(config)
     
     # リクエストパターンのリスト（提供されたDomainAnalyticsAPI.pyと同じ形式）
     request_patterns = []
@@ -65,7 +55,7 @@ async def analyze_domain_analytics(
     if keyword:
         request_patterns.append({
             "name": "related_keywords",
-            "url": "https://api.dataforseo.com/v3/dataforseo_labs/google/related_keywords/live",
+            "url": dataforseo_url("/v3/dataforseo_labs/google/related_keywords/live"),
             "payload": [{
                 "keyword": keyword,
                 "location_code": location_code,
@@ -82,7 +72,7 @@ async def analyze_domain_analytics(
         # keyword_suggestions（キーワードが必要）
         request_patterns.append({
             "name": "keyword_suggestions",
-            "url": "https://api.dataforseo.com/v3/dataforseo_labs/google/keyword_suggestions/live",
+            "url": dataforseo_url("/v3/dataforseo_labs/google/keyword_suggestions/live"),
             "payload": [{
                 "keyword": keyword,
                 "location_code": location_code,
@@ -98,7 +88,7 @@ async def analyze_domain_analytics(
         # keyword_ideas（キーワードが必要）
         request_patterns.append({
             "name": "keyword_ideas",
-            "url": "https://api.dataforseo.com/v3/dataforseo_labs/google/keyword_ideas/live",
+            "url": dataforseo_url("/v3/dataforseo_labs/google/keyword_ideas/live"),
             "payload": [{
                 "keywords": [keyword],
                 "location_code": location_code,
@@ -114,7 +104,7 @@ async def analyze_domain_analytics(
     if target:
         request_patterns.append({
             "name": "keywords_for_site",
-            "url": "https://api.dataforseo.com/v3/dataforseo_labs/google/keywords_for_site/live",
+            "url": dataforseo_url("/v3/dataforseo_labs/google/keywords_for_site/live"),
             "payload": [{
                 "target": target,
                 "location_code": location_code,
@@ -136,54 +126,36 @@ async def analyze_domain_analytics(
     # レスポンスデータリスト（提供されたDomainAnalyticsAPI.pyと同じ形式）
     results = []
     
-    # 各リクエストパターンを実行
+    # 各リクエストパターンを並行して実行
+    payloads = [json.dumps(pattern["payload"], ensure_ascii=False) for pattern in request_patterns]
     for pattern in request_patterns:
-        try:
-            url = pattern["url"]
-            payload = json.dumps(pattern["payload"], ensure_ascii=False)
-            
-            print(f"[domain_analytics] API呼び出し: {pattern['name']} - {url}")
-            
-            response = requests.post(url, headers=headers, data=payload, timeout=120)
-            print(f"[domain_analytics] レスポンス HTTP Status: {response.status_code}")
-            
-            # 提供されたDomainAnalyticsAPI.pyと同じ形式で結果を保存
-            result = {
-                "url": url,
-                "payload": payload,
-                "headers": dict(headers),  # 提供されたコードと同じ形式
-                "response_text": response.text,  # 提供されたコードと同じ形式
-                "http_status_code": response.status_code,  # HTTPステータスコード（追加情報）
-            }
-            
-            # JSONレスポンスをパース（可能な場合）
-            try:
-                response_json = response.json()
-                result["response_json"] = response_json
-                
-                # エラーステータスコードをチェック
-                if isinstance(response_json, dict):
-                    tasks = response_json.get("tasks", [])
-                    if tasks and len(tasks) > 0:
-                        task_status = tasks[0].get("status_code")
-                        task_message = tasks[0].get("status_message", "")
-                        if task_status and task_status != 20000:
-                            print(f"[domain_analytics] APIエラー: status_code={task_status}, message={task_message}")
-            except:
-                pass
-            
-            results.append(result)
-                
-        except Exception as e:
-            print(f"[domain_analytics] API呼び出しエラー: {pattern['name']} - {str(e)}")
-            results.append({
-                "url": pattern["url"],
-                "payload": json.dumps(pattern["payload"], ensure_ascii=False),
-                "error": str(e),
-                "http_status_code": None,
-                "response_text": None,
-                "response_json": None
-            })
+        print(f"[domain_analytics] API呼び出し: {pattern['name']} - {pattern['url']}")
+    responses = await post_dataforseo_many(
+        [(pattern["url"], payload) for pattern, payload in zip(request_patterns, payloads)], config
+    )
+    
+    for pattern, payload, response in zip(request_patterns, payloads, responses):
+        if isinstance(response, Exception):
+            print(f"[domain_analytics] API呼び出しエラー: {pattern['name']} - {describe_error(response)}")
+            results.append(router_error_result(pattern["url"], payload, response))
+            continue
+        
+        print(f"[domain_analytics] レスポンス HTTP Status: {response.status_code}")
+        
+        # 提供されたDomainAnalyticsAPI.pyと同じ形式で結果を保存
+        result = router_result(pattern["url"], payload, headers, response)
+        
+        # エラーステータスコードをチェック
+        response_json = result.get("response_json")
+        if isinstance(response_json, dict):
+            tasks = response_json.get("tasks") or []
+            if tasks:
+                task_status = tasks[0].get("status_code")
+                task_message = tasks[0].get("status_message", "")
+                if task_status and task_status != 20000:
+                    print(f"[domain_analytics] APIエラー: status_code={task_status}, message={task_message}")
+        
+        results.append(result)
     
     return {
         "keyword": keyword,
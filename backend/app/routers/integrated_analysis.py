@@ -4,16 +4,18 @@ tougou.mdの仕様に基づいて、複数のDataForSEO APIを統合して包括
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from typing import Dict, Any, Optional, List
-import requests
+import httpx
 import json
 import os
 from app.dependencies import get_current_user
-from app.dataforseo_client import get_dataforseo_config, _get_auth_header
+from app.dataforseo_gateway import resolve_router_config, post_dataforseo, describe_error
+from app.dataforseo_transport import dataforseo_url
 from app.rate_limit import rate_limit
 
 router = APIRouter()
 
-BASE_URL = "https://api.dataforseo.com/v3/dataforseo_labs/google"
+# ベースURLは設定で切り替えられるため、パスだけを持ちリクエストごとにURLにする
+BASE_PATH = "/v3/dataforseo_labs/google"
 
 
 def get_competition_level(competition_index: int) -> str:
@@ -88,29 +90,14 @@ async def integrated_analysis(
     統合分析エンドポイント
     メインキーワードと関連キーワードの包括的な分析を実行
     """
-    config = get_dataforseo_config(current_user.get("id")) if current_user.get("id") else None
-    
-    if not config:
-        login = os.getenv("DATAFORSEO_LOGIN")
-        password = os.getenv("DATAFORSEO_PASSWORD")
-        if not login or not password:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="DataForSEO設定が完了していません。"
-            )
-        config = {"login": login, "password": password}
-    
-    headers = {
-        "Authorization": _get_auth_header(config["login"], config["password"]),
-        "Content-Type": "application/json"
-    }
+    config = resolve_router_config(current_user.get("id"), "DataForSEO設定が完了していません。")
     
     # 1. メインキーワードの分析
     main_keyword_data = None
     try:
         # Google Ads Search Volume APIでメインキーワードのデータを取得
         # KeywordDataAPI.pyと同じ形式（language_codeは使用しない）
-        url = "https://api.dataforseo.com/v3/keywords_data/google_ads/search_volume/live"
+        url = dataforseo_url("/v3/keywords_data/google_ads/search_volume/live")
         payload = [{
             "keywords": [keyword],
             "sort_by": "relevance"
@@ -119,8 +106,7 @@ async def integrated_analysis(
         # DomainAnalyticsAPI.pyと同じ形式で送信（json.dumpsを使用）
         payload_json = json.dumps(payload, ensure_ascii=False)
         
-        # DomainAnalyticsと同じくrequests.postを使用
-        response = requests.post(url, headers=headers, data=payload_json, timeout=120)
+        response = await post_dataforseo(url, payload_json, config)
         response.raise_for_status()
         result = response.json()
         
@@ -140,7 +126,7 @@ async def integrated_analysis(
     # 2. 関連キーワードの取得（DataForSEO Labs related_keywords API）
     related_keywords_data = []
     try:
-        url = f"{BASE_URL}/related_keywords/live"
+        url = dataforseo_url(f"{BASE_PATH}/related_keywords/live")
         # DomainAnalyticsAPI.pyと同じ形式（language_nameは使用しない）
         payload = [{
             "keyword": keyword,
@@ -158,8 +144,7 @@ async def integrated_analysis(
         # DomainAnalyticsAPI.pyと同じ形式で送信（json.dumpsを使用）
         payload_json = json.dumps(payload, ensure_ascii=False)
         
-        # DomainAnalyticsと同じくrequests.postを使用
-        response = requests.post(url, headers=headers, data=payload_json, timeout=120)
+        response = await post_dataforseo(url, payload_json, config)
         response.raise_for_status()
         result = response.json()
         
@@ -190,7 +175,7 @@ async def integrated_analysis(
                     
                     # bulk_keyword_difficulty APIで難易度を一括取得
                     if related_keywords_list:
-                        difficulty_url = f"{BASE_URL}/bulk_keyword_difficulty/live"
+                        difficulty_url = dataforseo_url(f"{BASE_PATH}/bulk_keyword_difficulty/live")
                         # DomainAnalyticsAPI.pyと同じ形式（language_nameは使用しない）
                         difficulty_payload = [{
                             "keywords": related_keywords_list,
@@ -198,10 +183,9 @@ async def integrated_analysis(
                             "language_code": language_code
                         }]
                         
-                        # DomainAnalyticsと同じくrequests.postを使用
                         difficulty_payload_json = json.dumps(difficulty_payload, ensure_ascii=False)
-                        difficulty_response = requests.post(
-                            difficulty_url, headers=headers, data=difficulty_payload_json, timeout=120
+                        difficulty_response = await post_dataforseo(
+                            difficulty_url, difficulty_payload_json, config
                         )
                         difficulty_response.raise_for_status()
                         difficulty_result = difficulty_response.json()
@@ -222,16 +206,15 @@ async def integrated_analysis(
                     
                     # 各関連キーワードの検索ボリュームとCPCを取得
                     # KeywordDataAPI.pyと同じ形式（language_codeは使用しない）
-                    search_volume_url = "https://api.dataforseo.com/v3/keywords_data/google_ads/search_volume/live"
+                    search_volume_url = dataforseo_url("/v3/keywords_data/google_ads/search_volume/live")
                     search_volume_payload = [{
                         "keywords": related_keywords_list,
                         "sort_by": "relevance"
                     }]
                     
-                    # DomainAnalyticsと同じくrequests.postを使用
                     sv_payload_json = json.dumps(search_volume_payload, ensure_ascii=False)
-                    sv_response = requests.post(
-                        search_volume_url, headers=headers, data=sv_payload_json, timeout=120
+                    sv_response = await post_dataforseo(
+                        search_volume_url, sv_payload_json, config
                     )
                     sv_response.raise_for_status()
                     sv_result = sv_response.json()
@@ -284,8 +267,8 @@ async def integrated_analysis(
     except HTTPException:
         # HTTPExceptionはそのまま再スロー
         raise
-    except requests.exceptions.HTTPError as e:
-        error_msg = f"HTTPエラー: {e.response.status_code if e.response else 'Unknown'} - {e.response.text[:500] if e.response else str(e)}"
+    except httpx.HTTPStatusError as e:
+        error_msg = describe_error(e)
         print(f"関連キーワード分析エラー: {error_msg}")
         import traceback
         traceback.print_exc()
@@ -293,8 +276,8 @@ async def integrated_analysis(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"関連キーワード分析中にHTTPエラーが発生しました: {error_msg}"
         )
-    except requests.exceptions.RequestException as e:
-        error_msg = f"リクエストエラー: {str(e)}"
+    except httpx.RequestError as e:
+        error_msg = describe_error(e)
         print(f"関連キーワード分析エラー: {error_msg}")
         import traceback
         traceback.print_exc()
@@ -325,7 +308,7 @@ async def integrated_analysis(
         # メインキーワードの難易度を取得
         main_difficulty = 50  # デフォルト値
         try:
-            difficulty_url = f"{BASE_URL}/bulk_keyword_difficulty/live"
+            difficulty_url = dataforseo_url(f"{BASE_PATH}/bulk_keyword_difficulty/live")
             # DomainAnalyticsAPI.pyと同じ形式（language_nameは使用しない）
             difficulty_payload = [{
                 "keywords": [keyword],
@@ -333,10 +316,9 @@ async def integrated_analysis(
                 "language_code": language_code
             }]
             
-            # DomainAnalyticsと同じくrequests.postを使用
             difficulty_payload_json = json.dumps(difficulty_payload, ensure_ascii=False)
-            difficulty_response = requests.post(
-                difficulty_url, headers=headers, data=difficulty_payload_json, timeout=120
+            difficulty_response = await post_dataforseo(
+                difficulty_url, difficulty_payload_json, config
             )
             difficulty_response.raise_for_status()
             difficulty_result = difficulty_response.json()
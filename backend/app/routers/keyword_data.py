@@ -5,12 +5,17 @@ SEO対策向けの分析機能を追加
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from typing import Dict, Any, Optional, List
-import requests
 import json
 import base64
 import os
 from app.dependencies import get_current_user
-from app.dataforseo_client import get_dataforseo_config, _get_auth_header
+from app.dataforseo_gateway import (
+    resolve_router_config,
+    post_dataforseo_many,
+    router_result,
+    router_error_result,
+)
+from app.dataforseo_transport import build_auth_headers, dataforseo_url
 from app.rate_limit import rate_limit
 
 router = APIRouter()
@@ -154,50 +159,34 @@ async def analyze_keyword_data(
     user_id = str(current_user.get("id"))
     
     # DataForSEO認証情報を取得
-    config = get_dataforseo_config(user_id)
-    if not config:
-        login = os.getenv("DATAFORSEO_LOGIN")
-        password = os.getenv("DATAFORSEO_PASSWORD")
-        if not login or not password:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="DataForSEO設定が完了していません。設定ページでDataForSEO情報を登録してください。"
-            )
-        config = {"login": login, "password": password}
-    
-    # 認証ヘッダーを生成
-    auth_header = _get_auth_header(config["login"], config["password"])
-    
-    headers = {
-        'Authorization': auth_header,
-        'Content-Type': 'application/json'
-    }
+    config = resolve_router_config(user_id)
+    headers = build_auth_headers(config)
     
     # リクエストデータを準備
     requests_data = [
         {
             "name": "response1",
-            "url": "https://api.dataforseo.com/v3/keywords_data/google_ads/search_volume/live",
+            "url": dataforseo_url("/v3/keywords_data/google_ads/search_volume/live"),
             "payload": json.dumps([{"keywords": [keyword], "sort_by": "relevance"}]),
         },
         {
             "name": "response2",
-            "url": "https://api.dataforseo.com/v3/keywords_data/google_ads/keywords_for_site/live",
+            "url": dataforseo_url("/v3/keywords_data/google_ads/keywords_for_site/live"),
             "payload": json.dumps([{"target": keyword, "location_code": location_code, "language_code": "ja", "sort_by": "relevance"}]),
         },
         {
             "name": "response3",
-            "url": "https://api.dataforseo.com/v3/keywords_data/google_ads/keywords_for_keywords/live",
+            "url": dataforseo_url("/v3/keywords_data/google_ads/keywords_for_keywords/live"),
             "payload": json.dumps([{"keywords": [keyword], "sort_by": "relevance"}]),
         },
         {
             "name": "response4",
-            "url": "https://api.dataforseo.com/v3/keywords_data/google_trends/explore/live",
+            "url": dataforseo_url("/v3/keywords_data/google_trends/explore/live"),
             "payload": json.dumps([{"keywords": [keyword]}]),
         },
         {
             "name": "response5",
-            "url": "https://api.dataforseo.com/v3/keywords_data/dataforseo_trends/explore/live",
+            "url": dataforseo_url("/v3/keywords_data/dataforseo_trends/explore/live"),
             "payload": json.dumps([{"keywords": [keyword], "location_code": location_code}]),
         },
     ]
@@ -206,48 +195,33 @@ async def analyze_keyword_data(
     keyword_data = None
     related_keywords = []
     
-    # 各APIを呼び出し
-    for req in requests_data:
+    # 各APIを並行して呼び出し
+    responses = await post_dataforseo_many(
+        [(req["url"], req["payload"]) for req in requests_data], config
+    )
+    for req, response in zip(requests_data, responses):
+        if isinstance(response, Exception):
+            results[req["name"]] = router_error_result(req["url"], req["payload"], response)
+            continue
+        
+        results[req["name"]] = router_result(req["url"], req["payload"], headers, response)
+        
+        # JSONレスポンスからデータを抽出
+        response_json = results[req["name"]].get("response_json")
         try:
-            response = requests.post(req["url"], headers=headers, data=req["payload"], timeout=120)
-            
-            results[req["name"]] = {
-                "url": req["url"],
-                "payload": req["payload"],
-                "headers": dict(headers),
-                "response_text": response.text,
-                "http_status_code": response.status_code,
-            }
-            
-            # JSONレスポンスをパース
-            try:
-                response_json = response.json()
-                results[req["name"]]["response_json"] = response_json
-                
-                # キーワードデータを抽出
-                if req["name"] == "response1":
-                    keyword_data = extract_keyword_data(response_json)
-                elif req["name"] == "response3":
-                    # 関連キーワードを抽出
-                    if isinstance(response_json, dict):
-                        tasks = response_json.get("tasks", [])
-                        if tasks and len(tasks) > 0 and tasks[0].get("status_code") == 20000:
-                            related_results = tasks[0].get("result", [])
-                            if related_results:
-                                related_keywords = related_results[:10]  # 上位10個
-                
-            except:
-                pass
-                
-        except Exception as e:
-            results[req["name"]] = {
-                "url": req["url"],
-                "payload": req["payload"],
-                "error": str(e),
-                "http_status_code": None,
-                "response_text": None,
-                "response_json": None
-            }
+            # キーワードデータを抽出
+            if req["name"] == "response1":
+                keyword_data = extract_keyword_data(response_json)
+            elif req["name"] == "response3":
+                # 関連キーワードを抽出
+                if isinstance(response_json, dict):
+                    tasks = response_json.get("tasks", [])
+                    if tasks and len(tasks) > 0 and tasks[0].get("status_code") == 20000:
+                        related_results = tasks[0].get("result", [])
+                        if related_results:
+                            related_keywords = related_results[:10]  # 上位10個
+        except:
+            pass
     
     # SEO分析結果を構築
     seo_analysis = None
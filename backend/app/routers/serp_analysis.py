@@ -5,13 +5,20 @@ SEO対策向けの分析機能を追加
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from typing import Dict, Any, Optional, List
-import requests
+from pydantic import BaseModel
 import json
 import os
 import re
 from collections import Counter
 from app.dependencies import get_current_user
-from app.dataforseo_client import get_dataforseo_config, _get_auth_header
+from app.dataforseo_client import get_serp_data_many
+from app.dataforseo_gateway import (
+    resolve_router_config,
+    post_dataforseo,
+    router_result,
+    router_error_result,
+)
+from app.dataforseo_transport import build_auth_headers, dataforseo_url
 from app.rate_limit import rate_limit
 
 router = APIRouter()
@@ -627,28 +634,12 @@ async def analyze_serp(
     user_id = str(current_user.get("id"))
     
     # DataForSEO認証情報を取得
-    config = get_dataforseo_config(user_id)
-    if not config:
-        login = os.getenv("DATAFORSEO_LOGIN")
-        password = os.getenv("DATAFORSEO_PASSWORD")
-        if not login or not password:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="DataForSEO設定が完了していません。設定ページでDataForSEO情報を登録してください。"
-            )
-        config = {"login": login, "password": password}
-    
-    # 認証ヘッダーを生成
-    auth_header = _get_auth_header(config["login"], config["password"])
-    
-    headers = {
-        'Authorization': auth_header,
-        'Content-Type': 'application/json'
-    }
+    config = resolve_router_config(user_id)
+    headers = build_auth_headers(config)
     
     # Google Desktop (Windows) のみを分析（主要な結果として使用）
     primary_request = {
-        "url": "https://api.dataforseo.com/v3/serp/google/organic/live/advanced",
+        "url": dataforseo_url("/v3/serp/google/organic/live/advanced"),
         "payload": [{
             "keyword": keyword,
             "location_code": location_code,
@@ -669,40 +660,26 @@ async def analyze_serp(
         url = primary_request["url"]
         payload = json.dumps(primary_request["payload"], ensure_ascii=False)
         
-        response = requests.post(url, headers=headers, data=payload, timeout=120)
+        response = await post_dataforseo(url, payload, config)
         
-        result = {
-            "url": url,
-            "payload": payload,
-            "headers": dict(headers),
-            "response_text": response.text,
-            "http_status_code": response.status_code,
-        }
+        result = router_result(url, payload, headers, response)
         
-        # JSONレスポンスをパース
+        # SERPデータを抽出してSEO分析
         try:
-            response_json = response.json()
-            result["response_json"] = response_json
-            
-            # SERPデータを抽出してSEO分析
-            serp_data = extract_serp_data(response_json)
+            serp_data = extract_serp_data(result.get("response_json"))
             if serp_data:
                 seo_analysis = analyze_serp_for_seo(serp_data, keyword)
-            
         except:
             pass
         
         results.append(result)
             
     except Exception as e:
-        results.append({
-            "url": primary_request["url"],
-            "payload": json.dumps(primary_request["payload"], ensure_ascii=False),
-            "error": str(e),
-            "http_status_code": None,
-            "response_text": None,
-            "response_json": None
-        })
+        results.append(router_error_result(
+            primary_request["url"],
+            json.dumps(primary_request["payload"], ensure_ascii=False),
+            e
+        ))
     
     return {
         "keyword": keyword,
@@ -711,3 +688,70 @@ async def analyze_serp(
         "results": results,
         "seo_analysis": seo_analysis
     }
+
+
+class SerpBatchRequest(BaseModel):
+    keywords: List[str]
+    location_code: int = 2840  # 日本
+    language_code: str = "ja"
+    devices: List[str] = ["desktop"]
+
+
+@router.post(
+    "/analyze-batch",
+    dependencies=[Depends(rate_limit(limit=5, window_seconds=60))]
+)
+async def analyze_serp_batch(
+    request: Request,
+    batch_request: SerpBatchRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    複数キーワードのSERPをまとめて分析
+    キーワード×デバイスの組み合わせを1回のPOSTに最大100タスクまで詰めて送信する
+    """
+    keywords = [kw.strip() for kw in batch_request.keywords if kw and kw.strip()]
+    if not keywords:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="keywordsを1つ以上指定してください"
+        )
+    if len(keywords) * len(batch_request.devices or ["desktop"]) > 100:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="キーワード数×デバイス数は100以下にしてください"
+        )
+    
+    try:
+        entries = await get_serp_data_many(
+            keywords=keywords,
+            location_code=batch_request.location_code,
+            language_code=batch_request.language_code,
+            devices=batch_request.devices or ["desktop"],
+            depth=100,
+            user_id=str(current_user.get("id"))
+        )
+    except ValueError as e:
+        # DataForSEO設定が未完了
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    results = []
+    for entry in entries:
+        serp_data = entry.get("result")
+        results.append({
+            "keyword": entry["keyword"],
+            "device": entry["device"],
+            "location_code": entry["location_code"],
+            "status_code": entry.get("status_code"),
+            "error": entry.get("error"),
+            "seo_analysis": analyze_serp_for_seo(serp_data, entry["keyword"]) if serp_data else None
+        })
+    
+    return {
+        "location_code": batch_request.location_code,
+        "language_code": batch_request.language_code,
+        "results": results
+    }
@@ -0,0 +1,243 @@
+"""
+SERPレスポンスの射影パーサー
+DataForSEO SERP APIのレスポンス（depth=50〜100、calculate_rectangles付きで数百KB）から
+下流（analyze_serp_structure / analyze_serp_for_seo）で使うフィールドだけを残して読み込む
+ijsonがあればイベント単位で読み進めて不要な部分木を組み立てずに捨て、なければ全体をパースしてから射影する
+StreamingProjectorは受信したチャンクをそのままijsonに渡すため、レスポンス全体をメモリに持たない
+"""
+import io
+import json
+import sys
+from typing import Any, Dict, List, Optional, Union
+
+try:
+    import ijson
+except ImportError:  # ijsonは任意依存
+    ijson = None
+
+
+# 射影の指定: Trueはその値（部分木）をすべて残す、辞書は指定したキーだけを残す
+# リストには要素ごとに同じ指定を適用する
+Projection = Union[bool, Dict[str, Any]]
+
+# 関連質問・関連検索など、アイテム内のitemsで使うフィールド
+SERP_NESTED_ITEM_PROJECTION: Dict[str, Any] = {
+    "type": True,
+    "title": True,
+    "question": True,
+    "answer": True,
+    "seed_question": True,
+    "text": True,
+    "url": True,
+    "domain": True,
+    "description": True,
+    "expanded_element": {
+        "type": True,
+        "title": True,
+        "featured_title": True,
+        "url": True,
+        "domain": True,
+        "description": True,
+    },
+}
+
+# result[]の1要素（1キーワード分のSERP）で使うフィールド
+SERP_RESULT_PROJECTION: Dict[str, Any] = {
+    "keyword": True,
+    "type": True,
+    "se_domain": True,
+    "location_code": True,
+    "language_code": True,
+    "check_url": True,
+    "datetime": True,
+    "item_types": True,
+    "se_results_count": True,
+    "items_count": True,
+    "items": {
+        "type": True,
+        "rank_group": True,
+        "rank_absolute": True,
+        "position": True,
+        "domain": True,
+        "title": True,
+        "url": True,
+        "breadcrumb": True,
+        "snippet": True,
+        "description": True,
+        "text": True,
+        "is_featured_snippet": True,
+        "items": SERP_NESTED_ITEM_PROJECTION,
+    },
+}
+
+# レスポンス全体（キャッシュ・エラー判定に必要なメタ情報を含む）
+SERP_RESPONSE_PROJECTION: Dict[str, Any] = {
+    "version": True,
+    "status_code": True,
+    "status_message": True,
+    "time": True,
+    "cost": True,
+    "tasks_count": True,
+    "tasks_error": True,
+    "tasks": {
+        "id": True,
+        "status_code": True,
+        "status_message": True,
+        "time": True,
+        "cost": True,
+        "result_count": True,
+        "path": True,
+        "data": True,
+        "result": SERP_RESULT_PROJECTION,
+    },
+}
+
+
+def _child_projection(projection: Projection, key: str) -> Optional[Projection]:
+    if projection is True:
+        return True
+    return projection.get(key)
+
+
+def project(value: Any, projection: Projection) -> Any:
+    """
+    パース済みの値に射影を適用
+
+    Args:
+        value: JSONをパースした値
+        projection: 残すフィールドの指定
+
+    Returns:
+        指定したフィールドだけを残した値
+    """
+    if projection is True:
+        return value
+    if isinstance(value, list):
+        return [project(item, projection) for item in value]
+    if isinstance(value, dict):
+        return {
+            key: project(item, projection[key])
+            for key, item in value.items()
+            if projection.get(key)
+        }
+    return value
+
+
+class _ProjectingBuilder:
+    """ijsonのイベントから、射影に含まれる部分だけを組み立てる"""
+
+    def __init__(self, projection: Projection):
+        self.root: Any = None
+        # (コンテナ, 射影, 直近のキー)
+        self._stack: List[List[Any]] = []
+        self._skip_depth = 0
+        self._projection = projection
+
+    def _target_projection(self) -> Optional[Projection]:
+        if not self._stack:
+            return self._projection
+        container, projection, key = self._stack[-1]
+        if isinstance(container, list):
+            return projection
+        return _child_projection(projection, key)
+
+    def _attach(self, value: Any) -> None:
+        if not self._stack:
+            self.root = value
+            return
+        container, _, key = self._stack[-1]
+        if isinstance(container, list):
+            container.append(value)
+        else:
+            container[key] = value
+
+    def event(self, event: str, value: Any) -> None:
+        if self._skip_depth:
+            if event in ("start_map", "start_array"):
+                self._skip_depth += 1
+            elif event in ("end_map", "end_array"):
+                self._skip_depth -= 1
+            return
+
+        if event == "map_key":
+            # 同じキー文字列を要素ごとに持たないようinternする
+            self._stack[-1][2] = sys.intern(value)
+            return
+        if event in ("end_map", "end_array"):
+            self._stack.pop()
+            return
+
+        projection = self._target_projection()
+        if not projection:
+            if event in ("start_map", "start_array"):
+                self._skip_depth = 1
+            return
+
+        if event in ("start_map", "start_array"):
+            container: Any = {} if event == "start_map" else []
+            self._attach(container)
+            self._stack.append([container, projection, None])
+        else:
+            self._attach(value)
+
+
+def parse_projected(data: bytes, projection: Projection = SERP_RESPONSE_PROJECTION) -> Any:
+    """
+    JSONのバイト列を読み込み、射影に含まれるフィールドだけを返す
+
+    Args:
+        data: レスポンスボディ
+        projection: 残すフィールドの指定
+
+    Returns:
+        射影済みの値
+    """
+    if ijson is None:
+        return project(json.loads(data), projection)
+
+    builder = _ProjectingBuilder(projection)
+    for event, value in ijson.basic_parse(io.BytesIO(data), use_float=True):
+        builder.event(event, value)
+    return builder.root
+
+
+class StreamingProjector:
+    """
+    受信中のチャンクを順に渡して射影する（レスポンス全体をメモリに保持しない）
+    ijsonがない場合はチャンクを溜めて最後にparse_projectedと同じ処理を行う
+    """
+
+    def __init__(self, projection: Projection = SERP_RESPONSE_PROJECTION):
+        self._projection = projection
+        self._chunks: List[bytes] = []
+        self._builder: Optional[_ProjectingBuilder] = None
+        if ijson is not None:
+            self._builder = _ProjectingBuilder(projection)
+            self._events = ijson.sendable_list()
+            self._parser = ijson.basic_parse_coro(self._events, use_float=True)
+
+    def feed(self, chunk: bytes) -> None:
+        """受信したチャンクを渡す"""
+        if self._builder is None:
+            self._chunks.append(chunk)
+            return
+        self._parser.send(chunk)
+        self._drain()
+
+    def close(self) -> Any:
+        """
+        入力の終わりを通知して射影済みの値を返す
+
+        Raises:
+            ValueError / ijson.JSONError: JSONとして不正な場合
+        """
+        if self._builder is None:
+            return parse_projected(b"".join(self._chunks), self._projection)
+        self._parser.close()
+        self._drain()
+        return self._builder.root
+
+    def _drain(self) -> None:
+        for event, value in self._events:
+            self._builder.event(event, value)
+        del self._events[:]
@@ -0,0 +1,197 @@
+"""
+生成した記事（Markdown）からShopifyの記事JSONを組み立てる
+見出し・段落・リスト・画像・強調・リンクをbody_htmlに変換し、メタディスクリプションをmetafields_global_description_tagに入れる
+LLMに記事全体をJSONとして出力し直させる処理を置き換える
+"""
+import html
+import re
+from typing import Any, Dict, List, Optional
+
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_UNORDERED_ITEM = re.compile(r"^[-*+]\s+(.*)$")
+_ORDERED_ITEM = re.compile(r"^\d+[.)]\s+(.*)$")
+_IMAGE_LINE = re.compile(r"^!\[([^\]]*)\]\(([^)\s]+)(?:\s+\"[^\"]*\")?\)$")
+_HORIZONTAL_RULE = re.compile(r"^(?:-{3,}|\*{3,}|_{3,})$")
+# Geminiの出力形式の区切り（例: === 記事 ===）
+_SECTION_MARKER = re.compile(r"^=+\s*[^=]*\s*=+$")
+
+_INLINE_IMAGE = re.compile(r"!\[([^\]]*)\]\(([^)\s]+)\)")
+_INLINE_LINK = re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)")
+_BOLD = re.compile(r"\*\*(.+?)\*\*|__(.+?)__")
+_ITALIC = re.compile(r"(?<![*\w])\*(?!\s)(.+?)(?<!\s)\*(?!\*)")
+_CODE = re.compile(r"`([^`]+)`")
+
+# 記事タイトルはShopifyのtitleに入るため、本文の見出しはh2から始める
+TOP_HEADING_LEVEL = 2
+
+DEFAULT_AUTHOR = "eightoon"
+DEFAULT_TAGS = "Column"
+
+
+def _safe_url(url: str) -> Optional[str]:
+    """http(s)・相対パスのURLのみ許可"""
+    url = url.strip()
+    if re.match(r"^(https?:)?//", url, re.IGNORECASE) or url.startswith("/"):
+        return url
+    if ":" in url.split("/", 1)[0]:
+        return None
+    return url
+
+
+def render_inline(text: str) -> str:
+    """行内のMarkdown（画像・リンク・強調・コード）をHTMLに変換"""
+    placeholders: List[str] = []
+
+    def hold(fragment: str) -> str:
+        placeholders.append(fragment)
+        return f"\x00{len(placeholders) - 1}\x00"
+
+    def image(match: "re.Match[str]") -> str:
+        url = _safe_url(match.group(2))
+        if url is None:
+            return hold(html.escape(match.group(1)))
+        return hold(f'<img src="{html.escape(url, quote=True)}" alt="{html.escape(match.group(1), quote=True)}">')
+
+    def link(match: "re.Match[str]") -> str:
+        url = _safe_url(match.group(2))
+        label = html.escape(match.group(1))
+        if url is None:
+            return hold(label)
+        return hold(f'<a href="{html.escape(url, quote=True)}">{label}</a>')
+
+    text = _CODE.sub(lambda match: hold(f"<code>{html.escape(match.group(1))}</code>"), text)
+    text = _INLINE_IMAGE.sub(image, text)
+    text = _INLINE_LINK.sub(link, text)
+    text = html.escape(text, quote=False)
+    text = _BOLD.sub(lambda match: f"<strong>{match.group(1) or match.group(2)}</strong>", text)
+    text = _ITALIC.sub(lambda match: f"<em>{match.group(1)}</em>", text)
+    return re.sub(r"\x00(\d+)\x00", lambda match: placeholders[int(match.group(1))], text)
+
+
+def _strip_title_line(lines: List[str], title: Optional[str]) -> List[str]:
+    """本文の先頭にある出力形式の区切りと、タイトルと同じ行を取り除く"""
+    def normalize(value: str) -> str:
+        return re.sub(r"[\s#\[\]「」『』]", "", value)
+
+    result = list(lines)
+    while result and (not result[0].strip() or _SECTION_MARKER.match(result[0].strip())):
+        result.pop(0)
+    if title and result and normalize(result[0]) == normalize(title):
+        result.pop(0)
+    return result
+
+
+def markdown_to_html(markdown_text: str, title: Optional[str] = None) -> str:
+    """
+    記事のMarkdownをShopifyのbody_htmlに変換
+
+    Args:
+        markdown_text: 記事本文（Markdown）
+        title: 記事タイトル（本文先頭に同じ行があれば除く）
+
+    Returns:
+        body_html
+    """
+    lines = _strip_title_line((markdown_text or "").replace("\r\n", "\n").split("\n"), title)
+    heading_levels = [len(match.group(1)) for match in (_HEADING.match(line.strip()) for line in lines) if match]
+    level_shift = TOP_HEADING_LEVEL - min(heading_levels) if heading_levels else 0
+
+    blocks: List[str] = []
+    paragraph: List[str] = []
+    list_tag: Optional[str] = None
+    list_items: List[str] = []
+    quote: List[str] = []
+
+    def flush() -> None:
+        nonlocal list_tag
+        if paragraph:
+            blocks.append("<p>" + "<br>".join(render_inline(line) for line in paragraph) + "</p>")
+            paragraph.clear()
+        if list_tag:
+            blocks.append(f"<{list_tag}>" + "".join(f"<li>{item}</li>" for item in list_items) + f"</{list_tag}>")
+            list_items.clear()
+            list_tag = None
+        if quote:
+            blocks.append("<blockquote><p>" + "<br>".join(render_inline(line) for line in quote) + "</p></blockquote>")
+            quote.clear()
+
+    for raw_line in lines:
+        line = raw_line.strip()
+        if not line or _SECTION_MARKER.match(line):
+            flush()
+            continue
+
+        heading = _HEADING.match(line)
+        if heading:
+            flush()
+            level = min(6, max(TOP_HEADING_LEVEL, len(heading.group(1)) + level_shift))
+            blocks.append(f"<h{level}>{render_inline(heading.group(2))}</h{level}>")
+            continue
+
+        if _HORIZONTAL_RULE.match(line):
+            flush()
+            blocks.append("<hr>")
+            continue
+
+        image = _IMAGE_LINE.match(line)
+        if image:
+            flush()
+            blocks.append(f"<p>{render_inline(line)}</p>")
+            continue
+
+        item = _UNORDERED_ITEM.match(line)
+        ordered = _ORDERED_ITEM.match(line) if not item else None
+        if item or ordered:
+            tag = "ul" if item else "ol"
+            if list_tag != tag or paragraph or quote:
+                flush()
+                list_tag = tag
+            list_items.append(render_inline((item or ordered).group(1)))
+            continue
+
+        if line.startswith(">"):
+            if not quote:
+                flush()
+            quote.append(line.lstrip(">").strip())
+            continue
+
+        if list_tag or quote:
+            flush()
+        paragraph.append(line)
+
+    flush()
+    return "\n".join(blocks)
+
+
+def render_shopify_article(
+    title: str,
+    content: str,
+    meta_description: Optional[str] = None,
+    author: str = DEFAULT_AUTHOR,
+    tags: str = DEFAULT_TAGS
+) -> Dict[str, Any]:
+    """
+    Shopifyの記事JSON（下書き）を組み立てる
+
+    Args:
+        title: 記事タイトル
+        content: 記事本文（Markdown）
+        meta_description: メタディスクリプション
+        author: 著者
+        tags: タグ
+
+    Returns:
+        {"article": {title, body_html, metafields_global_description_tag, status, published, tags, author}}
+    """
+    article: Dict[str, Any] = {
+        "title": title,
+        "body_html": markdown_to_html(content, title),
+        "status": "draft",
+        "published": False,
+        "tags": tags,
+        "author": author,
+    }
+    if meta_description:
+        article["metafields_global_description_tag"] = meta_description
+    return {"article": article}
@@ -0,0 +1,85 @@
+"""
+Single-flight（同一リクエストの合流）
+同じキーで同時に実行された非同期呼び出しを1回の実行にまとめ、結果または例外を全員に返す
+analyze_keywords_taskのように別スレッド・別イベントループで動く呼び出し同士でも合流できるよう、
+共有にはconcurrent.futures.Futureを使う
+実行している呼び出し側がキャンセルされた場合は、待っていた呼び出し側のうち1つが実行し直す
+"""
+import asyncio
+import concurrent.futures
+import copy
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _LeaderCancelled(Exception):
+    """実行していた呼び出し側がキャンセルされた（待っていた側は実行し直す）"""
+
+
+class SingleFlight:
+    """キーごとに実行中の呼び出しを1つに保つ"""
+
+    def __init__(self):
+        self._calls: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        keyの呼び出しが実行中ならその完了を待ち、なければfnを実行する
+
+        Args:
+            key: 合流判定に使うキー
+            fn: 実際の処理を行うコルーチン関数（引数なし）
+
+        Returns:
+            fnの戻り値（合流した呼び出し側にはディープコピーを返す）
+        """
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                is_leader = future is None
+                if is_leader:
+                    future = concurrent.futures.Future()
+                    self._calls[key] = future
+
+            if is_leader:
+                break
+            try:
+                # 待機側のキャンセルが共有Futureに伝播しないようshieldする
+                result = await asyncio.shield(asyncio.wrap_future(future))
+            except _LeaderCancelled:
+                # 実行していた側のキャンセル（切断・ステージのタイムアウト）は待機側に伝えず、実行し直す
+                continue
+            return copy.deepcopy(result)
+
+        try:
+            result = await fn()
+        except BaseException as exc:
+            self._finish(key)
+            if isinstance(exc, asyncio.CancelledError):
+                self._settle(future, exc=_LeaderCancelled())
+            else:
+                self._settle(future, exc=exc)
+            raise
+        self._finish(key)
+        self._settle(future, result=result)
+        return result
+
+    def _finish(self, key: str) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+
+    @staticmethod
+    def _settle(future: concurrent.futures.Future, result: Any = None, exc: BaseException = None) -> None:
+        try:
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    def in_flight(self) -> int:
+        """実行中のキー数"""
+        with self._lock:
+            return len(self._calls)
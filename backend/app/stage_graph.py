@@ -0,0 +1,244 @@
+"""
+記事生成ステージの依存グラフ実行
+各ステージが依存するステージを宣言し、1つのイベントループ上で依存が揃ったステージから並行して実行する
+ステージごとにタイムアウトと所要時間の記録を行い、任意ステージの失敗は既定値で続行する
+チェックポイントを渡した場合は、各ステージの出力（既定値で続行した任意ステージはその既定値）を
+状態・依存ステージの出力のハッシュとともに保存し、依存ステージの出力が保存時と同じステージは実行せずに復元する
+（保存は後続のステージを待たせずにバックグラウンドで行い、グラフの終了前に完了を待つ）
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from app.metrics import record_stage
+
+
+# ステージ本体: それまでの結果（ステージ名 -> 戻り値）を受け取り、このステージの結果を返す
+StageFunc = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class Stage:
+    """依存グラフの1ステージ"""
+
+    def __init__(
+        self,
+        name: str,
+        run: StageFunc,
+        deps: Iterable[str] = (),
+        timeout: Optional[float] = None,
+        required: bool = True,
+        default: Any = None
+    ):
+        """
+        Args:
+            name: ステージ名（結果のキー、メトリクスのラベルに使用）
+            run: ステージ本体のコルーチン関数
+            deps: 先に完了している必要があるステージ名
+            timeout: タイムアウト秒数（Noneの場合はグラフの既定値）
+            required: Falseの場合、失敗・タイムアウトしてもdefaultを結果として続行する
+            default: 任意ステージが失敗したときの結果（呼び出し可能なら呼び出した戻り値）
+        """
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.required = required
+        self.default = default
+
+    def fallback(self) -> Any:
+        return self.default() if callable(self.default) else self.default
+
+
+class StageError(Exception):
+    """必須ステージの失敗"""
+
+    def __init__(self, stage: str, error: BaseException):
+        super().__init__(f"{stage}: {error}")
+        self.stage = stage
+        self.error = error
+
+
+def _topological_order(stages: List[Stage]) -> List[Stage]:
+    """依存関係の順に並べる（未定義の依存・循環があればValueError）"""
+    by_name = {stage.name: stage for stage in stages}
+    if len(by_name) != len(stages):
+        raise ValueError("ステージ名が重複しています")
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f"ステージ {stage.name} の依存 {dep} が定義されていません")
+
+    ordered: List[Stage] = []
+    visiting = set()
+    done = set()
+
+    def visit(stage: Stage) -> None:
+        if stage.name in done:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"ステージの依存関係が循環しています: {stage.name}")
+        visiting.add(stage.name)
+        for dep in stage.deps:
+            visit(by_name[dep])
+        visiting.discard(stage.name)
+        done.add(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+class StageGraph:
+    """宣言した依存関係に従ってステージを並行実行する"""
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        default_timeout: Optional[float] = None,
+        name: str = "stage_graph",
+        checkpoints: Optional[Any] = None
+    ):
+        """
+        Args:
+            stages: ステージのリスト
+            default_timeout: ステージの既定のタイムアウト秒数
+            name: ログ出力用の名前
+            checkpoints: get(stage) -> {"output", "status", "inputs_hash"}（未保存ならNone）と
+                save(stage, 出力, 状態, 入力ハッシュ) を持つチェックポイント（例: ArticleCheckpoints）。
+                依存ステージの出力のハッシュが保存時と一致する場合に復元する
+        """
+        self.stages = _topological_order(stages)
+        self.default_timeout = default_timeout
+        self.name = name
+        self.checkpoints = checkpoints
+        # ステージ名 -> {"start": 開始オフセット秒, "seconds": 所要時間, "status": "ok" / "timeout" / "error" / "checkpoint"}
+        self.timings: Dict[str, Dict[str, Any]] = {}
+        # チェックポイントから復元したステージ
+        self.restored: Set[str] = set()
+        # 実行中のチェックポイント保存
+        self._saves: List["asyncio.Task[Any]"] = []
+
+    async def _run_stage(
+        self,
+        stage: Stage,
+        tasks: Dict[str, "asyncio.Task[Any]"],
+        results: Dict[str, Any],
+        origin: float
+    ) -> Any:
+        for dep in stage.deps:
+            await tasks[dep]
+
+        # 前段を再実行して出力が変わった場合は、その結果を使うよう以降のステージも再実行する
+        # （前段が前回と同じ既定値で続行した場合などは、出力が同じなので復元する）
+        inputs_hash = None
+        if self.checkpoints is not None:
+            inputs_hash = _inputs_hash(stage, results)
+            saved = self.checkpoints.get(stage.name)
+            if saved is not None and saved.get("inputs_hash") == inputs_hash:
+                value = saved.get("output")
+                self.restored.add(stage.name)
+                self.timings[stage.name] = {
+                    "start": round(time.perf_counter() - origin, 3),
+                    "seconds": 0.0,
+                    "status": "checkpoint",
+                    "saved_status": saved.get("status", "ok"),
+                }
+                results[stage.name] = value
+                return value
+
+        started = time.perf_counter()
+        timeout = stage.timeout if stage.timeout is not None else self.default_timeout
+        status = "ok"
+        try:
+            value = await asyncio.wait_for(stage.run(results), timeout)
+        except asyncio.TimeoutError as e:
+            status = "timeout"
+            if stage.required:
+                raise StageError(stage.name, TimeoutError(f"{timeout}秒以内に完了しませんでした")) from e
+            print(f"[{self.name}] {stage.name} タイムアウト（{timeout}秒、続行）")
+            value = stage.fallback()
+        except Exception as e:
+            status = "error"
+            if stage.required:
+                raise StageError(stage.name, e) from e
+            print(f"[{self.name}] {stage.name} エラー（続行）: {str(e)}")
+            value = stage.fallback()
+        finally:
+            seconds = time.perf_counter() - started
+            self.timings[stage.name] = {
+                "start": round(started - origin, 3),
+                "seconds": round(seconds, 3),
+                "status": status,
+            }
+            record_stage(stage.name, seconds)
+
+        # 既定値で続行した任意ステージも状態とともに保存し、再開時に同じ失敗（タイムアウト待ちなど）を繰り返さない
+        if self.checkpoints is not None:
+            # 後続のステージが出力を書き換えても保存内容が変わらないよう、コピーしてから保存する
+            self._saves.append(asyncio.create_task(
+                run_blocking(self.checkpoints.save, stage.name, copy.deepcopy(value), status, inputs_hash)
+            ))
+        results[stage.name] = value
+        return value
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        全ステージを実行
+
+        Returns:
+            ステージ名 -> 結果の辞書
+
+        Raises:
+            StageError: 必須ステージが失敗・タイムアウトした場合（実行中の他のステージはキャンセルする）
+        """
+        results: Dict[str, Any] = {}
+        tasks: Dict[str, "asyncio.Task[Any]"] = {}
+        origin = time.perf_counter()
+        self.timings = {}
+        self.restored = set()
+        self._saves = []
+
+        # 依存関係の順に作成するので、各ステージが待つタスクは必ず作成済み
+        for stage in self.stages:
+            tasks[stage.name] = asyncio.create_task(self._run_stage(stage, tasks, results, origin))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        finally:
+            # 失敗した場合も、再開できるよう成功したステージの保存を完了させる
+            if self._saves:
+                await asyncio.gather(*self._saves, return_exceptions=True)
+            self._print_timings(time.perf_counter() - origin)
+        return results
+
+    def _print_timings(self, elapsed: float) -> None:
+        total = sum(timing["seconds"] for timing in self.timings.values())
+        print(f"[{self.name}] 完了 {elapsed:.2f}秒（ステージ合計 {total:.2f}秒）")
+        for name, timing in sorted(self.timings.items(), key=lambda item: item[1]["start"]):
+            end = timing["start"] + timing["seconds"]
+            print(f"[{self.name}]   {name}: {timing['start']:.2f}s → {end:.2f}s（{timing['seconds']:.2f}秒, {timing['status']}）")
+
+
+def _inputs_hash(stage: Stage, results: Dict[str, Any]) -> str:
+    """ステージが受け取る依存ステージの出力のハッシュ（チェックポイントの復元可否の判定に使う）"""
+    inputs = {dep: results.get(dep) for dep in stage.deps}
+    canonical = json.dumps(inputs, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    同期関数（SDK呼び出し・Supabaseクエリなど）をスレッドで実行し、イベントループを塞がないようにする
+    contextvars（メトリクスのユーザー・記事）は呼び出し元から引き継がれる
+    タイムアウトでキャンセルされても、スレッド内の処理自体は完了するまで続く
+    """
+    return await asyncio.to_thread(func, *args, **kwargs)
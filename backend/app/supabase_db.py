@@ -8,14 +8,22 @@ from app.security import (
     encrypt_sensitive_value,
     prepare_setting_for_response,
 )
+from app.config import settings as app_settings
 from typing import Optional, List, Dict, Any
 from uuid import UUID
+import threading
+import time
 import uuid
 from postgrest.exceptions import APIError
 
 
 _article_error_column_supported: Optional[bool] = None
 
+# ユーザー設定のスナップショット（user_id -> {"expires_at", "raw", "decrypted"}）
+# 1回のクエリで全設定を読み込み、復号は実際に参照されたキーだけ行う
+_settings_snapshots: Dict[str, Dict[str, Any]] = {}
+_settings_snapshots_lock = threading.Lock()
+
 
 def get_supabase():
     """Supabaseクライアントを取得"""
@@ -247,10 +255,85 @@ def create_article_history(article_id: str, action: str, changes: Optional[Dict]
     raise Exception("Failed to create article history")
 
 
+# ============================================
+# 記事生成チェックポイント操作
+# ============================================
+
+def get_article_checkpoints(article_id: str, input_hash: Optional[str] = None) -> List[Dict]:
+    """記事のチェックポイントを取得（input_hashを指定した場合はその入力のもののみ）"""
+    supabase = get_supabase()
+    query = supabase.table("article_checkpoints")\
+        .select("input_hash, stage, output, updated_at")\
+        .eq("article_id", article_id)
+    if input_hash:
+        query = query.eq("input_hash", input_hash)
+    response = query.order("updated_at", desc=True).execute()
+    return response.data or []
+
+
+def save_article_checkpoint(article_id: str, input_hash: str, stage: str, output: Any) -> None:
+    """ステージの出力をチェックポイントとして保存（同じ記事・入力・ステージは上書き）"""
+    supabase = get_supabase()
+    supabase.table("article_checkpoints")\
+        .upsert(
+            {"article_id": article_id, "input_hash": input_hash, "stage": stage, "output": output},
+            on_conflict="article_id,input_hash,stage",
+            returning="minimal"
+        )\
+        .execute()
+
+
+def delete_article_checkpoints(article_id: str, keep_input_hash: Optional[str] = None) -> None:
+    """記事のチェックポイントを削除（keep_input_hashを指定した場合はその入力のもの以外を削除）"""
+    supabase = get_supabase()
+    query = supabase.table("article_checkpoints")\
+        .delete()\
+        .eq("article_id", article_id)
+    if keep_input_hash:
+        query = query.neq("input_hash", keep_input_hash)
+    query.execute()
+
+
 # ============================================
 # Settings操作
 # ============================================
 
+def _store_settings_snapshot(user_id: str, rows: List[Dict]) -> Dict[str, Any]:
+    """設定行からスナップショットを作成して保持"""
+    snapshot = {
+        "expires_at": time.monotonic() + app_settings.settings_cache_ttl_seconds,
+        "raw": {row.get("key"): row.get("value") for row in rows if row.get("key")},
+        "decrypted": {}
+    }
+    with _settings_snapshots_lock:
+        _settings_snapshots[user_id] = snapshot
+    return snapshot
+
+
+def _get_settings_snapshot(user_id: str) -> Dict[str, Any]:
+    """有効なスナップショットを返す（なければ1回のクエリで全設定を読み込む）"""
+    with _settings_snapshots_lock:
+        snapshot = _settings_snapshots.get(user_id)
+    if snapshot and snapshot["expires_at"] > time.monotonic():
+        return snapshot
+    
+    supabase = get_supabase()
+    response = supabase.table("settings")\
+        .select("key, value")\
+        .eq("user_id", user_id)\
+        .execute()
+    return _store_settings_snapshot(user_id, response.data or [])
+
+
+def invalidate_settings_cache(user_id: Optional[str] = None) -> None:
+    """設定スナップショットを破棄（user_id省略時は全ユーザー）"""
+    with _settings_snapshots_lock:
+        if user_id is None:
+            _settings_snapshots.clear()
+        else:
+            _settings_snapshots.pop(user_id, None)
+
+
 def get_settings_by_user_id(user_id: str) -> List[Dict]:
     """ユーザーIDで設定一覧を取得"""
     supabase = get_supabase()
@@ -259,23 +342,25 @@ def get_settings_by_user_id(user_id: str) -> List[Dict]:
         .eq("user_id", user_id)\
         .execute()
     settings = response.data or []
+    # 取得した一覧でスナップショットも更新しておく
+    _store_settings_snapshot(user_id, settings)
     return [prepare_setting_for_response(setting) for setting in settings]
 
 
 def get_setting_by_key(user_id: str, key: str) -> Optional[str]:
-    """ユーザーIDとキーで設定値を取得"""
-    supabase = get_supabase()
-    response = supabase.table("settings")\
-        .select("value")\
-        .eq("user_id", user_id)\
-        .eq("key", key)\
-        .limit(1)\
-        .execute()
+    """ユーザーIDとキーで設定値を取得（スナップショットキャッシュ経由）"""
+    snapshot = _get_settings_snapshot(user_id)
+    with _settings_snapshots_lock:
+        if key in snapshot["decrypted"]:
+            return snapshot["decrypted"][key]
+        if key not in snapshot["raw"]:
+            return None
+        value = snapshot["raw"][key]
     
-    if response.data and len(response.data) > 0:
-        value = response.data[0].get("value")
-        return decrypt_sensitive_value(key, value)
-    return None
+    decrypted = decrypt_sensitive_value(key, value)
+    with _settings_snapshots_lock:
+        snapshot["decrypted"][key] = decrypted
+    return decrypted
 
 
 def upsert_setting(user_id: str, key: str, value: str) -> Dict:
@@ -308,6 +393,9 @@ def upsert_setting(user_id: str, key: str, value: str) -> Dict:
         setting_data["id"] = str(uuid.uuid4())
         response = supabase.table("settings").insert(setting_data).execute()
     
+    # 書き込み後は古いスナップショットを使わないよう破棄
+    invalidate_settings_cache(user_id)
+    
     if response.data and len(response.data) > 0:
         return prepare_setting_for_response(response.data[0])
     raise Exception("Failed to upsert setting")
@@ -8,14 +8,68 @@ from typing import Dict, List
 from app.supabase_db import update_article, create_article_history
 from app.workflow import ArticleGenerator
 from app.sanitize import sanitize_html
+from app.metrics import metrics_context, pop_article_breakdown, set_metrics_user
+from app.llm_stream import DraftWriter
+from app.article_checkpoints import ArticleCheckpoints, load_checkpoint_input
+from app.config import settings
 from app.dataforseo_client import (
     generate_related_keywords_with_openai,
-    get_keywords_data,
+    get_keywords_data_chunked,
     score_keywords,
     get_keywords_data_google_ads
 )
 
-def generate_article_task(article_id: str, article_data: Dict, user_id: str = None):
+def _save_cost_breakdown(article_id: str, phase: str) -> None:
+    """
+    計測したコスト・レイテンシの内訳をarticles.cost_breakdownに保存
+    キーワード分析と記事生成は別のフェーズとして同じカラムにまとめる
+    """
+    breakdown = pop_article_breakdown(article_id)
+    if not breakdown:
+        return
+    try:
+        from app.supabase_client import get_supabase_client
+        supabase = get_supabase_client()
+        if not supabase:
+            return
+        response = supabase.table("articles").select("user_id, cost_breakdown").eq("id", article_id).limit(1).execute()
+        if not response.data:
+            return
+        article = response.data[0]
+        current = article.get("cost_breakdown") or {}
+        if isinstance(current, str):
+            current = json.loads(current)
+        current[phase] = breakdown
+        update_article(article_id, article.get("user_id"), {"cost_breakdown": current})
+    except Exception as e:
+        # cost_breakdownカラムが未作成の場合なども記事処理には影響させない
+        print(f"[cost_breakdown] 保存に失敗しました（続行）: {str(e)}")
+
+
+def _json_column(value):
+    """JSONBカラム（文字列で保存されている場合を含む）を読み込む"""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+    return value
+
+
+def _keyword_artifacts(article: Dict) -> Dict:
+    """
+    キーワード分析・以前の生成で記事に保存したデータを記事生成に引き渡す形にまとめる
+    （記事生成ではこれを再利用し、足りないものだけDataForSEOから取得する）
+    """
+    return {
+        "analyzed_keywords": _json_column(article.get("analyzed_keywords")) or [],
+        "selected_keywords_data": _json_column(article.get("selected_keywords_data")) or [],
+        "serp_data": _json_column(article.get("serp_data")),
+        "serp_device": article.get("device_type"),
+    }
+
+
+def generate_article_task(article_id: str, article_data: Dict, user_id: str = None, resume: bool = False):
     """
     記事生成のバックグラウンドタスク
     
@@ -23,7 +77,19 @@ def generate_article_task(article_id: str, article_data: Dict, user_id: str = No
         article_id: 記事ID
         article_data: 記事データ
         user_id: ユーザーID（オプション、指定されない場合は記事から取得）
+        resume: 失敗した記事の再開（temperature > 0 のLLM呼び出しも保存済みの出力を再利用する）
     """
+    with metrics_context(user_id=user_id, article_id=article_id):
+        try:
+            _generate_article(article_id, article_data, user_id, resume)
+        finally:
+            _save_cost_breakdown(article_id, "article_generation")
+
+
+def _generate_article(article_id: str, article_data: Dict, user_id: str = None, resume: bool = False):
+    """generate_article_taskの本体"""
+    article = None
+    draft = None
     try:
         # 記事を取得してuser_idを確認
         from app.supabase_client import get_supabase_client
@@ -40,10 +106,23 @@ def generate_article_task(article_id: str, article_data: Dict, user_id: str = No
         article = article_response.data[0]
         if not user_id:
             user_id = article.get("user_id")
+            set_metrics_user(user_id)
         
         # 記事生成ワークフローを実行（user_idを渡す）
-        generator = ArticleGenerator(user_id=user_id)
-        result = generator.generate(article_data)
+        # 生成途中のタイトル・本文は一定間隔で記事に書き込み、詳細画面のポーリングで表示する
+        draft = DraftWriter(
+            lambda updates: update_article(article_id, user_id, updates),
+            interval=settings.article_draft_flush_interval_seconds
+        )
+        generator = ArticleGenerator(user_id=user_id, on_draft=draft.update, reuse_sampled=resume)
+        # 同じ入力で以前に成功したステージは保存済みの出力を再利用する
+        checkpoints = ArticleCheckpoints(article_id, article_data)
+        checkpoints.load()
+        try:
+            result = generator.generate(article_data, checkpoints, _keyword_artifacts(article))
+        finally:
+            # タイムアウトしたステージの遅れた途中保存で最終結果を上書きしないよう止める
+            draft.close()
         
         # 結果を保存
         sanitized_content = sanitize_html(result.get("content"))
@@ -94,6 +173,8 @@ def generate_article_task(article_id: str, article_data: Dict, user_id: str = No
             updates["best_keywords"] = json.dumps(result.get("best_keywords"), ensure_ascii=False)
         
         update_article(article_id, user_id, updates)
+        # 結果を保存できたのでチェックポイントは不要
+        checkpoints.clear()
         
     except Exception as e:
         # エラー処理
@@ -101,11 +182,15 @@ def generate_article_task(article_id: str, article_data: Dict, user_id: str = No
         try:
             article_response = supabase.table("articles").select("*").eq("id", article_id).limit(1).execute()
             if article_response.data and len(article_response.data) > 0:
-                article = article_response.data[0]
+                failed_updates = {"status": "failed", "error_message": error_message[:1000]}
+                # 途中保存した生成中のタイトル・本文は残さず、生成前の内容に戻す
+                if draft is not None and article is not None:
+                    for field in draft.written_fields():
+                        failed_updates[field] = article.get(field)
                 update_article(
                     article_id,
-                    article.get("user_id"),
-                    {"status": "failed", "error_message": error_message[:1000]}
+                    article_response.data[0].get("user_id"),
+                    failed_updates
                 )
                 create_article_history(
                     article_id=article_id,
@@ -117,7 +202,56 @@ def generate_article_task(article_id: str, article_data: Dict, user_id: str = No
         print(f"記事生成エラー: {error_message}")
 
 
-def analyze_keywords_task(article_id: str, article_data: Dict, user_id: str = None):
+def resume_article_task(article_id: str, user_id: str = None):
+    """
+    失敗した記事生成を、保存済みのチェックポイントの次のステージから再開するバックグラウンドタスク
+    前回と同じ入力データで実行するため、成功済みのステージ（SERP取得・タイトル・本文など）は再実行しない
+
+    Args:
+        article_id: 記事ID
+        user_id: ユーザーID（オプション、指定されない場合は記事から取得）
+    """
+    article_data = None
+    try:
+        article_data = load_checkpoint_input(article_id)
+    except Exception as e:
+        print(f"[resume_article_task] チェックポイントの取得に失敗しました（最初から実行）: {str(e)}")
+    if article_data is None:
+        # チェックポイントがない場合は記事の保存内容から入力データを組み立てて最初から実行
+        article_data = _article_data_from_article(article_id)
+        if article_data is None:
+            print(f"[resume_article_task] Article not found: {article_id}")
+            return
+    print(f"[resume_article_task] 記事生成を再開: article_id={article_id}")
+    generate_article_task(article_id, article_data, user_id, resume=True)
+
+
+def _article_data_from_article(article_id: str) -> Dict:
+    """記事の保存内容から記事生成の入力データを組み立てる（select-keywordsと同じ形式）"""
+    from app.supabase_client import get_supabase_client
+    supabase = get_supabase_client()
+    if not supabase:
+        return None
+    response = supabase.table("articles").select("*").eq("id", article_id).limit(1).execute()
+    if not response.data:
+        return None
+    article = response.data[0]
+    selected_keywords = article.get("selected_keywords") or []
+    if isinstance(selected_keywords, str):
+        selected_keywords = json.loads(selected_keywords)
+    return {
+        "keyword": article.get("keyword"),
+        "target": article.get("target"),
+        "article_type": article.get("article_type"),
+        # add_important_keyword_columns.sql 適用前はNone
+        "important_keyword1": article.get("important_keyword1"),
+        "important_keyword2": article.get("important_keyword2"),
+        "important_keyword3": article.get("important_keyword3"),
+        "secondary_keywords": selected_keywords
+    }
+
+
+def analyze_keywords_task(article_id: str, article_data: Dict, user_id: str = None, dataforseo_mode: str = None):
     """
     キーワード分析のバックグラウンドタスク
     関連キーワード100個を生成し、検索ボリューム・競合度を取得
@@ -126,7 +260,20 @@ def analyze_keywords_task(article_id: str, article_data: Dict, user_id: str = No
         article_id: 記事ID
         article_data: 記事データ
         user_id: ユーザーID（オプション、指定されない場合は記事から取得）
+        dataforseo_mode: Google Ads APIの呼び出し方法（"live" または標準キューの "queued"。
+            Noneの場合は設定のdataforseo_keyword_analysis_mode）
+            dataforseo_labsは標準キューに対応していないため常にlive
     """
+    dataforseo_mode = dataforseo_mode or settings.dataforseo_keyword_analysis_mode
+    with metrics_context(user_id=user_id, article_id=article_id):
+        try:
+            _analyze_keywords(article_id, article_data, user_id, dataforseo_mode)
+        finally:
+            _save_cost_breakdown(article_id, "keyword_analysis")
+
+
+def _analyze_keywords(article_id: str, article_data: Dict, user_id: str = None, dataforseo_mode: str = "live"):
+    """analyze_keywords_taskの本体"""
     print(f"[analyze_keywords_task] ========== 開始 ==========")
     print(f"[analyze_keywords_task] article_id={article_id}, user_id={user_id}")
     print(f"[analyze_keywords_task] article_data={article_data}")
@@ -147,6 +294,7 @@ def analyze_keywords_task(article_id: str, article_data: Dict, user_id: str = No
         article = article_response.data[0]
         if not user_id:
             user_id = article.get("user_id")
+            set_metrics_user(user_id)
         
         print(f"[analyze_keywords_task] 記事を取得: status={article.get('status')}, keyword={article.get('keyword')}")
         
@@ -230,16 +378,23 @@ def analyze_keywords_task(article_id: str, article_data: Dict, user_id: str = No
         asyncio.set_event_loop(loop)
         
         try:
-            # ステップ1: dataforseo_labsで100個のキーワードを広く分析（コスト抑制）
-            print(f"[analyze_keywords_task] dataforseo_labsで100個のキーワードを分析中...")
-            keywords_data = loop.run_until_complete(
-                get_keywords_data(
-                    keywords=related_keywords_100[:100],
+            # ステップ1: dataforseo_labsで生成したキーワードを広く分析（コスト抑制）
+            # 100個を超える場合はチャンクに分けて並行取得する
+            print(f"[analyze_keywords_task] dataforseo_labsで{len(related_keywords_100)}個のキーワードを分析中...")
+            chunked = loop.run_until_complete(
+                get_keywords_data_chunked(
+                    keywords=related_keywords_100,
                     location_code=2840,
                     language_code="ja",
                     user_id=user_id
                 )
             )
+            keywords_data = chunked["items"]
+            for chunk_error in chunked["errors"]:
+                print(f"[analyze_keywords_task] チャンク{chunk_error['chunk_index']}の取得に失敗（続行）: {chunk_error['error']}")
+            if not keywords_data and chunked["errors"]:
+                # 全チャンク失敗時は従来どおり例外として扱う
+                raise Exception(chunked["errors"][0]["error"])
             
             if not keywords_data:
                 print("[analyze_keywords_task] エラー: キーワードデータの取得に失敗しました")
@@ -276,7 +431,8 @@ def analyze_keywords_task(article_id: str, article_data: Dict, user_id: str = No
                             keywords=top_20_keywords,
                             location_code=2840,
                             language_code="ja",
-                            user_id=user_id
+                            user_id=user_id,
+                            mode=dataforseo_mode
                         )
                     )
                     
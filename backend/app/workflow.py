@@ -8,17 +8,35 @@ import re
 import json
 import httpx
 import asyncio
-from typing import Dict, List, Optional
-from openai import OpenAI
-import google.generativeai as genai
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 from app.supabase_client import get_supabase_client
+from app.llm_clients import get_gemini_model, get_openai_client
 from app.dataforseo_client import (
-    get_serp_data, get_keywords_data, generate_meta_tags, 
+    get_serp_data, get_keywords_data_chunked, generate_meta_tags, 
     generate_subtopics, analyze_serp_structure,
-    generate_related_keywords_with_openai, score_keywords, get_best_keywords
+    generate_related_keywords_with_openai, score_keywords, get_best_keywords,
+    keyword_data_from_scored
 )
 from app.schema_generator import generate_all_schemas
+from app.config import settings
+from app.dataforseo_transport import close_dataforseo_http_clients
+from app.metrics import record_llm_call
+from app.llm_stream import stream_openai_chat
+from app.llm_cache import cached_llm_text, cached_routed_llm_text
+from app.llm_router import LLMRouter, LLMRouterError
+from app.image_placement import place_images
+from app.shopify_renderer import render_shopify_article
+from app.page_fetcher import fetch_pages
+from app.knowledge_index import search_knowledge
+from app.prompt_builder import PromptBuilder, compact_json, count_tokens
+from app.article_outline import (
+    allocate_section_lengths, outline_hints, parse_outline, section_output_tokens, stitch_sections
+)
+from app.stage_graph import Stage, StageGraph, run_blocking
+from app.article_checkpoints import ArticleCheckpoints
 
 load_dotenv()
 
@@ -26,166 +44,204 @@ load_dotenv()
 class ArticleGenerator:
     """記事生成ワークフロー"""
     
-    def __init__(self, user_id: Optional[str] = None):
+    def __init__(
+        self,
+        user_id: Optional[str] = None,
+        on_draft: Optional[Callable[..., None]] = None,
+        reuse_sampled: bool = False
+    ):
         """
         Args:
             user_id: ユーザーID（オプション、ユーザー設定を使用する場合に必要）
+            on_draft: 生成途中のタイトル・本文をキーワード引数（title=, content=）で受け取るコールバック
+            reuse_sampled: temperature > 0 のLLM呼び出しも保存済みの出力を再利用する（失敗した記事の再開時のみ）
         """
-        # 環境変数からAPIキーを取得（ユーザー設定がない場合のフォールバック）
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        self.gemini_model = genai.GenerativeModel('gemini-2.0-flash')
         self.supabase = get_supabase_client()  # Noneの可能性がある
         self.user_id = user_id
+        self.on_draft = on_draft
+        self.reuse_sampled = reuse_sampled
+        
+        # 環境変数からAPIキーを取得（ユーザー設定がない場合のフォールバック）
+        openai_key = os.getenv("OPENAI_API_KEY")
+        gemini_key = os.getenv("GEMINI_API_KEY")
         
         # ユーザー設定からAPIキーを取得（設定されている場合）
         if user_id:
             from app.supabase_db import get_setting_by_key
-            
-            # OpenAI API Key
-            user_openai_key = get_setting_by_key(user_id, "openai_api_key")
-            if user_openai_key:
-                self.openai_client = OpenAI(api_key=user_openai_key)
-            
-            # Gemini API Key
-            user_gemini_key = get_setting_by_key(user_id, "gemini_api_key")
-            if user_gemini_key:
-                genai.configure(api_key=user_gemini_key)
-                self.gemini_model = genai.GenerativeModel('gemini-2.0-flash')
+            openai_key = get_setting_by_key(user_id, "openai_api_key") or openai_key
+            gemini_key = get_setting_by_key(user_id, "gemini_api_key") or gemini_key
         
-    def generate(self, article_data: Dict) -> Dict:
+        # APIキーごとにプールしたクライアントを使う（genai.configureのグローバル設定は使わない）
+        self.openai_client = get_openai_client(openai_key)
+        self.gemini_model = get_gemini_model(gemini_key, "gemini-2.0-flash")
+        # 期限・ヘッジ・フェイルオーバーつきの呼び出し（キーが設定されているプロバイダーのみ使う）
+        self.llm = LLMRouter(
+            self.openai_client if openai_key else None,
+            self.gemini_model if gemini_key else None
+        )
+        
+    def generate(
+        self,
+        article_data: Dict,
+        checkpoints: Optional[ArticleCheckpoints] = None,
+        artifacts: Optional[Dict] = None
+    ) -> Dict:
         """
         記事生成のメイン処理（SEO対策統合版）
+        checkpointsを渡すと、保存済みのステージは実行せずに出力を復元する
+        artifactsを渡すと、キーワード分析で取得済みのデータを再利用し、足りない分だけ取得する
         """
         try:
-            # SEO対策: 0. SERP分析（非同期）
-            serp_data = None
-            serp_analysis = {}
-            keywords_data = None
-            meta_tags = None
-            subtopics_list = None
-            best_keywords = []  # 最適なキーワードリスト（初期化）
-            
-            keyword = article_data.get("keyword")
-            search_intent = article_data.get("search_intent", "情報収集")
-            target_location = article_data.get("target_location", "Japan")
-            device_type = article_data.get("device_type", "mobile")
-            
-            # 重要キーワードをリスト化
-            important_keywords = [
-                kw for kw in [
-                    article_data.get("important_keyword1"),
-                    article_data.get("important_keyword2"),
-                    article_data.get("important_keyword3")
-                ] if kw
-            ]
-            secondary_keywords = article_data.get("secondary_keywords", [])
-            
+            return asyncio.run(self.agenerate(article_data, checkpoints, artifacts))
+        except Exception as e:
+            raise Exception(f"記事生成エラー: {str(e)}")
+
+    async def agenerate(
+        self,
+        article_data: Dict,
+        checkpoints: Optional[ArticleCheckpoints] = None,
+        artifacts: Optional[Dict] = None
+    ) -> Dict:
+        """
+        記事生成のステージを依存グラフとして1つのイベントループで実行
+
+        キーワードだけで実行できるSERP分析・知識検索・サブトピック・画像選定は並行して進め、
+        タイトル・本文など前段の結果が必要なステージは依存が揃ってから実行する
+
+        Args:
+            article_data: 記事の入力データ
+            checkpoints: ステージ出力のチェックポイント（各ステージの出力を保存し、再実行時は復元する）
+            artifacts: 記事に保存済みの分析データ
+                {"analyzed_keywords", "selected_keywords_data", "serp_data", "serp_device"}
+
+        Returns:
+            生成結果（タイトル、本文、Shopify JSON、SEO関連データ）
+        """
+        keyword = article_data.get("keyword")
+        search_intent = article_data.get("search_intent", "情報収集")
+        target_location = article_data.get("target_location", "Japan")
+        device_type = article_data.get("device_type", "mobile")
+        
+        # 重要キーワードをリスト化
+        important_keywords = [
+            kw for kw in [
+                article_data.get("important_keyword1"),
+                article_data.get("important_keyword2"),
+                article_data.get("important_keyword3")
+            ] if kw
+        ]
+        secondary_keywords = article_data.get("secondary_keywords", [])
+
+        # キーワード分析で取得済みのデータ（キーワード -> スコアリング済みデータ）
+        artifacts = artifacts or {}
+        analyzed_keywords = {
+            item["keyword"]: item
+            for item in (artifacts.get("analyzed_keywords") or []) + (artifacts.get("selected_keywords_data") or [])
+            if isinstance(item, dict) and item.get("keyword")
+        }
+
+        async def keyword_research(results: Dict) -> Dict:
             # ユーザーが選択したキーワードがある場合はそれを使用（キーワード選択機能経由）
             # 選択されたキーワードがない場合のみ、新規にキーワード生成・分析を行う
-            keywords_data = None
-            best_keywords = []
-            
-            # 選択されたキーワードがある場合は、それを使用してbest_keywordsを作成
             if secondary_keywords and len(secondary_keywords) > 0:
                 print(f"選択されたキーワードを使用: {len(secondary_keywords)}個")
-                # 選択されたキーワードをbest_keywords形式に変換
-                best_keywords = [{"keyword": kw} for kw in secondary_keywords[:20]]
-            else:
-                # キーワード選択機能を使わない場合（後方互換性のため）
-                try:
-                    print("OpenAIで関連キーワード100個を生成中...")
-                    related_keywords_100 = generate_related_keywords_with_openai(
-                        main_keyword=keyword,
-                        important_keywords=important_keywords,
-                        secondary_keywords=secondary_keywords or [],
-                        openai_client=self.openai_client
-                    )
-                    
-                    if related_keywords_100:
-                        print(f"生成されたキーワード数: {len(related_keywords_100)}")
-                        
-                        # DataForSEOで検索ボリューム・競合度を取得
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        
-                        # 100個のキーワードをバッチで取得（DataForSEOは最大100個まで）
-                        keywords_data = loop.run_until_complete(
-                            get_keywords_data(
-                                keywords=related_keywords_100[:100],
-                                location_code=2840,
-                                language_code="ja",
-                                user_id=self.user_id
-                            )
-                        )
-                        
-                        if keywords_data:
-                            # キーワードをスコアリング
-                            scored_keywords = score_keywords(keywords_data)
-                            
-                            # 最適なキーワードを上位20個取得
-                            best_keywords = get_best_keywords(scored_keywords, top_n=20)
-                            print(f"最適なキーワードを{len(best_keywords)}個選定しました")
-                        
-                        loop.close()
-                except Exception as e:
-                    print(f"キーワード生成・分析エラー（続行）: {str(e)}")
-                    # エラーが発生しても記事生成は続行
-            
-            # 元のキーワードも含める
+                # キーワード分析のスコア・検索ボリュームがあれば付けて渡す
+                return {
+                    "keywords_data": None,
+                    "best_keywords": [analyzed_keywords.get(kw, {"keyword": kw}) for kw in secondary_keywords[:20]]
+                }
+
+            # キーワード選択機能を使わない場合（後方互換性のため）
+            print("OpenAIで関連キーワード100個を生成中...")
+            related_keywords_100 = await run_blocking(
+                generate_related_keywords_with_openai,
+                main_keyword=keyword,
+                important_keywords=important_keywords,
+                secondary_keywords=secondary_keywords or [],
+                openai_client=self.openai_client
+            )
+            if not related_keywords_100:
+                return {"keywords_data": None, "best_keywords": []}
+            print(f"生成されたキーワード数: {len(related_keywords_100)}")
+
+            # DataForSEOで検索ボリューム・競合度を取得
+            # 100個ずつのチャンクに分けて並行取得（DataForSEOは1タスク最大100個まで）
+            chunked = await get_keywords_data_chunked(
+                keywords=related_keywords_100,
+                location_code=2840,
+                language_code="ja",
+                user_id=self.user_id
+            )
+            keywords_data = chunked["items"]
+            best_keywords = []
+            if keywords_data:
+                # キーワードをスコアリングし、最適なキーワードを上位20個取得
+                scored_keywords = score_keywords(keywords_data)
+                best_keywords = get_best_keywords(scored_keywords, top_n=20)
+                print(f"最適なキーワードを{len(best_keywords)}個選定しました")
+            return {"keywords_data": keywords_data, "best_keywords": best_keywords}
+
+        async def keyword_volume(results: Dict) -> Optional[List[Dict]]:
+            research = results["keyword_research"]
+            if research["keywords_data"]:
+                return research["keywords_data"]
+            # 元のキーワードも含める（最適なキーワードの上位10個を追加）
             all_keywords = [keyword] + important_keywords + (secondary_keywords or [])
-            if best_keywords:
-                # 最適なキーワードの上位10個を追加
-                best_keywords_list = [kw["keyword"] for kw in best_keywords[:10]]
-                all_keywords.extend(best_keywords_list)
-            
-            try:
-                # 非同期処理を同期的に実行
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-                # SERP分析
-                serp_data = loop.run_until_complete(
-                    get_serp_data(
-                        keyword=keyword,
-                        location_code=2840,  # 日本
-                        language_code="ja",
-                        device=device_type,
-                        depth=50,
-                        user_id=self.user_id
-                    )
+            all_keywords.extend(kw["keyword"] for kw in research["best_keywords"][:10])
+            all_keywords = list(dict.fromkeys(kw for kw in all_keywords if kw))
+
+            # キーワード分析で取得済みのキーワードは再取得せず、足りないものだけ取得する
+            by_keyword = {
+                kw: keyword_data_from_scored(analyzed_keywords[kw]) for kw in all_keywords if kw in analyzed_keywords
+            }
+            missing = [kw for kw in all_keywords if kw not in by_keyword]
+            print(f"キーワードデータ: 取得済み{len(by_keyword)}個を再利用、{len(missing)}個を取得")
+            if missing:
+                chunked = await get_keywords_data_chunked(
+                    keywords=missing,
+                    location_code=2840,
+                    language_code="ja",
+                    user_id=self.user_id
                 )
-                
-                if serp_data:
-                    serp_analysis = analyze_serp_structure(serp_data)
-                
-                # 元のキーワードのデータも取得（最適なキーワードと統合）
-                if all_keywords and not keywords_data:
-                    keywords_data = loop.run_until_complete(
-                        get_keywords_data(
-                            keywords=all_keywords[:100],  # 最大100個
-                            location_code=2840,
-                            language_code="ja",
-                            user_id=self.user_id
-                        )
-                    )
-                
-                loop.close()
-            except Exception as e:
-                print(f"SEO分析エラー（続行）: {str(e)}")
-                # SEO分析が失敗しても記事生成は続行
-            
-            # 1. 知識検索
-            knowledge_context = self._knowledge_retrieval(keyword)
-            
-            # 2. Google検索（フォールバック、SERP APIが使えない場合）
-            google_results = []
-            if not serp_data:
-                google_results = self._google_search(keyword)
-            
-            # 3. 記事分析（SERP分析結果またはGoogle検索結果を使用）
+                for item in chunked["items"]:
+                    fetched_keyword = (item.get("keyword_info") or {}).get("keyword")
+                    if fetched_keyword:
+                        by_keyword.setdefault(fetched_keyword, item)
+            # メインキーワードを先頭にする（keyword_difficultyは先頭の要素から作る）
+            return [by_keyword[kw] for kw in all_keywords if kw in by_keyword]
+
+        async def serp_analysis(results: Dict) -> Dict:
+            serp_data = self._reusable_serp(artifacts, keyword, device_type)
+            if serp_data:
+                print("保存済みのSERPデータを再利用します")
+                return {"serp_data": serp_data, "serp_analysis": analyze_serp_structure(serp_data)}
+            serp_data = await get_serp_data(
+                keyword=keyword,
+                location_code=2840,  # 日本
+                language_code="ja",
+                device=device_type,
+                depth=50,
+                user_id=self.user_id
+            )
+            return {
+                "serp_data": serp_data,
+                "serp_analysis": analyze_serp_structure(serp_data) if serp_data else {}
+            }
+
+        async def knowledge_retrieval(results: Dict) -> str:
+            return await run_blocking(self._knowledge_retrieval, keyword)
+
+        async def subtopics(results: Dict) -> Optional[List[str]]:
+            return await generate_subtopics(keyword, user_id=self.user_id)
+
+        async def image_selection(results: Dict) -> List[Dict]:
+            return await run_blocking(self._select_images, keyword)
+
+        async def article_analysis(results: Dict) -> Dict:
+            # SERP分析結果があればそれを、なければGoogle検索結果（フォールバック）を分析
+            serp_analysis = results["serp_analysis"]["serp_analysis"]
             if serp_analysis:
-                analysis = {
+                return {
                     "optimal_length": str(int(serp_analysis.get("average_title_length", 30) * 100)),
                     "common_words": ", ".join([
                         k for k, v in serp_analysis.get("common_patterns", {}).items() 
@@ -194,85 +250,154 @@ class ArticleGenerator:
                     "summaries": json.dumps(serp_analysis, ensure_ascii=False),
                     "serp_analysis": serp_analysis
                 }
-            else:
-                analysis = self._analyze_articles(google_results)
-            
-            # サブトピック生成
-            try:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                subtopics_list = loop.run_until_complete(
-                    generate_subtopics(keyword, user_id=self.user_id)
-                )
-                loop.close()
-            except Exception as e:
-                print(f"サブトピック生成エラー（続行）: {str(e)}")
-            
-            # 4. タイトル生成（SEO最適化）
-            title = self._generate_title_seo(
-                article_data, knowledge_context, analysis, 
-                serp_analysis, keywords_data, best_keywords
-            )
-            
-            # 5. 記事生成（SEO最適化）
-            content = self._generate_content_seo(
-                article_data, title, knowledge_context, analysis,
-                serp_analysis, keywords_data, subtopics_list, best_keywords
+            google_results = await run_blocking(self._google_search, keyword)
+            pages = await fetch_pages([result.get("link") for result in google_results[:10]])
+            return await run_blocking(self._analyze_articles, pages)
+
+        async def title(results: Dict) -> str:
+            # タイトル生成（SEO最適化）
+            return await run_blocking(
+                self._generate_title_seo,
+                article_data, results["knowledge_retrieval"], results["article_analysis"],
+                results["serp_analysis"]["serp_analysis"], results["keyword_volume"],
+                results["keyword_research"]["best_keywords"]
             )
-            
-            # 6. 画像選定
-            images = self._select_images(keyword)
-            
-            # 7. 画像挿入
-            content_with_images = self._insert_images(content, images)
-            
-            # メタタグ生成
-            try:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                meta_tags = loop.run_until_complete(
-                    generate_meta_tags(title, content_with_images, user_id=self.user_id)
+
+        async def content(results: Dict) -> str:
+            # 長文はアウトラインを作ってからセクションごとに並行生成する
+            if self._use_sectioned_generation(results["article_analysis"]):
+                sectioned = await self._generate_content_sectioned(
+                    article_data, results["title"], results["knowledge_retrieval"], results["article_analysis"],
+                    results["serp_analysis"]["serp_data"], results["serp_analysis"]["serp_analysis"],
+                    results["subtopics"], results["keyword_research"]["best_keywords"]
                 )
-                loop.close()
-            except Exception as e:
-                print(f"メタタグ生成エラー（続行）: {str(e)}")
-            
-            # 構造化データ生成
-            faq_items = serp_analysis.get("faq_items", []) if serp_analysis else []
-            structured_data = generate_all_schemas(
-                title=title,
-                content=content_with_images,
+                if sectioned:
+                    return sectioned
+            # 記事生成（SEO最適化）
+            return await run_blocking(
+                self._generate_content_seo,
+                article_data, results["title"], results["knowledge_retrieval"], results["article_analysis"],
+                results["serp_analysis"]["serp_analysis"], results["keyword_volume"], results["subtopics"],
+                results["keyword_research"]["best_keywords"]
+            )
+
+        async def image_insertion(results: Dict) -> str:
+            if not results["image_selection"]:
+                print("挿入する画像がないため、画像挿入をスキップします")
+                return results["content"]
+            if settings.image_placement_use_llm:
+                return await run_blocking(self._insert_images, results["content"], results["image_selection"], keyword)
+            return self._insert_images(results["content"], results["image_selection"], keyword)
+
+        async def meta_tags(results: Dict) -> Optional[Dict[str, str]]:
+            return await generate_meta_tags(results["title"], results["image_insertion"], user_id=self.user_id)
+
+        async def structured_data(results: Dict) -> Dict:
+            faq_items = results["serp_analysis"]["serp_analysis"].get("faq_items", [])
+            return generate_all_schemas(
+                title=results["title"],
+                content=results["image_insertion"],
                 faq_items=[{"question": q, "answer": ""} for q in faq_items] if faq_items else None
             )
-            
-            # 8. Shopify形式変換
-            shopify_json = self._convert_to_shopify(content_with_images)
-            
-            return {
-                "title": title,
-                "content": content_with_images,
-                "shopify_json": shopify_json,
-                # SEO関連データ
-                "meta_title": meta_tags.get("meta_title") if meta_tags else None,
-                "meta_description": meta_tags.get("meta_description") if meta_tags else None,
-                "serp_data": serp_data,
-                "serp_headings_analysis": serp_analysis.get("headings_analysis") if serp_analysis else None,
-                "serp_common_patterns": serp_analysis.get("common_patterns") if serp_analysis else None,
-                "serp_faq_items": faq_items,
-                "keyword_volume_data": keywords_data,
-                "related_keywords": self._extract_related_keywords(keywords_data) if keywords_data else None,
-                "keyword_difficulty": self._extract_keyword_difficulty(keywords_data) if keywords_data else None,
-                "best_keywords": best_keywords,  # 最適なキーワードリスト（スコアリング済み）
-                "subtopics": subtopics_list,
-                "content_structure": serp_analysis.get("headings_analysis") if serp_analysis else None,
-                "structured_data": structured_data,
-                "search_intent": search_intent,
-                "target_location": target_location,
-                "device_type": device_type
-            }
-        except Exception as e:
-            raise Exception(f"記事生成エラー: {str(e)}")
+
+        async def shopify_conversion(results: Dict) -> Dict:
+            # Shopify形式変換（メタディスクリプションをmetafields_global_description_tagに使う）
+            meta_tags = results["meta_tags"] or {}
+            if settings.shopify_conversion_use_llm:
+                return await run_blocking(self._convert_to_shopify_with_llm, results["image_insertion"])
+            return self._convert_to_shopify(
+                results["image_insertion"], results["title"], meta_tags.get("meta_description")
+            )
+
+        # SEO分析系のステージは失敗しても記事生成を続行する
+        graph = StageGraph([
+            Stage("keyword_research", keyword_research, required=False,
+                  default=lambda: {"keywords_data": None, "best_keywords": []}),
+            Stage("keyword_volume", keyword_volume, deps=["keyword_research"], required=False),
+            Stage("serp_analysis", serp_analysis, required=False,
+                  default=lambda: {"serp_data": None, "serp_analysis": {}}),
+            Stage("knowledge_retrieval", knowledge_retrieval, required=False, default=""),
+            Stage("subtopics", subtopics, required=False),
+            Stage("image_selection", image_selection, required=False, default=list),
+            Stage("article_analysis", article_analysis, deps=["serp_analysis"]),
+            Stage("title", title, deps=["keyword_research", "keyword_volume", "knowledge_retrieval", "article_analysis"]),
+            Stage("content", content, deps=["title", "subtopics"],
+                  timeout=settings.article_llm_stage_timeout_seconds),
+            Stage("image_insertion", image_insertion, deps=["content", "image_selection"],
+                  timeout=settings.article_llm_stage_timeout_seconds),
+            Stage("meta_tags", meta_tags, deps=["image_insertion"], required=False),
+            Stage("structured_data", structured_data, deps=["image_insertion", "serp_analysis"]),
+            Stage("shopify_conversion", shopify_conversion, deps=["title", "image_insertion", "meta_tags"],
+                  timeout=settings.article_llm_stage_timeout_seconds),
+        ], default_timeout=settings.article_stage_timeout_seconds, name="article_generation", checkpoints=checkpoints)
+
+        try:
+            results = await graph.run()
+        finally:
+            # このループ用に作成したDataForSEOのコネクションを閉じる
+            await close_dataforseo_http_clients()
+
+        serp_data = results["serp_analysis"]["serp_data"]
+        serp_analysis = results["serp_analysis"]["serp_analysis"]
+        keywords_data = results["keyword_volume"]
+        meta_tags = results["meta_tags"]
+        faq_items = serp_analysis.get("faq_items", []) if serp_analysis else []
+
+        return {
+            "title": results["title"],
+            "content": results["image_insertion"],
+            "shopify_json": results["shopify_conversion"],
+            # SEO関連データ
+            "meta_title": meta_tags.get("meta_title") if meta_tags else None,
+            "meta_description": meta_tags.get("meta_description") if meta_tags else None,
+            "serp_data": serp_data,
+            "serp_headings_analysis": serp_analysis.get("headings_analysis") if serp_analysis else None,
+            "serp_common_patterns": serp_analysis.get("common_patterns") if serp_analysis else None,
+            "serp_faq_items": faq_items,
+            "keyword_volume_data": keywords_data,
+            "related_keywords": self._extract_related_keywords(keywords_data) if keywords_data else None,
+            "keyword_difficulty": self._extract_keyword_difficulty(keywords_data) if keywords_data else None,
+            "best_keywords": results["keyword_research"]["best_keywords"],  # 最適なキーワードリスト（スコアリング済み）
+            "subtopics": results["subtopics"],
+            "content_structure": serp_analysis.get("headings_analysis") if serp_analysis else None,
+            "structured_data": results["structured_data"],
+            "search_intent": search_intent,
+            "target_location": target_location,
+            "device_type": device_type
+        }
     
+    def _reusable_serp(self, artifacts: Dict, keyword: str, device_type: str) -> Optional[Dict]:
+        """
+        記事に保存済みのSERPデータが同じキーワード・デバイスで十分新しければ返す
+
+        Args:
+            artifacts: 記事に保存済みの分析データ
+            keyword: 検索キーワード
+            device_type: デバイスタイプ
+
+        Returns:
+            再利用できるSERPデータ（なければNone）
+        """
+        serp_data = artifacts.get("serp_data")
+        if not isinstance(serp_data, dict) or not serp_data.get("items"):
+            return None
+        if serp_data.get("keyword") != keyword or (artifacts.get("serp_device") or "mobile") != device_type:
+            return None
+        try:
+            # DataForSEOのdatetimeは "2024-01-01 12:00:00 +00:00" 形式
+            fetched_at = datetime.strptime(serp_data.get("datetime", ""), "%Y-%m-%d %H:%M:%S %z")
+        except ValueError:
+            return None
+        age_hours = (datetime.now(timezone.utc) - fetched_at).total_seconds() / 3600
+        if age_hours > settings.article_serp_reuse_max_age_hours:
+            return None
+        return serp_data
+
+    def _emit_draft(self, **fields: str) -> None:
+        """生成途中の内容をコールバックに渡す"""
+        if self.on_draft:
+            self.on_draft(**fields)
+
     def _knowledge_retrieval(self, keyword: str) -> str:
         """知識ベースから情報を取得（Supabase）"""
         if not self.supabase:
@@ -281,17 +406,14 @@ class ArticleGenerator:
             return ""
         
         try:
-            # Supabaseのknowledge_baseテーブルから検索
-            response = self.supabase.table("knowledge_base")\
-                .select("*")\
-                .ilike("content", f"%{keyword}%")\
-                .limit(5)\
-                .execute()
-            
-            if response.data:
+            # 知識ベースのインデックスから関連するパッセージを検索（インデックスは差分更新）
+            passages = search_knowledge(self.supabase, keyword)
+            if passages:
                 # 関連する知識を結合
-                knowledge_texts = [item.get("content", "") for item in response.data]
-                return "\n\n".join(knowledge_texts)
+                return "\n\n".join(
+                    f"【{passage['title']}】\n{passage['text']}" if passage["title"] else passage["text"]
+                    for passage in passages
+                )
             return ""
         except Exception as e:
             print(f"知識ベース検索エラー: {e}")
@@ -317,24 +439,25 @@ class ArticleGenerator:
             return data.get("items", [])
         return []
     
-    def _analyze_articles(self, google_results: List[Dict]) -> Dict:
-        """検索結果を分析"""
-        # 各URLからコンテンツを取得して分析
-        articles_text = []
-        for result in google_results[:10]:
-            try:
-                response = httpx.get(result.get("link"), timeout=10)
-                if response.status_code == 200:
-                    articles_text.append(response.text)
-            except:
-                continue
-        
-        # Geminiで分析
-        prompt = f"""
-        以下の10個のテキストファイルを分析し、以下の形式で出力してください。
+    def _analyze_articles(self, pages: List[Dict]) -> Dict:
+        """
+        競合ページの本文テキストを分析
+
+        Args:
+            pages: fetch_pagesの結果（抽出済みの本文テキスト）
+        """
+        pages = [page for page in pages if page.get("text")][:10]
+        
+        def render(texts: Dict[str, str]) -> str:
+            articles_text = [
+                {"title": page["title"], "headings": page["headings"], "text": texts.get(f"page{index}", "")}
+                for index, page in enumerate(pages)
+            ]
+            return f"""
+        以下の{len(articles_text)}個のテキストファイルを分析し、以下の形式で出力してください。
         
         # 分析対象テキスト
-        {json.dumps(articles_text[:10], ensure_ascii=False)}
+        {json.dumps(articles_text, ensure_ascii=False)}
         
         # 出力形式
         ・最適文字数：〇〇文字
@@ -342,11 +465,23 @@ class ArticleGenerator:
         ・各テキストファイルの概要：〇〇〜〜〜。〇〇〜〜〜〜。
         """
         
-        response = self.gemini_model.generate_content(prompt)
+        # Geminiで分析（各ページの本文を予算内に均等に収める）
+        builder = PromptBuilder("gemini-2.0-flash", "analyze_articles")
+        for index, page in enumerate(pages):
+            builder.add(f"page{index}", page["text"], max_tokens=1500)
+        prompt = render(builder.fit(reserved_tokens=count_tokens(render({}), "gemini-2.0-flash")))
+        builder.finish(prompt)
+        
+        def call() -> Tuple[str, str, str]:
+            return self.llm.route("analyze_articles", prompt, primary="gemini")
+        
+        text = cached_routed_llm_text(
+            "gemini", "gemini-2.0-flash", "analyze_articles", prompt, None, call, reuse_sampled=self.reuse_sampled
+        )
         return {
-            "optimal_length": self._extract_optimal_length(response.text),
-            "common_words": self._extract_common_words(response.text),
-            "summaries": response.text
+            "optimal_length": self._extract_optimal_length(text),
+            "common_words": self._extract_common_words(text),
+            "summaries": text
         }
     
     def _generate_title_seo(
@@ -390,14 +525,15 @@ class ArticleGenerator:
     
     def _generate_title(self, article_data: Dict, knowledge_context: str, analysis: Dict) -> str:
         """タイトルを生成"""
-        prompt = f"""
+        def render(sections: Dict[str, str]) -> str:
+            return f"""
         あなたは優秀なコンテンツマーケターです。以下の情報を基に、魅力的で読まれやすい記事のタイトル案を1個生成してください。
         
         # 眼鏡生産者の想い
-        {knowledge_context}
+        {sections.get('knowledge', '')}
         
         # Googleにおける記事の概要
-        {analysis.get('summaries', '')}
+        {sections.get('summaries', '')}
         
         # 生成条件
         - 文字数: 15-40文字
@@ -413,15 +549,27 @@ class ArticleGenerator:
         タイトル案を1つ出力してください。
         """
         
-        response = self.openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "あなたは優秀なコンテンツマーケターです。"},
-                {"role": "user", "content": prompt}
-            ]
-        )
+        builder = PromptBuilder("gpt-4o", "title")
+        builder.add("knowledge", knowledge_context, max_tokens=2000)
+        builder.add("summaries", analysis.get("summaries", ""), max_tokens=2500, shrink=compact_json)
+        prompt = render(builder.fit(reserved_tokens=count_tokens(render({}), "gpt-4o")))
         
-        return response.choices[0].message.content.strip()
+        messages = [
+            {"role": "system", "content": "あなたは優秀なコンテンツマーケターです。"},
+            {"role": "user", "content": prompt}
+        ]
+        def call() -> Tuple[str, str, str]:
+            return self.llm.route(
+                "title", prompt, primary="openai", system=messages[0]["content"],
+                on_text=lambda text: self._emit_draft(title=text.strip())
+            )
+        
+        builder.finish(messages)
+        title = cached_routed_llm_text(
+            "openai", "gpt-4o", "title", messages, None, call, reuse_sampled=self.reuse_sampled
+        ).strip()
+        self._emit_draft(title=title)
+        return title
     
     def _generate_content_seo(
         self,
@@ -459,7 +607,8 @@ class ArticleGenerator:
     
     def _generate_content(self, article_data: Dict, title: str, knowledge_context: str, analysis: Dict) -> str:
         """記事内容を生成"""
-        prompt = f"""
+        def render(sections: Dict[str, str]) -> str:
+            return f"""
         あなたは経験豊富なコンテンツライターです。与えられたタイトルに基づいて、魅力的な記事内容を生成してください。
         
         ## 入力データ
@@ -467,7 +616,7 @@ class ArticleGenerator:
         {title}
         
         # 眼鏡生産者の想い
-        {knowledge_context}
+        {sections.get('knowledge', '')}
         
         ### 必須単語
         {article_data.get('keyword')}
@@ -489,15 +638,247 @@ class ArticleGenerator:
         [まとめ]
         """
         
-        response = self.gemini_model.generate_content(
-            prompt,
-            generation_config={
-                "max_output_tokens": 4000,
-                "temperature": 0.8,
-            },
+        builder = PromptBuilder("gemini-2.0-flash", "content")
+        builder.add("knowledge", knowledge_context, max_tokens=3000)
+        prompt = render(builder.fit(reserved_tokens=count_tokens(render({}), "gemini-2.0-flash")))
+        builder.finish(prompt)
+        
+        generation_config = {
+            "max_output_tokens": 4000,
+            "temperature": 0.8,
+        }
+        
+        def call() -> Tuple[str, str, str]:
+            return self.llm.route(
+                "content", prompt, primary="gemini",
+                temperature=generation_config["temperature"],
+                max_tokens=generation_config["max_output_tokens"],
+                on_text=lambda text: self._emit_draft(content=text)
+            )
+        
+        content = cached_routed_llm_text(
+            "gemini", "gemini-2.0-flash", "content", prompt, generation_config, call, reuse_sampled=self.reuse_sampled
         )
-        return response.text
+        self._emit_draft(content=content)
+        return content
     
+    def _target_length(self, analysis: Dict) -> int:
+        """分析結果の最適文字数（数値が取れない場合は3000）"""
+        match = re.search(r"\d[\d,]*", str(analysis.get("optimal_length", "")))
+        return int(match.group(0).replace(",", "")) if match else 3000
+
+    def _use_sectioned_generation(self, analysis: Dict) -> bool:
+        """アウトライン・セクション分割で生成するか（設定と目標文字数で判定）"""
+        mode = settings.article_generation_mode
+        if mode == "sectioned":
+            return True
+        if mode == "auto":
+            return self._target_length(analysis) >= settings.article_sectioned_min_chars
+        return False
+
+    async def _generate_content_sectioned(
+        self,
+        article_data: Dict,
+        title: str,
+        knowledge_context: str,
+        analysis: Dict,
+        serp_data: Optional[Dict],
+        serp_analysis: Optional[Dict],
+        subtopics: Optional[List[str]],
+        best_keywords: List[Dict]
+    ) -> Optional[str]:
+        """
+        アウトラインを生成してから各セクションを並行生成し、1つの記事に結合
+        所要時間は記事全体の長さではなく最も長いセクションで決まり、1回の出力上限を超える長さの記事も書ける
+
+        Returns:
+            記事本文（アウトラインを生成できなかった場合、再試行しても書けないセクションがあった場合は
+            Noneを返し、呼び出し側で一括生成する）
+        """
+        target_chars = self._target_length(analysis)
+        try:
+            outline = await run_blocking(
+                self._generate_outline,
+                article_data, title, knowledge_context, analysis,
+                outline_hints(serp_data, serp_analysis), subtopics, best_keywords, target_chars
+            )
+        except (ValueError, LLMRouterError, TimeoutError) as e:
+            print(f"アウトライン生成に失敗したため一括生成します: {str(e)}")
+            return None
+        outline = allocate_section_lengths(outline, target_chars)
+        print(f"アウトライン: {len(outline)}セクション（目標{target_chars}文字）")
+
+        texts: List[Optional[str]] = [None] * len(outline)
+        semaphore = asyncio.Semaphore(max(1, settings.article_section_concurrency))
+
+        def on_section_text(index: int, text: str) -> None:
+            texts[index] = text
+            self._emit_draft(content=stitch_sections(title, outline, texts))
+
+        async def write_section(index: int) -> None:
+            async with semaphore:
+                try:
+                    texts[index] = await run_blocking(
+                        self._generate_section,
+                        article_data, title, outline, index, knowledge_context,
+                        lambda text: on_section_text(index, text)
+                    )
+                except BaseException:
+                    # 途中まで受け取った本文は下書きに残さない
+                    texts[index] = None
+                    raise
+
+        # 失敗したセクションだけを書き直す（書けたセクションは捨てない）
+        failed = list(range(len(outline)))
+        for attempt in range(settings.article_section_retries + 1):
+            results = await asyncio.gather(*(write_section(index) for index in failed), return_exceptions=True)
+            errors = {
+                index: result for index, result in zip(failed, results)
+                if isinstance(result, Exception)
+            }
+            failed = list(errors)
+            if not failed:
+                break
+            for index, error in errors.items():
+                print(f"セクション{index + 1}「{outline[index]['heading']}」の生成に失敗しました（{attempt + 1}回目）: {str(error)}")
+        if failed:
+            print(f"{len(failed)}セクションを生成できなかったため一括生成します")
+            return None
+
+        content = stitch_sections(title, outline, texts)
+        self._emit_draft(content=content)
+        return content
+
+    def _generate_outline(
+        self,
+        article_data: Dict,
+        title: str,
+        knowledge_context: str,
+        analysis: Dict,
+        hints: Dict[str, List[str]],
+        subtopics: Optional[List[str]],
+        best_keywords: List[Dict],
+        target_chars: int
+    ) -> List[Dict]:
+        """記事のアウトライン（見出し・要点・目安文字数）を生成"""
+        keywords = [kw["keyword"] for kw in (best_keywords or [])[:10] if kw.get("keyword")]
+
+        def render(sections: Dict[str, str]) -> str:
+            return f"""
+        あなたは経験豊富なコンテンツディレクターです。以下の情報を基に、記事のアウトラインを作成してください。
+        
+        ## 記事タイトル
+        {title}
+        
+        ## 必須単語
+        {article_data.get('keyword')}
+        
+        ## 眼鏡生産者の想い
+        {sections.get('knowledge', '')}
+        
+        ## 上位記事のタイトル
+        {json.dumps(hints.get('titles', []), ensure_ascii=False)}
+        
+        ## 上位記事によくある構成
+        {', '.join(hints.get('patterns', [])) or 'なし'}
+        
+        ## よくある質問
+        {json.dumps(hints.get('faq_items', []), ensure_ascii=False)}
+        
+        ## 扱うサブトピック
+        {json.dumps(subtopics or [], ensure_ascii=False)}
+        
+        ## 条件
+        - 記事全体の文字数: {target_chars}文字
+        - 見出しによく使われるワード: {analysis.get('common_words', '')}
+        - ターゲット読者: {article_data.get('target')}
+        - 優先的に使用するキーワード: {', '.join(keywords)}
+        - 最初のセクションは導入、最後のセクションはまとめにする
+        - セクション数は4〜10個
+        
+        ## 出力形式（JSONのみを出力）
+        {{"sections": [{{"heading": "見出し", "points": ["書く内容の要点"], "target_chars": 500}}]}}
+        """
+
+        builder = PromptBuilder("gemini-2.0-flash", "outline")
+        builder.add("knowledge", knowledge_context, max_tokens=1500)
+        prompt = render(builder.fit(reserved_tokens=count_tokens(render({}), "gemini-2.0-flash")))
+        builder.finish(prompt)
+        generation_config = {"max_output_tokens": 2000, "temperature": 0.4}
+
+        def call() -> Tuple[str, str, str]:
+            return self.llm.route(
+                "outline", prompt, primary="gemini",
+                temperature=generation_config["temperature"],
+                max_tokens=generation_config["max_output_tokens"]
+            )
+
+        text = cached_routed_llm_text(
+            "gemini", "gemini-2.0-flash", "outline", prompt, generation_config, call, validate=parse_outline,
+            reuse_sampled=self.reuse_sampled
+        )
+        return parse_outline(text)
+
+    def _generate_section(
+        self,
+        article_data: Dict,
+        title: str,
+        outline: List[Dict],
+        index: int,
+        knowledge_context: str,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """アウトラインの1セクションの本文を生成（前後のセクションとのつながりを意識させる）"""
+        section = outline[index]
+        previous_heading = outline[index - 1]["heading"] if index > 0 else "（なし。記事の最初のセクション）"
+        next_heading = outline[index + 1]["heading"] if index + 1 < len(outline) else "（なし。記事の最後のセクション）"
+        outline_text = "\n".join(f"{number + 1}. {item['heading']}" for number, item in enumerate(outline))
+
+        def render(sections: Dict[str, str]) -> str:
+            return f"""
+        あなたは経験豊富なコンテンツライターです。記事「{title}」のうち、指定したセクションの本文だけを書いてください。
+        
+        ## 記事全体の構成
+        {outline_text}
+        
+        ## 書くセクション
+        {index + 1}. {section['heading']}
+        
+        ## このセクションで書く内容
+        {chr(10).join(f"- {point}" for point in section['points']) or '- 見出しに沿って書く'}
+        
+        ## 眼鏡生産者の想い
+        {sections.get('knowledge', '')}
+        
+        ## 条件
+        - 文字数: 約{section['target_chars']}文字
+        - 必須単語: {article_data.get('keyword')}
+        - ターゲット読者: {article_data.get('target')}
+        - 前のセクション「{previous_heading}」から自然につながる書き出しにし、次のセクション「{next_heading}」の内容は書かない
+        - 必要に応じて小見出し（####）を使う。セクションの見出し自体と他のセクションの内容は出力しない
+        """
+
+        builder = PromptBuilder("gemini-2.0-flash", "content_section")
+        builder.add("knowledge", knowledge_context, max_tokens=1000)
+        prompt = render(builder.fit(reserved_tokens=count_tokens(render({}), "gemini-2.0-flash")))
+        builder.finish(prompt)
+        generation_config = {
+            "max_output_tokens": section_output_tokens(section["target_chars"]),
+            "temperature": 0.8,
+        }
+
+        def call() -> Tuple[str, str, str]:
+            return self.llm.route(
+                "content_section", prompt, primary="gemini",
+                temperature=generation_config["temperature"],
+                max_tokens=generation_config["max_output_tokens"],
+                on_text=on_text
+            )
+
+        return cached_routed_llm_text(
+            "gemini", "gemini-2.0-flash", "content_section", prompt, generation_config, call, reuse_sampled=self.reuse_sampled
+        )
+
     def _select_images(self, keyword: str) -> List[Dict]:
         """ユーザー登録の画像をキーワードで取得"""
         if not self.supabase or not self.user_id:
@@ -529,9 +910,18 @@ class ArticleGenerator:
             print(f"画像取得エラー: {e}")
             return []
     
-    def _insert_images(self, content: str, images: List[Dict]) -> str:
-        """記事に画像を挿入"""
-        # GPT-4oで画像を適切な位置に挿入
+    def _insert_images(self, content: str, images: List[Dict], keyword: Optional[str] = None) -> str:
+        """記事に画像を挿入（見出し構造とalt_textから決定的に配置、設定によりGPT-4oで配置）"""
+        if not images:
+            return content
+        if settings.image_placement_use_llm:
+            return self._insert_images_with_llm(content, images)
+        content_with_images = place_images(content, images, keyword)
+        self._emit_draft(content=content_with_images)
+        return content_with_images
+    
+    def _insert_images_with_llm(self, content: str, images: List[Dict]) -> str:
+        """GPT-4oで画像を適切な位置に挿入"""
         prompt = f"""
         以下の記事に画像を適切な位置に挿入してください。
         
@@ -544,18 +934,42 @@ class ArticleGenerator:
         Markdown形式で画像を ![alt](URL) の形式で挿入してください。
         """
         
-        response = self.openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "あなたは記事制作と画像選定の専門家です。"},
-                {"role": "user", "content": prompt}
-            ]
-        )
+        messages = [
+            {"role": "system", "content": "あなたは記事制作と画像選定の専門家です。"},
+            {"role": "user", "content": prompt}
+        ]
         
-        return response.choices[0].message.content.strip()
+        def on_text(text: str) -> None:
+            # 画像なしの本文より短いうちは表示中の下書きを置き換えない
+            if len(text) >= len(content):
+                self._emit_draft(content=text)
+        
+        def call() -> str:
+            if settings.llm_streaming_enabled:
+                return stream_openai_chat(
+                    self.openai_client, "gpt-4o", messages, "insert_images", on_text=on_text
+                ).strip()
+            
+            started = time.perf_counter()
+            response = self.openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages
+            )
+            record_llm_call("openai", "gpt-4o", "insert_images", started, response)
+            return response.choices[0].message.content.strip()
+        
+        content_with_images = cached_llm_text(
+            "openai", "gpt-4o", "insert_images", messages, None, call, reuse_sampled=self.reuse_sampled
+        )
+        self._emit_draft(content=content_with_images)
+        return content_with_images
+    
+    def _convert_to_shopify(self, content: str, title: str = "", meta_description: Optional[str] = None) -> Dict:
+        """Shopify形式に変換（Markdownからbody_htmlをローカルで生成）"""
+        return render_shopify_article(title, content, meta_description)
     
-    def _convert_to_shopify(self, content: str) -> Dict:
-        """Shopify形式に変換"""
+    def _convert_to_shopify_with_llm(self, content: str) -> Dict:
+        """GeminiでShopify形式に変換"""
         prompt = f"""
         以下の記事を正しいShopify JSON形式に変換してください。
         
@@ -568,8 +982,22 @@ class ArticleGenerator:
         1行のJSON形式で出力してください。
         """
         
-        response = self.gemini_model.generate_content(prompt)
-        json_str = self._extract_json_string(response.text)
+        def call() -> str:
+            started = time.perf_counter()
+            response = self.gemini_model.generate_content(prompt)
+            record_llm_call("gemini", "gemini-2.0-flash", "shopify_json", started, response, prompt=prompt)
+            return response.text
+        
+        # 解析できない出力はキャッシュせず、再実行で生成し直す
+        text = cached_llm_text(
+            "gemini", "gemini-2.0-flash", "shopify_json", prompt, None, call, validate=self._parse_shopify_json,
+            reuse_sampled=self.reuse_sampled
+        )
+        return self._parse_shopify_json(text)
+    
+    def _parse_shopify_json(self, text: str) -> Dict:
+        """GeminiのレスポンスからShopify JSONを取り出す"""
+        json_str = self._extract_json_string(text)
         try:
             return json.loads(json_str)
         except json.JSONDecodeError as exc:
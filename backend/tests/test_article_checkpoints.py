@@ -0,0 +1,56 @@
+"""
+app.article_checkpoints のテスト
+"""
+from app import article_checkpoints
+from app.article_checkpoints import INPUT_STAGE, ArticleCheckpoints, load_checkpoint_input
+
+
+class FakeTable:
+    """article_checkpoints テーブルの代わり（(記事ID, 入力ハッシュ, ステージ) -> 行）"""
+
+    def __init__(self):
+        self.rows = {}
+        self.clock = 0
+
+    def get(self, article_id, input_hash=None):
+        rows = [
+            dict(row, input_hash=key[1], stage=key[2])
+            for key, row in self.rows.items()
+            if key[0] == article_id and (input_hash is None or key[1] == input_hash)
+        ]
+        # 並び順に依存しないことを確認するため、あえて古い順に返す
+        return sorted(rows, key=lambda row: row["updated_at"])
+
+    def save(self, article_id, input_hash, stage, output):
+        self.clock += 1
+        self.rows[(article_id, input_hash, stage)] = {"output": output, "updated_at": f"2026-01-01T00:00:{self.clock:02d}"}
+
+    def delete(self, article_id, keep_input_hash=None):
+        for key in list(self.rows):
+            if key[0] == article_id and key[1] != keep_input_hash:
+                del self.rows[key]
+
+
+def test_resume_uses_the_latest_input_and_drops_stale_checkpoints(monkeypatch):
+    table = FakeTable()
+    monkeypatch.setattr(article_checkpoints, "get_article_checkpoints", table.get)
+    monkeypatch.setattr(article_checkpoints, "save_article_checkpoint", table.save)
+    monkeypatch.setattr(article_checkpoints, "delete_article_checkpoints", table.delete)
+
+    first = ArticleCheckpoints("a1", {"keyword": "眼鏡"})
+    first.load()
+    first.save("title", "眼鏡の選び方", "ok", "h")
+
+    second = ArticleCheckpoints("a1", {"keyword": "サングラス"})
+    second.load()
+
+    assert load_checkpoint_input("a1") == {"keyword": "サングラス"}
+    # 古い入力のチェックポイントは残らない
+    assert {key[1] for key in table.rows} == {second.input_hash}
+
+    # 同じ入力で再開すると、保存済みの出力を復元できる
+    second.save("title", "サングラスの選び方", "ok", "h")
+    resumed = ArticleCheckpoints("a1", load_checkpoint_input("a1"))
+    assert resumed.load() == 1
+    assert resumed.get("title") == {"output": "サングラスの選び方", "status": "ok", "inputs_hash": "h"}
+    assert resumed.get(INPUT_STAGE) is None
@@ -0,0 +1,25 @@
+"""
+app.dataforseo_client のテスト
+"""
+import asyncio
+
+from app import dataforseo_client
+from app.config import settings
+
+
+def test_chunked_keyword_data_uses_the_current_base_url(monkeypatch):
+    monkeypatch.setenv("DATAFORSEO_LOGIN", "login")
+    monkeypatch.setenv("DATAFORSEO_PASSWORD", "password")
+    monkeypatch.setattr(settings, "dataforseo_base_url", "http://standin.local:8080")
+    urls = []
+
+    async def fake_post_live_many(url, tasks, config, **kwargs):
+        urls.append(url)
+        return [{"status_code": 20000, "result": []} for _ in tasks]
+
+    monkeypatch.setattr(dataforseo_client, "_post_live_many", fake_post_live_many)
+
+    asyncio.run(dataforseo_client.get_keywords_data_chunked(["眼鏡"], source="google_ads"))
+
+    # インポート時ではなく送信時の設定のベースURLに送る
+    assert urls == ["http://standin.local:8080/v3/keywords_data/google_ads/search_volume/live"]
@@ -0,0 +1,37 @@
+"""
+app.dataforseo_gateway のテスト
+"""
+import asyncio
+import json
+
+from app import dataforseo_gateway
+
+
+def test_inflight_requests_are_not_shared_between_logins(monkeypatch):
+    calls = []
+
+    async def fake_send(url, payload_list, config, timeout):
+        calls.append(config["login"])
+        await asyncio.sleep(0.05)
+        status_code = 20000 if config["login"] == "paid" else 40200
+        body = {"tasks": [{"status_code": status_code}]}
+        return 200, json.dumps(body).encode("utf-8"), {"Content-Type": "application/json"}
+
+    monkeypatch.setattr(dataforseo_gateway, "_send", fake_send)
+    url = "https://api.dataforseo.com/v3/serp/google/organic/live/advanced"
+    payload = [{"keyword": "眼鏡 選び方", "location_code": 2392}]
+
+    async def run():
+        return await asyncio.gather(
+            dataforseo_gateway.post_dataforseo(url, payload, {"login": "paid", "password": "a"}),
+            dataforseo_gateway.post_dataforseo(url, payload, {"login": "unpaid", "password": "b"}),
+            dataforseo_gateway.post_dataforseo(url, payload, {"login": "paid", "password": "a"}),
+        )
+
+    paid, unpaid, paid_again = asyncio.run(run())
+
+    # 同じログイン同士は合流し、ログインが異なれば別々に送信する
+    assert sorted(calls) == ["paid", "unpaid"]
+    assert paid.json()["tasks"][0]["status_code"] == 20000
+    assert paid_again.json()["tasks"][0]["status_code"] == 20000
+    assert unpaid.json()["tasks"][0]["status_code"] == 40200
@@ -0,0 +1,32 @@
+"""
+app.dataforseo_tasks のテスト
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app import dataforseo_tasks
+from app.dataforseo_tasks import TASK_CREATED, DataForSEOTaskQueue
+
+
+def test_submit_many_unregisters_earlier_chunks_when_a_later_chunk_fails(monkeypatch):
+    posted = []
+
+    def handler(request):
+        posted.append(request)
+        if len(posted) == 2:
+            return httpx.Response(500, json={"status_code": 50000})
+        tasks = [{"id": f"task-{i}", "status_code": TASK_CREATED} for i in range(100)]
+        return httpx.Response(200, json={"status_code": 20000, "cost": 0.06, "tasks": tasks})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(dataforseo_tasks, "get_dataforseo_http_client", lambda login: client)
+    queue = DataForSEOTaskQueue()
+    payloads = [{"keyword": f"眼鏡 {i}"} for i in range(150)]
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(queue.submit_many("serp_organic", payloads, {"login": "a", "password": "b"}, timeout=60))
+
+    assert len(posted) == 2
+    assert queue.pending_count() == 0
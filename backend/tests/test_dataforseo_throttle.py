@@ -0,0 +1,73 @@
+"""
+app.dataforseo_throttle のテスト
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app import metrics
+from app.config import settings
+from app.dataforseo_throttle import send_with_retry
+from app.metrics import metrics_context, pop_article_breakdown
+
+ENDPOINT = "/v3/serp/google/organic/task_get/advanced/{task_id}"
+
+
+def test_success_and_error_are_recorded_under_the_same_endpoint(monkeypatch):
+    monkeypatch.setattr(settings, "dataforseo_max_retries", 0)
+    request = httpx.Request("GET", "https://api.dataforseo.com/v3/serp/google/organic/task_get/advanced/abc-123")
+
+    async def ok(remaining):
+        return httpx.Response(200, json={"status_code": 20000, "cost": 0}, request=request)
+
+    async def fail(remaining):
+        raise httpx.ConnectError("接続できません", request=request)
+
+    async def run():
+        await send_with_retry(ok, "login-throttle", 5.0, "DataForSEO task_get", ENDPOINT)
+        with pytest.raises(httpx.ConnectError):
+            await send_with_retry(fail, "login-throttle", 5.0, "DataForSEO task_get", ENDPOINT)
+
+    with metrics_context(user_id="user-1", article_id="article-throttle"):
+        asyncio.run(run())
+
+    # タスクIDを含むURLのパスではなく、呼び出し側が指定したラベルで記録する
+    assert list(pop_article_breakdown("article-throttle")["dataforseo"]) == [ENDPOINT]
+    statuses = {
+        line.split('status="')[1].split('"')[0]
+        for line in metrics.render_prometheus().splitlines()
+        if line.startswith("blog_upstream_requests_total{") and f'endpoint="{ENDPOINT}"' in line
+    }
+    assert statuses == {"200", "error"}
+
+
+def test_slowly_streaming_response_is_cut_off_at_the_deadline(monkeypatch):
+    from app.dataforseo_transport import send_projected
+    from app.serp_parser import SERP_RESPONSE_PROJECTION
+
+    monkeypatch.setattr(settings, "dataforseo_max_retries", 0)
+
+    class SlowStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            # チャンクごとの間隔は読み取りタイムアウトより短いが、全体では期限を超える
+            for _ in range(20):
+                await asyncio.sleep(0.1)
+                yield b" "
+
+    async def handler(request):
+        return httpx.Response(200, stream=SlowStream())
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            started = asyncio.get_running_loop().time()
+            with pytest.raises(httpx.TimeoutException):
+                await send_with_retry(
+                    lambda remaining: send_projected(
+                        client, "GET", "https://api.dataforseo.com/v3/test", SERP_RESPONSE_PROJECTION, timeout=remaining
+                    ),
+                    "login-slow", 0.5, "DataForSEO test", "/v3/test"
+                )
+            return asyncio.get_running_loop().time() - started
+
+    assert asyncio.run(run()) < 1.0
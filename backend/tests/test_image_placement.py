@@ -0,0 +1,30 @@
+"""
+app.image_placement のテスト
+"""
+from app.image_placement import plan_image_placement
+
+ARTICLE = """=== 記事 ===
+眼鏡の選び方
+
+### 眼鏡のレンズの拭き方
+眼鏡のレンズは中性洗剤で洗い、柔らかいクロスで拭き取ります。
+
+### フレームの選び方
+顔の形に合わせてフレームを選びます。
+"""
+
+
+def test_described_image_outranks_keyword_fallback_image():
+    images = [
+        {"url": "https://example.com/no-alt.jpg", "alt_text": ""},
+        {"url": "https://example.com/lens.jpg", "alt_text": "眼鏡のレンズをクロスで拭き取る様子"},
+    ]
+
+    plan = plan_image_placement(ARTICLE, images, keyword="眼鏡")
+    headings = {image["url"]: section["heading"] for image, section, _ in plan}
+    scores = {image["url"]: score for image, _, score in plan}
+
+    # 説明のある画像が、見出しと一致するセクションを取る
+    assert headings["https://example.com/lens.jpg"] == "眼鏡のレンズの拭き方"
+    assert headings["https://example.com/no-alt.jpg"] == "フレームの選び方"
+    assert scores["https://example.com/lens.jpg"] > scores["https://example.com/no-alt.jpg"]
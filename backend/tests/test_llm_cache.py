@@ -0,0 +1,49 @@
+"""
+app.llm_cache のテスト
+"""
+import pytest
+
+from app import llm_cache
+from app.config import settings
+from app.llm_cache import cached_llm_text
+
+
+@pytest.fixture(autouse=True)
+def _settings(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "llm_cache_path", str(tmp_path / "llm_cache.sqlite3"))
+    monkeypatch.setattr(llm_cache, "_cache", None)
+
+
+def _counter():
+    calls = []
+
+    def call():
+        calls.append(None)
+        return f"出力{len(calls)}"
+
+    return call, calls
+
+
+def test_sampled_calls_are_regenerated_unless_resuming():
+    call, calls = _counter()
+    config = {"temperature": 0.8}
+
+    first = cached_llm_text("gemini", "gemini-2.0-flash", "content", "本文", config, call)
+    # 通常の再生成では同じ入力でも生成し直す
+    second = cached_llm_text("gemini", "gemini-2.0-flash", "content", "本文", config, call)
+    # 再開時は直近の出力を再利用する
+    resumed = cached_llm_text("gemini", "gemini-2.0-flash", "content", "本文", config, call, reuse_sampled=True)
+
+    assert (first, second, resumed) == ("出力1", "出力2", "出力2")
+    assert len(calls) == 2
+
+
+def test_deterministic_calls_are_always_reused():
+    call, calls = _counter()
+    config = {"temperature": 0}
+
+    cached_llm_text("openai", "gpt-4o", "title", "タイトル", config, call)
+    text = cached_llm_text("openai", "gpt-4o", "title", "タイトル", config, call)
+
+    assert text == "出力1"
+    assert len(calls) == 1
@@ -0,0 +1,108 @@
+"""
+app.llm_router のテスト（SDKの通信部分だけを差し替える）
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import google.ai.generativelanguage as glm
+import pytest
+
+from app import llm_cache
+from app.config import settings
+from app.llm_cache import cached_routed_llm_text, make_llm_cache_key
+from app.llm_clients import GeminiModel
+from app.llm_router import LLMRouter, LLMRouterError
+
+
+class FakeGeminiService:
+    """GenerativeServiceClientの代わり（受け取ったタイムアウトを記録し、その秒数で打ち切る）"""
+
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.timeouts = []
+        self.finished = threading.Event()
+
+    def generate_content(self, request, timeout=None, **kwargs):
+        self.timeouts.append(timeout)
+        try:
+            if self.delay > (timeout or float("inf")):
+                time.sleep(timeout)
+                raise TimeoutError("deadline exceeded")
+            time.sleep(self.delay)
+            if self.error:
+                raise self.error
+            return glm.GenerateContentResponse(candidates=[
+                glm.Candidate(content=glm.Content(parts=[glm.Part(text="geminiの出力")]))
+            ])
+        finally:
+            self.finished.set()
+
+
+def _gemini(service):
+    return GeminiModel(service, "gemini-2.0-flash")
+
+
+def _openai(text="openaiの出力"):
+    def create(**kwargs):
+        return SimpleNamespace(
+            usage=None,
+            choices=[SimpleNamespace(message=SimpleNamespace(content=text))]
+        )
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+@pytest.fixture(autouse=True)
+def _settings(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "llm_streaming_enabled", False)
+    monkeypatch.setattr(settings, "llm_cache_path", str(tmp_path / "llm_cache.sqlite3"))
+    monkeypatch.setattr(llm_cache, "_cache", None)
+
+
+def test_failover_output_is_cached_under_the_provider_that_wrote_it():
+    router = LLMRouter(_openai(), _gemini(FakeGeminiService(error=RuntimeError("429 Resource exhausted"))))
+    call = lambda: router.route("content", "本文を書いてください", primary="gemini")
+
+    text = cached_routed_llm_text("gemini", "gemini-2.0-flash", "content", "本文を書いてください", None, call)
+
+    assert text == "openaiの出力"
+    cache = llm_cache.get_llm_cache()
+    assert cache.get(make_llm_cache_key("gemini", "gemini-2.0-flash", "本文を書いてください", None)) is None
+    assert cache.get(make_llm_cache_key("openai", "gpt-4o", "本文を書いてください", None)) == "openaiの出力"
+
+
+def test_stalled_attempt_is_cut_off_at_the_deadline():
+    service = FakeGeminiService(delay=30.0)
+    router = LLMRouter(None, _gemini(service))
+    started = time.monotonic()
+
+    with pytest.raises(LLMRouterError):
+        router.generate("content", "本文を書いてください", primary="gemini", deadline=0.5)
+
+    # 呼び出しているスレッドもSDKのタイムアウトで解放される
+    assert service.finished.wait(2.0)
+    assert time.monotonic() - started < 2.0
+    assert 0 < service.timeouts[0] <= 0.5
+
+
+def test_streamed_gemini_call_passes_the_timeout_as_a_request_option(monkeypatch):
+    monkeypatch.setattr(settings, "llm_streaming_enabled", True)
+    timeouts = []
+
+    class StreamingService:
+        def stream_generate_content(self, request, timeout=None, **kwargs):
+            timeouts.append(timeout)
+            for text in ("眼鏡の", "選び方"):
+                yield glm.GenerateContentResponse(candidates=[
+                    glm.Candidate(content=glm.Content(parts=[glm.Part(text=text)]))
+                ])
+
+    router = LLMRouter(None, _gemini(StreamingService()))
+    drafts = []
+
+    text = router.generate("title", "タイトルを考えてください", primary="gemini", deadline=5.0, on_text=drafts.append)
+
+    assert text == "眼鏡の選び方"
+    assert drafts == ["眼鏡の", "眼鏡の選び方"]
+    assert 0 < timeouts[0] <= 5.0
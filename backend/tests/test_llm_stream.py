@@ -0,0 +1,57 @@
+"""
+app.llm_stream のテスト
+"""
+import threading
+import time
+
+from app.llm_stream import DraftWriter
+
+
+def test_slow_draft_write_does_not_block_streaming_updates():
+    started = threading.Event()
+    release = threading.Event()
+    writes = []
+
+    def write(updates):
+        writes.append(updates)
+        started.set()
+        release.wait(2.0)
+
+    draft = DraftWriter(write, interval=0.0)
+    writer = threading.Thread(target=draft.update, kwargs={"content": "眼鏡の"})
+    writer.start()
+    assert started.wait(1.0)
+
+    # 書き込み中でもコールバックはすぐに戻り、内容は次の書き込みにまとめられる
+    begin = time.monotonic()
+    draft.update(content="眼鏡の選び方")
+    assert time.monotonic() - begin < 0.1
+
+    release.set()
+    writer.join()
+    draft.flush()
+    assert [w["content"] for w in writes] == ["眼鏡の", "眼鏡の選び方"]
+    assert draft.written_fields() == {"content"}
+
+
+def test_close_waits_for_the_write_in_progress():
+    started = threading.Event()
+    finished = []
+
+    def write(updates):
+        started.set()
+        time.sleep(0.2)
+        finished.append(updates)
+
+    draft = DraftWriter(write, interval=0.0)
+    writer = threading.Thread(target=draft.update, kwargs={"title": "途中のタイトル"})
+    writer.start()
+    assert started.wait(1.0)
+
+    draft.close()
+
+    # closeが戻った後に途中内容が保存されることはない（最終結果を上書きしない）
+    assert finished == [{"title": "途中のタイトル"}]
+    draft.update(title="遅れて届いたタイトル")
+    writer.join()
+    assert len(finished) == 1
@@ -0,0 +1,84 @@
+"""
+app.metrics のテスト
+"""
+import time
+
+import google.ai.generativelanguage as glm
+from google.generativeai.types.generation_types import GenerateContentResponse
+
+from app import metrics
+from app.metrics import metrics_context, pop_article_breakdown, record_llm_call
+
+
+def _gemini_response(text: str) -> GenerateContentResponse:
+    """google-generativeai 0.3.1 と同じ形のレスポンス（usage_metadataを持たない）"""
+    return GenerateContentResponse.from_response(glm.GenerateContentResponse(
+        candidates=[glm.Candidate(content=glm.Content(parts=[glm.Part(text=text)]))]
+    ))
+
+
+def test_gemini_tokens_are_estimated_without_usage_metadata():
+    response = _gemini_response("眼鏡のレンズは中性洗剤で洗い、柔らかい布で拭き取ります。")
+    assert not hasattr(response, "usage_metadata")
+
+    with metrics_context(user_id="user-1", article_id="article-gemini"):
+        record_llm_call(
+            "gemini", "gemini-2.0-flash", "content", time.perf_counter(), response,
+            prompt="眼鏡のお手入れ方法を説明してください。"
+        )
+
+    item = pop_article_breakdown("article-gemini")["llm"]["gemini-2.0-flash:content"]
+    assert item["prompt_tokens"] > 0
+    assert item["completion_tokens"] > 0
+    assert item["estimated_tokens"] is True
+    assert 'source="estimate"' in metrics.render_prometheus()
+
+
+def test_openai_usage_is_used_when_present():
+    class Usage:
+        prompt_tokens = 12
+        completion_tokens = 34
+
+    class Response:
+        usage = Usage()
+
+    with metrics_context(user_id="user-1", article_id="article-openai"):
+        record_llm_call("openai", "gpt-4o", "title", time.perf_counter(), Response(), prompt="タイトル")
+
+    item = pop_article_breakdown("article-openai")["llm"]["gpt-4o:title"]
+    assert (item["prompt_tokens"], item["completion_tokens"]) == (12, 34)
+    assert "estimated_tokens" not in item
+
+
+def test_streamed_openai_call_records_estimated_tokens():
+    from types import SimpleNamespace
+
+    from app.llm_stream import stream_openai_chat
+
+    def chunk(text):
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **kwargs: iter([chunk("眼鏡の"), chunk("選び方"), SimpleNamespace(choices=[], usage=None)])
+    )))
+    messages = [{"role": "user", "content": "眼鏡のタイトルを考えてください。"}]
+
+    with metrics_context(user_id="user-1", article_id="article-stream"):
+        assert stream_openai_chat(client, "gpt-4o", messages, "title") == "眼鏡の選び方"
+
+    item = pop_article_breakdown("article-stream")["llm"]["gpt-4o:title"]
+    assert item["prompt_tokens"] > 0
+    assert item["completion_tokens"] > 0
+    assert item["estimated_tokens"] is True
+
+
+def test_large_counters_are_exported_without_rounding():
+    metrics.record_dataforseo_call("/v3/test/large-counter", 0.5, response_bytes=1234567)
+    metrics.record_dataforseo_call("/v3/test/large-counter", 0.5, response_bytes=1)
+
+    lines = metrics.render_prometheus().splitlines()
+    line = next(
+        line for line in lines
+        if line.startswith("blog_upstream_response_bytes_total") and "/v3/test/large-counter" in line
+    )
+    assert float(line.rsplit(" ", 1)[1]) == 1234568
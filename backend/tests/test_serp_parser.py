@@ -0,0 +1,60 @@
+"""
+app.serp_parser / app.dataforseo_transport.send_projected のテスト
+"""
+import asyncio
+import json
+
+import httpx
+
+from app.dataforseo_transport import HEAD_BYTES, projected_json, response_head, response_size, send_projected
+from app.serp_parser import SERP_RESPONSE_PROJECTION, StreamingProjector, parse_projected
+
+
+def _serp_body(items: int = 200) -> bytes:
+    return json.dumps({
+        "version": "0.1",
+        "status_code": 20000,
+        "cost": 0.002,
+        "tasks": [{
+            "status_code": 20000,
+            "result": [{
+                "keyword": "眼鏡 選び方",
+                "items": [
+                    {"type": "organic", "title": f"記事{i}", "url": f"https://example.com/{i}", "rectangle": {"x": i, "y": i}}
+                    for i in range(items)
+                ],
+            }],
+        }],
+    }, ensure_ascii=False).encode("utf-8")
+
+
+def test_streaming_projector_matches_buffered_parse():
+    body = _serp_body()
+    projector = StreamingProjector()
+    for offset in range(0, len(body), 97):
+        projector.feed(body[offset:offset + 97])
+
+    result = projector.close()
+    assert result == parse_projected(body)
+    assert "rectangle" not in result["tasks"][0]["result"][0]["items"][0]
+
+
+def test_send_projected_parses_while_receiving():
+    body = _serp_body()
+
+    async def chunks():
+        for offset in range(0, len(body), 1024):
+            yield body[offset:offset + 1024]
+
+    def handler(request):
+        return httpx.Response(200, content=chunks())
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await send_projected(client, "POST", "https://api.dataforseo.com/v3/serp", SERP_RESPONSE_PROJECTION, json=[])
+
+    response = asyncio.run(run())
+
+    assert projected_json(response, SERP_RESPONSE_PROJECTION) == parse_projected(body)
+    assert response_head(response) == body[:HEAD_BYTES]
+    assert response_size(response) == len(body)
@@ -0,0 +1,35 @@
+"""
+app.singleflight のテスト
+"""
+import asyncio
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+
+def test_follower_reruns_the_call_when_the_leader_is_cancelled():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(None)
+        await asyncio.sleep(0.1)
+        return {"tasks": len(calls)}
+
+    async def run():
+        leader = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0.01)
+        # クライアントの切断などで実行していた側だけがキャンセルされる
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    result = asyncio.run(run())
+
+    assert result == {"tasks": 2}
+    assert len(calls) == 2
+    assert flight.in_flight() == 0
@@ -0,0 +1,156 @@
+"""
+app.stage_graph のテスト
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.stage_graph import Stage, StageError, StageGraph
+
+
+class SlowCheckpoints:
+    """保存に時間がかかるチェックポイント（Supabaseへの書き込みの代わり）"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.saved = {}
+        self._lock = threading.Lock()
+
+    def get(self, stage):
+        return None
+
+    def save(self, stage, output, status, inputs_hash):
+        time.sleep(self.delay)
+        with self._lock:
+            self.saved[stage] = output
+
+
+class MemoryCheckpoints:
+    """実行をまたいで保存内容を保持するチェックポイント"""
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, stage):
+        return self.entries.get(stage)
+
+    def save(self, stage, output, status, inputs_hash):
+        self.entries[stage] = {"output": output, "status": status, "inputs_hash": inputs_hash}
+
+
+def test_checkpoint_saves_do_not_delay_downstream_stages():
+    checkpoints = SlowCheckpoints(delay=0.3)
+
+    async def first(results):
+        return {"title": "眼鏡の選び方"}
+
+    async def second(results):
+        # 後続のステージが前段の出力を書き換えても保存内容は変わらない
+        results["first"]["title"] = "書き換え"
+        return "本文"
+
+    graph = StageGraph([
+        Stage("first", first),
+        Stage("second", second, deps=["first"]),
+    ], checkpoints=checkpoints)
+
+    results = asyncio.run(graph.run())
+
+    assert results["second"] == "本文"
+    # secondはfirstの保存（0.3秒）を待たずに開始している
+    assert graph.timings["second"]["start"] < 0.2
+    # runが返る時点で保存は完了している
+    assert checkpoints.saved == {"first": {"title": "眼鏡の選び方"}, "second": "本文"}
+
+
+def test_checkpoints_are_saved_before_a_failed_graph_raises():
+    checkpoints = SlowCheckpoints(delay=0.2)
+
+    async def first(results):
+        return "SERP"
+
+    async def second(results):
+        raise RuntimeError("本文生成に失敗")
+
+    graph = StageGraph([
+        Stage("first", first),
+        Stage("second", second, deps=["first"]),
+    ], checkpoints=checkpoints)
+
+    with pytest.raises(StageError):
+        asyncio.run(graph.run())
+
+    assert checkpoints.saved == {"first": "SERP"}
+
+
+def test_stages_after_a_fallen_back_optional_stage_are_restored_on_resume():
+    checkpoints = MemoryCheckpoints()
+    calls = []
+    fail_content = [True]
+
+    async def keyword_research(results):
+        calls.append("keyword_research")
+        raise RuntimeError("DataForSEOが未設定")
+
+    async def title(results):
+        calls.append("title")
+        return f"タイトル（{len(results['keyword_research'])}件）"
+
+    async def content(results):
+        calls.append("content")
+        if fail_content[0]:
+            raise RuntimeError("本文生成に失敗")
+        return "本文"
+
+    def build():
+        return StageGraph([
+            Stage("keyword_research", keyword_research, required=False, default=list),
+            Stage("title", title, deps=["keyword_research"]),
+            Stage("content", content, deps=["title"]),
+        ], checkpoints=checkpoints)
+
+    with pytest.raises(StageError):
+        asyncio.run(build().run())
+    assert checkpoints.entries["keyword_research"]["status"] == "error"
+
+    calls.clear()
+    fail_content[0] = False
+    graph = build()
+    results = asyncio.run(graph.run())
+
+    # 既定値で続行したステージもタイトルも再実行せず、失敗した本文だけを実行する
+    assert calls == ["content"]
+    assert graph.restored == {"keyword_research", "title"}
+    assert graph.timings["keyword_research"]["saved_status"] == "error"
+    assert results["title"] == "タイトル（0件）"
+    assert results["content"] == "本文"
+
+
+def test_stage_is_rerun_when_its_inputs_changed():
+    checkpoints = MemoryCheckpoints()
+    serp = ["旧"]
+    calls = []
+
+    async def serp_analysis(results):
+        return list(serp)
+
+    async def title(results):
+        calls.append("title")
+        return "タイトル: " + results["serp_analysis"][0]
+
+    def build():
+        return StageGraph([
+            Stage("serp_analysis", serp_analysis),
+            Stage("title", title, deps=["serp_analysis"]),
+        ], checkpoints=checkpoints)
+
+    asyncio.run(build().run())
+    # 前段の保存を消して再実行させ、出力が変わった場合
+    del checkpoints.entries["serp_analysis"]
+    serp[0] = "新"
+    results = asyncio.run(build().run())
+
+    assert calls == ["title", "title"]
+    assert results["title"] == "タイトル: 新"
@@ -0,0 +1,66 @@
+"""
+ArticleGenerator._generate_content_sectioned のテスト（LLMは呼ばない）
+"""
+import asyncio
+
+from app.llm_router import LLMRouterError
+from app.workflow import ArticleGenerator
+
+OUTLINE = [
+    {"heading": "導入", "points": [], "target_chars": 500},
+    {"heading": "選び方", "points": [], "target_chars": 500},
+    {"heading": "まとめ", "points": [], "target_chars": 500},
+]
+
+
+def _generator(outline=None, outline_error=None, failures=None):
+    """アウトラインとセクション生成を差し替えたArticleGenerator（__init__のAPIキー取得を行わない）"""
+    generator = ArticleGenerator.__new__(ArticleGenerator)
+    generator.on_draft = None
+    generator.section_calls = []
+    failures = dict(failures or {})
+
+    def generate_outline(*args):
+        if outline_error:
+            raise outline_error
+        return [dict(section) for section in outline or OUTLINE]
+
+    def generate_section(article_data, title, outline, index, knowledge_context, on_text=None):
+        generator.section_calls.append(index)
+        if failures.get(index, 0) > 0:
+            failures[index] -= 1
+            raise LLMRouterError(f"content_section: セクション{index}の生成に失敗しました")
+        return f"{outline[index]['heading']}の本文"
+
+    generator._generate_outline = generate_outline
+    generator._generate_section = generate_section
+    return generator
+
+
+def _run(generator):
+    return asyncio.run(generator._generate_content_sectioned(
+        {"keyword": "眼鏡"}, "眼鏡の選び方", "", {"optimal_length": "1500文字"}, None, None, [], []
+    ))
+
+
+def test_failed_section_is_retried_without_rewriting_completed_sections():
+    generator = _generator(failures={1: 1})
+
+    content = _run(generator)
+
+    assert "### 選び方\n選び方の本文" in content
+    assert "### 導入\n導入の本文" in content
+    assert sorted(generator.section_calls) == [0, 1, 1, 2]
+
+
+def test_section_that_keeps_failing_falls_back_to_single_call():
+    generator = _generator(failures={2: 10})
+
+    assert _run(generator) is None
+
+
+def test_outline_router_error_falls_back_to_single_call():
+    generator = _generator(outline_error=LLMRouterError("outline: 90秒以内に応答がありませんでした"))
+
+    assert _run(generator) is None
+    assert generator.section_calls == []
@@ -427,6 +427,9 @@ export default function ArticleDetail() {
         )}
 
         <div className="prose max-w-none">
+          {article.status === 'processing' && article.content && (
+            <p className="text-sm text-indigo-600 mb-2">生成中の下書きを表示しています...</p>
+          )}
           {article.content ? (
             <div
               className="whitespace-pre-wrap"